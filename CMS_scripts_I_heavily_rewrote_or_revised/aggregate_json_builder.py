@@ -92,7 +92,10 @@ def build_json(vs_token_data, item_id, env="PROD"):
   else:
     target_system = env
 
-  subtype = eng_vs_token.get_group_metadata_value(vs_token_data,item_id,'file_information_subtype')
+  # every field this report reads comes out of one metadata GET
+  snapshot = eng_vs_token.ItemMetadata(vs_token_data,item_id)
+
+  subtype = eng_vs_token.get_group_metadata_value(vs_token_data,item_id,'file_information_subtype',snapshot=snapshot)
 
   if 'mezz' in subtype.lower():
     subtype = 'mezz'
@@ -106,8 +109,8 @@ def build_json(vs_token_data, item_id, env="PROD"):
 
   logger.warning(f'Subtype: {subtype}')
 
-  aggregate_result = eng_vs_token.get_group_metadata_value(vs_token_data,item_id,'aggregate_test_result')
-  file_name = eng_vs_token.get_system_metadata_value(vs_token_data,item_id,'originalFilename')
+  aggregate_result = eng_vs_token.get_group_metadata_value(vs_token_data,item_id,'aggregate_test_result',snapshot=snapshot)
+  file_name = eng_vs_token.get_system_metadata_value(vs_token_data,item_id,'originalFilename',snapshot=snapshot)
 
   report['qc_report']['title'] = title
   report['qc_report']['aggregate_result'] = aggregate_result.upper()
@@ -127,9 +130,9 @@ def build_json(vs_token_data, item_id, env="PROD"):
     for y in x.findall('sub_section'):
       t = {'test':[],'_name':y.attrib['name']}
       for z in y.findall('test'):
-        result = eng_vs_token.get_group_metadata_value(vs_token_data,item_id,z.find('result_source').text)
+        result = eng_vs_token.get_group_metadata_value(vs_token_data,item_id,z.find('result_source').text,snapshot=snapshot)
         if result:
-          description = eng_vs_token.get_group_metadata_value(vs_token_data,item_id,z.find('description_source').text)
+          description = eng_vs_token.get_group_metadata_value(vs_token_data,item_id,z.find('description_source').text,snapshot=snapshot)
           r = {'_name':z.attrib['name'],'result':result.upper(),'description':description}
           t['test'].append(r)
       s['sub_section'].append(t)
@@ -155,22 +155,27 @@ elif 'deriv' in subtype.lower():
 
 logger.warning(f'Calculating APAR for {item_id}, Video Format {video_format}, Subtype {subtype.capitalize()}')
 
-height = int(eng_vs_token.get_system_metadata_value(token_data,item_id,'originalHeight'))
-width = int(eng_vs_token.get_system_metadata_value(token_data,item_id,'originalWidth'))
-pixel_aspect_ratio = float(eng_vs_token.get_group_metadata_value(token_data,item_id,f'{subtype}_qc_orig_apar_pixel_aspect_ratio'))
+# everything else in one round trip
+pixel_aspect_ratio_field = f'{subtype}_qc_orig_apar_pixel_aspect_ratio'
+crop_fields = {side: f'{subtype}_qc_orig_letterbox_analysis_crop_{side}' for side in ['top','bottom','left','right']}
+values = eng_vs_token.get_metadata_values(token_data,item_id,['originalHeight','originalWidth',pixel_aspect_ratio_field] + list(crop_fields.values()))
+
+height = int(values['originalHeight'])
+width = int(values['originalWidth'])
+pixel_aspect_ratio = float(values[pixel_aspect_ratio_field])
 
 logger.warning(f'Height {height}, Width {width}, PAR {pixel_aspect_ratio}')
 
-crop_top = eng_vs_token.get_group_metadata_value(token_data,item_id,f'{subtype}_qc_orig_letterbox_analysis_crop_top')
+crop_top = values[crop_fields['top']]
 crop_top = int(crop_top) if crop_top else 0
 
-crop_bottom = eng_vs_token.get_group_metadata_value(token_data,item_id,f'{subtype}_qc_orig_letterbox_analysis_crop_bottom')
+crop_bottom = values[crop_fields['bottom']]
 crop_bottom = int(crop_bottom) if crop_bottom else 0
 
-crop_left = eng_vs_token.get_group_metadata_value(token_data,item_id,f'{subtype}_qc_orig_letterbox_analysis_crop_left')
+crop_left = values[crop_fields['left']]
 crop_left = int(crop_left) if crop_left else 0
 
-crop_right = eng_vs_token.get_group_metadata_value(token_data,item_id,f'{subtype}_qc_orig_letterbox_analysis_crop_right')
+crop_right = values[crop_fields['right']]
 crop_right = int(crop_right) if crop_right else 0
 
 logger.warning(f'Crop Top {crop_top}, Crop Bottom {crop_bottom}, Crop Left {crop_left}, Crop Right {crop_right}')
@@ -203,12 +208,10 @@ profile_number_update = {'group':f'{subtype}_qc_orig_apar','field':f'{subtype}_q
 description_update = {'group':f'{subtype}_qc_orig_apar','field':f'{subtype}_qc_orig_apar_profile_description','value':profile_description}
 apar_update = {'group':f'{subtype}_qc_orig_apar','field':f'{subtype}_qc_orig_apar','value':str(round(apar,2))}
 
-a_metadata = eng_vs_token.make_group_metadata_doc(profile_number_update['group'],profile_number_update['field'],profile_number_update['value'])
-b_metadata = eng_vs_token.make_group_metadata_doc(description_update['group'],description_update['field'],description_update['value'])
-c_metadata = eng_vs_token.make_group_metadata_doc(apar_update['group'],apar_update['field'],apar_update['value'])
-a = eng_vs_token.put_item_metadata(token_data,item_id,a_metadata)
-b = eng_vs_token.put_item_metadata(token_data,item_id,b_metadata)
-c = eng_vs_token.put_item_metadata(token_data,item_id,c_metadata)
+batch = eng_vs_token.MetadataBatch(token_data,item_id)
+for update in [profile_number_update, description_update, apar_update]:
+    batch.add(update['group'],update['field'],update['value'])
+results = batch.flush()
 
-logger.warning(f'Status for Profile Num Update {a}, Description Update {b}, APAR Update {c}')
+logger.warning(f"Status for Profile Num Update {results[profile_number_update['field']]}, Description Update {results[description_update['field']]}, APAR Update {results[apar_update['field']]}")
 exit(0)
\ No newline at end of file
@@ -1,13 +1,135 @@
 import os
 import sys
+import time
+import uuid
+import atexit
 import logging
 import platform
+import threading
 import json
+from contextlib import contextmanager
 from pythonjsonlogger import jsonlogger
 from logging.handlers import RotatingFileHandler
 
 # logging module for eng scripts on box
 
+# TRACING
+# every script imports this module first, so importing it starts a trace of the whole run.
+# spans nest per thread and carry start/end times and attributes. eng_vs_token adds a span for
+# every VS request it sends plus tokens, xml/json parsing and metadata writes, anything else
+# (vault, Vantage, Ateme, BTC, BBQ...) gets a span where the script makes the call.
+# set_up_logging hooks up the exit handler that writes the whole tree as one json event to the
+# _dd.log handler
+#   with cms_integration_logging.span('vantage submit', workflow=workflow_name):
+#       ...
+
+# spans kept per run, anything past this is counted but not recorded
+trace_max_spans = 5000
+
+class Span:
+
+	def __init__(self, tracer, name, parent, attributes):
+		self.tracer = tracer
+		self.name = name
+		self.parent = parent
+		self.attributes = dict(attributes)
+		self.children = []
+		self.thread = threading.current_thread().name
+		self.start = time.time()
+		self.end_time = None
+
+	def set(self, **attributes):
+		self.attributes.update(attributes)
+
+	def end(self, **attributes):
+		self.attributes.update(attributes)
+		if self.end_time is None:
+			self.end_time = time.time()
+
+	def to_dict(self, trace_start) -> dict:
+		end_time = self.end_time if self.end_time is not None else time.time()
+		span = {
+			'name': self.name,
+			'start_ms': round((self.start - trace_start) * 1000, 1),
+			'duration_ms': round((end_time - self.start) * 1000, 1),
+			'thread': self.thread
+		}
+		if self.end_time is None:
+			span['unfinished'] = True
+		if self.attributes:
+			span['attributes'] = self.attributes
+		if self.children:
+			span['children'] = [child.to_dict(trace_start) for child in self.children]
+		return span
+
+class Tracer:
+
+	def __init__(self, name):
+		self.trace_id = uuid.uuid4().hex
+		self.attributes = {'pid': os.getpid(), 'host': platform.node().split('.')[0]}
+		self._lock = threading.Lock()
+		self._local = threading.local()
+		self.span_count = 0
+		self.dropped = 0
+		self.root = Span(self, name, None, {})
+
+	def current(self) -> Span:
+		stack = getattr(self._local, 'stack', None)
+		return stack[-1] if stack else self.root
+
+	def start_span(self, name, **attributes) -> Span:
+		# opens a span under whatever span is open on this thread, the caller has to end() it
+		parent = self.current()
+		span = Span(self, name, parent, attributes)
+		with self._lock:
+			if self.span_count < trace_max_spans:
+				self.span_count += 1
+				parent.children.append(span)
+			else:
+				self.dropped += 1
+		return span
+
+	@contextmanager
+	def span(self, name, **attributes):
+		span = self.start_span(name, **attributes)
+		stack = getattr(self._local, 'stack', None)
+		if stack is None:
+			stack = self._local.stack = []
+		stack.append(span)
+		try:
+			yield span
+		except BaseException as e:
+			if not isinstance(e, SystemExit):
+				span.set(error=f'{e.__class__.__name__}: {e}')
+			raise
+		finally:
+			stack.pop()
+			span.end()
+
+	def to_dict(self) -> dict:
+		self.root.end()
+		trace = {'trace_id': self.trace_id, 'spans': self.span_count, 'dropped_spans': self.dropped}
+		trace.update(self.attributes)
+		trace['root'] = self.root.to_dict(self.root.start)
+		return trace
+
+tracer = Tracer(os.path.basename(sys.argv[0]) or 'python')
+# everything between importing this module and set_up_logging is the script reading its args
+_startup_span = tracer.start_span('arg parsing')
+
+def span(name, **attributes):
+	return tracer.span(name, **attributes)
+
+_dd_handler = None
+
+def emit_trace():
+	# writes the run's trace tree as one json event to the _dd.log handler
+	if _dd_handler is None:
+		return
+	_startup_span.end()
+	record = logging.getLogger().makeRecord('trace', logging.INFO, __file__, 0, 'script_trace', (), None, extra={'trace': tracer.to_dict()})
+	_dd_handler.handle(record)
+
 def get_script_name(script_path):
 	# get the script file name from the path
 	if 'linux' in sys.platform or 'darwin' in sys.platform:
@@ -62,4 +184,11 @@ def set_up_logging(script_path,env,script_version,log_level):
 	lfdd.setFormatter(formatter)
 	logger.addHandler(lf)
 	logger.addHandler(lfdd)
+	# tracing - the trace goes to the dd log at exit, tagged like the rest of the run
+	global _dd_handler
+	if _dd_handler is None:
+		atexit.register(emit_trace)
+	_dd_handler = lfdd
+	_startup_span.end()
+	tracer.root.set(script=script_file_name, cms_environment=env, script_version=script_version)
 	return logger
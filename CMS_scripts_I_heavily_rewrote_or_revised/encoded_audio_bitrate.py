@@ -138,32 +138,6 @@ def deriv_valid_bitrate(codec,bitrate,channel_count,first_track=False):
         elif codec == 'aac' and bitrate >= 254700 and bitrate <= 257300:
             return True
 
-def make_group_metadata_doc(vs_group,vs_field,vs_value):
-	metadata = {
-		"timespan": [
-			{
-				"start": "-INF",
-				"end": "+INF",
-				"group": [
-					{
-						"name": vs_group,
-						"field": [
-							{
-								"name": vs_field,
-								"value": [
-									{
-										"value": vs_value
-									}
-								]
-							}
-						]
-					}
-				]
-			}
-		]
-	}
-	return metadata
-
 def main():
     # get_vault_secret_data function returns a dict
     secret_path = f'v1/secret/{env}/vidispine/vantage'
@@ -231,17 +205,10 @@ def main():
     # it puts the results in the metadata or else it gets the hose again
     vs_group = f'{subtype}_qc_orig_category_results'
     vs_field = f'{subtype}_qc_orig_category_results_audio_bitrate'
-    logger.warning(f'Metadata update: group {vs_group}, field {vs_field}, value {result}')
-    metadata = make_group_metadata_doc(vs_group,vs_field,result)
-    u = eng_vs_token.put_item_metadata(token_data,item_id,metadata)
-    logger.warning(f'Update status code: {u}')
-
-    vs_field += '_description'
-    vs_value = ' '.join(result_list)
-    logger.warning(f'Metadata update: group {vs_group}, field {vs_field}, value {vs_value}')
-    metadata = make_group_metadata_doc(vs_group,vs_field,vs_value)
-    u = eng_vs_token.put_item_metadata(token_data,item_id,metadata)
-    logger.warning(f'Update status code: {u}')
+    batch = eng_vs_token.MetadataBatch(token_data,item_id)
+    batch.add(vs_group,vs_field,result)
+    batch.add(vs_group,f'{vs_field}_description',' '.join(result_list))
+    batch.flush()
 
 try:
 	main()
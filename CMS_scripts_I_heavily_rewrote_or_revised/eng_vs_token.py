@@ -1,10 +1,48 @@
 import requests
+import sys
+from requests.adapters import HTTPAdapter
+from requests.exceptions import HTTPError
 import xml.etree.ElementTree as ET
 from base64 import b64encode
+from io import BytesIO
+from urllib.parse import urlsplit
+import ssl
+import hashlib
+import copy
+import random
+import re
+import os
+import tempfile
+from contextlib import contextmanager, nullcontext
+import atexit
+import threading
+import queue
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
 import time
 import json
+import logging
 from datetime import datetime
 
+# file locking is fcntl on linux/mac and msvcrt on the windows boxes
+try:
+	import fcntl
+except ImportError:
+	fcntl = None
+	import msvcrt
+
+# lxml is optional. if it's installed set_xml_backend('lxml') switches the parser over
+try:
+	from lxml import etree as lxml_etree
+except ImportError:
+	lxml_etree = None
+
+# orjson is optional too, it decodes the big json documents a lot quicker than json does
+try:
+	import orjson
+except ImportError:
+	orjson = None
+
 # This package replaces the original eng_vs.py
 # changes include importing logger from main
 # also all functions use 
@@ -16,6 +54,1041 @@ from __main__ import crt_file
 # make sure that logger is created in main before importing this module
 from __main__ import logger
 
+# SESSION FUNCTIONS
+# every call in here goes through vs_request so that we keep one pooled keep-alive
+# session per base url instead of a new TCP+TLS handshake for every single call
+# only VS (anything called on an /API/ path) is verified against crt_file, every other host (solr)
+# keeps requests' default ca bundle like it had before
+
+# max connections kept alive per host. change with set_pool_size() before the first call
+pool_size = 10
+
+_sessions = {}
+_session_lock = threading.Lock()
+_ssl_context = None
+# separate from _session_lock, get_session holds that one while the adapter asks for the context
+_ssl_lock = threading.Lock()
+
+def get_ssl_context():
+	# load crt_file into one verified ssl context and hand the same one to every pool
+	global _ssl_context
+	with _ssl_lock:
+		if _ssl_context is None:
+			_ssl_context = ssl.create_default_context(cafile=crt_file)
+	return _ssl_context
+
+class VSAdapter(HTTPAdapter):
+	# HTTPAdapter that uses the shared ssl context for every https connection
+
+	def init_poolmanager(self, *args, **kwargs):
+		kwargs['ssl_context'] = get_ssl_context()
+		return super().init_poolmanager(*args, **kwargs)
+
+	def cert_verify(self, conn, url, verify, cert):
+		# the shared context already trusts crt_file, so don't let urllib3 reload a ca bundle per connection
+		if url.lower().startswith('https') and verify:
+			conn.cert_reqs = 'CERT_REQUIRED'
+			conn.ca_certs = None
+			conn.ca_cert_dir = None
+		else:
+			super().cert_verify(conn, url, verify, cert)
+
+def _base_url(url):
+	parts = urlsplit(url)
+	return f'{parts.scheme}://{parts.netloc}/'
+
+def is_vs_url(url) -> bool:
+	return '/API/' in urlsplit(url).path
+
+def get_session(url) -> requests.Session:
+	# returns the pooled session for the base url of url, creating it on first use
+	base_url = _base_url(url)
+	session = _sessions.get(base_url)
+	if session is None:
+		with _session_lock:
+			session = _sessions.get(base_url)
+			if session is None:
+				session = requests.Session()
+				# the first url for a base url decides which, VS base urls only ever see /API/ calls
+				adapter_class = VSAdapter if is_vs_url(url) else HTTPAdapter
+				adapter = adapter_class(pool_connections=1, pool_maxsize=pool_size)
+				session.mount('https://', adapter)
+				session.mount('http://', adapter)
+				_sessions[base_url] = session
+				logger.debug(f'Opened pooled session for {base_url} with pool size {pool_size}.')
+	return session
+
+def vs_request(method, url, idempotent=None, **kwargs) -> requests.Response:
+	# drop in replacement for requests.request that runs on the pooled session for the url
+	# goes through the retry policy and circuit breaker below. idempotent=True/False overrides
+	# whether the method is safe to send twice (a search PUT is, a job POST isn't)
+	# a stream=True response keeps its governor slot until it's closed, so always close it
+	kwargs.setdefault('timeout', request_timeout)
+	if method.upper() == 'GET' and single_flight and not kwargs.get('stream'):
+		response = _send_single_flight(method, url, idempotent, kwargs)
+	else:
+		try:
+			response = _send_with_policy(method, url, idempotent, kwargs)
+		finally:
+			if method.upper() not in ('GET', 'HEAD', 'OPTIONS'):
+				_bump_write_generation()
+	if response.status_code == 401 and '/API/token' not in url:
+		# VS didn't act on it, so it's safe to send again with a new token if this was a shared one
+		headers = kwargs.get('headers') or {}
+		authorization = renew_shared_token(headers.get('Authorization'))
+		if authorization is not None:
+			response.close()
+			kwargs = dict(kwargs, headers=dict(headers, Authorization=authorization))
+			response = _send_with_policy(method, url, idempotent, kwargs)
+	return response
+
+def set_pool_size(size):
+	# call once at startup, before any threads are making requests
+	# sessions already open keep their old pools, so close them and let get_session rebuild
+	global pool_size
+	pool_size = size
+	close_sessions()
+
+def session_stats() -> dict:
+	# {'http://prod-vs:8080/': {'requests': 40, 'connections': 2, 'reused': 38}}
+	stats = {}
+	for base_url, session in list(_sessions.items()):
+		requests_made = 0
+		connections = 0
+		for adapter in set(session.adapters.values()):
+			for key in adapter.poolmanager.pools.keys():
+				pool = adapter.poolmanager.pools.get(key)
+				if pool is None:
+					continue
+				requests_made += pool.num_requests
+				connections += pool.num_connections
+		stats[base_url] = {'requests': requests_made, 'connections': connections, 'reused': requests_made - connections}
+	return stats
+
+def log_session_stats():
+	for base_url, stats in session_stats().items():
+		if stats['requests'] == 0:
+			continue
+		reuse_rate = round(stats['reused'] / stats['requests'] * 100, 1)
+		logger.info(f'{base_url} made {stats["requests"]} requests on {stats["connections"]} connections ({reuse_rate}% reused).')
+
+def close_sessions():
+	with _session_lock:
+		for session in _sessions.values():
+			session.close()
+		_sessions.clear()
+
+@atexit.register
+def _shutdown_sessions():
+	log_session_stats()
+	close_sessions()
+
+# RETRY POLICY
+# VS throws 503s and timeouts under load. instead of exiting and having Vantage rerun the whole
+# script, safe calls are retried with exponential backoff and jitter. a process wide retry budget
+# stops retries from piling on when everything is failing, and a circuit breaker per endpoint
+# fails fast for a while once an endpoint keeps failing, rather than tying up workers on it
+
+# (connect, read) seconds, used when a call doesn't pass its own timeout
+request_timeout = (10, 120)
+max_retries = 4
+retry_base_delay = 0.5
+retry_max_delay = 20
+# retries allowed = retry_budget_ratio of requests made so far, plus retry_budget_minimum
+retry_budget_ratio = 0.2
+retry_budget_minimum = 10
+retry_statuses = (429, 502, 503, 504)
+idempotent_methods = ('GET', 'HEAD', 'OPTIONS', 'DELETE')
+# PUTs that are safe to send twice: searches and metadata writes. anything else (job step data...) isn't retried
+idempotent_put_endpoints = ('item', 'search', 'item/{id}/metadata')
+# consecutive failures that open a breaker, and how long it stays open
+breaker_failure_threshold = 5
+breaker_reset_seconds = 30
+
+_policy_lock = threading.Lock()
+_policy_counts = {'requests': 0, 'retries': 0}
+_breakers = {}
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+	# raised without touching the network while an endpoint's breaker is open
+	pass
+
+_id_pattern = re.compile(r'^(VX-\d+|\d+|[0-9a-fA-F-]{36})$')
+
+def endpoint_template(url) -> str:
+	# 'http://vs:8080/API/item/VX-12/metadata;field=x?terse=true' -> 'item/{id}/metadata'
+	path = urlsplit(url).path
+	if '/API/' in path:
+		path = path.split('/API/', 1)[1]
+	parts = []
+	for part in path.strip('/').split('/'):
+		part = part.split(';', 1)[0]
+		parts.append('{id}' if _id_pattern.match(part) else part)
+	return '/'.join(parts)
+
+class CircuitBreaker:
+	# closed -> open after breaker_failure_threshold failures in a row
+	# open -> half open after breaker_reset_seconds, where one trial call decides which way it goes
+
+	def __init__(self, name):
+		self.name = name
+		self.failures = 0
+		self.opened_at = None
+		self.trial_running = False
+		self._lock = threading.Lock()
+
+	def allow(self) -> bool:
+		with self._lock:
+			if self.opened_at is None:
+				return True
+			if time.monotonic() - self.opened_at < breaker_reset_seconds or self.trial_running:
+				return False
+			self.trial_running = True
+			return True
+
+	def release(self):
+		# the call let in by allow() ended without telling us anything about VS, let the next one try
+		with self._lock:
+			self.trial_running = False
+
+	def record(self, success):
+		with self._lock:
+			self.trial_running = False
+			if success:
+				if self.opened_at is not None:
+					logger.warning(f'Circuit for {self.name} closed again.')
+				self.failures = 0
+				self.opened_at = None
+				return
+			self.failures += 1
+			if self.failures >= breaker_failure_threshold:
+				if self.opened_at is None:
+					logger.error(f'Circuit for {self.name} opened after {self.failures} failures in a row.')
+				self.opened_at = time.monotonic()
+
+def get_breaker(url) -> CircuitBreaker:
+	name = f'{_base_url(url)}{endpoint_template(url)}'
+	with _policy_lock:
+		breaker = _breakers.get(name)
+		if breaker is None:
+			breaker = CircuitBreaker(name)
+			_breakers[name] = breaker
+	return breaker
+
+def _take_retry_budget() -> bool:
+	with _policy_lock:
+		allowed = _policy_counts['requests'] * retry_budget_ratio + retry_budget_minimum
+		if _policy_counts['retries'] >= allowed:
+			return False
+		_policy_counts['retries'] += 1
+		return True
+
+def _retry_delay(attempt) -> float:
+	# full jitter: anywhere between 0 and the exponential cap
+	return random.uniform(0, min(retry_max_delay, retry_base_delay * (2 ** attempt)))
+
+def is_idempotent(method, url) -> bool:
+	if method.upper() == 'PUT':
+		return endpoint_template(url) in idempotent_put_endpoints
+	return method.upper() in idempotent_methods
+
+def _send_with_policy(method, url, idempotent, kwargs) -> requests.Response:
+	if idempotent is None:
+		idempotent = is_idempotent(method, url)
+	breaker = get_breaker(url)
+	attempt = 0
+	while True:
+		if not breaker.allow():
+			raise CircuitOpenError(f'Circuit for {breaker.name} is open, not calling VS.')
+		with _policy_lock:
+			_policy_counts['requests'] += 1
+		slot = None
+		try:
+			slot = acquire_governor_slot(url)
+			with trace_span(f'{method.upper()} {endpoint_template(url)}', host=urlsplit(url).netloc, attempt=attempt) as request_span:
+				started = time.perf_counter()
+				response = get_session(url).request(method, url, **kwargs)
+				if request_span is not None:
+					request_span.set(status=response.status_code)
+					if not kwargs.get('stream'):
+						request_span.set(bytes_in=len(response.content or b''))
+		except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+			release_governor_slot(slot)
+			record_request(method, url, e.__class__.__name__, time.perf_counter() - started, kwargs.get('data'), None)
+			breaker.record(False)
+			if not idempotent or attempt >= max_retries or not _take_retry_budget():
+				raise
+			delay = _retry_delay(attempt)
+			logger.warning(f'{method} {endpoint_template(url)} failed ({e.__class__.__name__}), retry {attempt + 1} in {delay:.1f}s.')
+		except BaseException as e:
+			release_governor_slot(slot)
+			# anything else isn't retried, but it still has to settle a half open trial or the breaker
+			# stays open for the rest of the process. a broken body or bad url counts against VS,
+			# ctrl-c and friends don't
+			if isinstance(e, requests.exceptions.RequestException):
+				breaker.record(False)
+			else:
+				breaker.release()
+			raise
+		else:
+			if kwargs.get('stream'):
+				_release_on_close(response, slot)
+			else:
+				release_governor_slot(slot)
+			record_request(method, url, response.status_code, time.perf_counter() - started, kwargs.get('data'), response)
+			breaker.record(response.status_code < 500)
+			if response.status_code not in retry_statuses or not idempotent or attempt >= max_retries or not _take_retry_budget():
+				return response
+			delay = _retry_delay(attempt)
+			# honour Retry-After when VS sends one, as long as it's sane
+			retry_after = response.headers.get('Retry-After')
+			if retry_after and retry_after.isdigit():
+				delay = min(int(retry_after), retry_max_delay)
+			logger.warning(f'{method} {endpoint_template(url)} returned {response.status_code}, retry {attempt + 1} in {delay:.1f}s.')
+			response.close()
+		attempt += 1
+		with trace_span('vs retry wait', attempt=attempt, seconds=round(delay, 2)):
+			time.sleep(delay)
+
+# SINGLE FLIGHT
+# when several threads GET the same url with the same headers at the same time (the same shape
+# document, storage group or metadata field during a fan-out) only the first one goes to VS, the
+# rest wait for it and get the same response back, or the same exception. the response body is
+# already read, so every caller can parse it on its own. any write we send starts a new generation,
+# so a GET made after one of our own writes never joins a request that started before it
+
+single_flight = True
+
+_flights = {}
+_flight_lock = threading.Lock()
+_flight_counts = {'sent': 0, 'joined': 0}
+_write_generation = 0
+
+def _bump_write_generation():
+	global _write_generation
+	with _flight_lock:
+		_write_generation += 1
+
+def _flight_key(method, url, kwargs):
+	headers = tuple(sorted((name.lower(), value) for name, value in (kwargs.get('headers') or {}).items()))
+	rest = tuple(sorted((name, repr(value)) for name, value in kwargs.items() if name not in ('headers', 'timeout')))
+	return (_write_generation, method.upper(), url, headers, rest)
+
+def _send_single_flight(method, url, idempotent, kwargs) -> requests.Response:
+	with _flight_lock:
+		key = _flight_key(method, url, kwargs)
+		flight = _flights.get(key)
+		leader = flight is None
+		if leader:
+			flight = _flights[key] = Future()
+			_flight_counts['sent'] += 1
+		else:
+			_flight_counts['joined'] += 1
+	if not leader:
+		with trace_span('vs single flight wait', url=url.split('?')[0]):
+			return flight.result()
+	try:
+		response = _send_with_policy(method, url, idempotent, kwargs)
+	except BaseException as e:
+		flight.set_exception(e)
+		raise
+	else:
+		flight.set_result(response)
+		return response
+	finally:
+		with _flight_lock:
+			if _flights.get(key) is flight:
+				del _flights[key]
+
+def single_flight_stats() -> dict:
+	# {'sent': GETs that went to VS, 'joined': GETs that waited on one of those instead, 'in_flight': now}
+	with _flight_lock:
+		return dict(_flight_counts, in_flight=len(_flights))
+
+# METRICS
+# every request is timed and filed under its endpoint template with its status, bytes each way
+# and the time spent parsing the reply. at exit the histograms go to the _dd.log handler as one
+# json event so we can see which endpoints eat the run time and where the slow tails are
+
+collect_metrics = True
+# histogram bucket upper bounds in milliseconds, anything slower lands in the last (+inf) bucket
+metric_buckets_ms = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+class Histogram:
+
+	def __init__(self):
+		self.count = 0
+		self.total = 0.0
+		self.min = None
+		self.max = None
+		self.buckets = [0] * (len(metric_buckets_ms) + 1)
+
+	def add(self, value_ms):
+		self.count += 1
+		self.total += value_ms
+		self.min = value_ms if self.min is None else min(self.min, value_ms)
+		self.max = value_ms if self.max is None else max(self.max, value_ms)
+		for index, bound in enumerate(metric_buckets_ms):
+			if value_ms <= bound:
+				self.buckets[index] += 1
+				return
+		self.buckets[-1] += 1
+
+	def percentile(self, pct):
+		# upper bound of the bucket the percentile falls in, good enough to spot a slow tail
+		if self.count == 0:
+			return None
+		rank = self.count * pct / 100
+		seen = 0
+		for index, count in enumerate(self.buckets):
+			seen += count
+			if seen >= rank:
+				return metric_buckets_ms[index] if index < len(metric_buckets_ms) else self.max
+		return self.max
+
+	def to_dict(self) -> dict:
+		if self.count == 0:
+			return {'count': 0}
+		return {
+			'count': self.count,
+			'total_ms': round(self.total, 1),
+			'mean_ms': round(self.total / self.count, 1),
+			'min_ms': round(self.min, 1),
+			'max_ms': round(self.max, 1),
+			'p50_ms': self.percentile(50),
+			'p90_ms': self.percentile(90),
+			'p99_ms': self.percentile(99),
+			'buckets': {str(bound): count for bound, count in zip(list(metric_buckets_ms) + ['inf'], self.buckets) if count}
+		}
+
+class EndpointMetrics:
+
+	def __init__(self):
+		self.latency = Histogram()
+		self.parse = Histogram()
+		self.statuses = {}
+		self.bytes_in = 0
+		self.bytes_out = 0
+
+	def to_dict(self) -> dict:
+		return {
+			'requests': self.latency.count,
+			'statuses': dict(self.statuses),
+			'bytes_in': self.bytes_in,
+			'bytes_out': self.bytes_out,
+			'latency': self.latency.to_dict(),
+			'parse': self.parse.to_dict()
+		}
+
+def _endpoint_metrics(key) -> EndpointMetrics:
+	metrics = _metrics.get(key)
+	if metrics is None:
+		metrics = _metrics[key] = EndpointMetrics()
+	return metrics
+
+def _body_size(data) -> int:
+	if data is None:
+		return 0
+	if isinstance(data, str):
+		return len(data.encode('utf-8'))
+	if isinstance(data, (bytes, bytearray)):
+		return len(data)
+	return 0
+
+def _response_size(response) -> int:
+	if response is None:
+		return 0
+	# don't pull a streamed body in just to measure it
+	if getattr(response, '_content_consumed', True) is False:
+		return int(response.headers.get('Content-Length') or 0)
+	return len(getattr(response, 'content', None) or b'')
+
+def record_request(method, url, status, seconds, data, response):
+	if not collect_metrics:
+		return
+	key = f'{method.upper()} {endpoint_template(url)}'
+	bytes_in = _response_size(response)
+	with _metrics_lock:
+		metrics = _endpoint_metrics(key)
+		metrics.latency.add(seconds * 1000)
+		metrics.statuses[str(status)] = metrics.statuses.get(str(status), 0) + 1
+		metrics.bytes_out += _body_size(data)
+		metrics.bytes_in += bytes_in
+
+def record_parse(response, seconds):
+	# xml_prep calls this so parse time lands on the endpoint that returned the document
+	if not collect_metrics:
+		return
+	url = getattr(response, 'url', None)
+	request = getattr(response, 'request', None)
+	if not url:
+		return
+	method = getattr(request, 'method', None) or 'GET'
+	with _metrics_lock:
+		_endpoint_metrics(f'{method.upper()} {endpoint_template(url)}').parse.add(seconds * 1000)
+
+def metrics_snapshot() -> dict:
+	with _metrics_lock:
+		return {key: metrics.to_dict() for key, metrics in sorted(_metrics.items())}
+
+def _dd_handlers() -> list:
+	# the json handler cms_integration_logging hangs on the root logger
+	return [handler for handler in logging.getLogger().handlers if getattr(handler, 'baseFilename', '').endswith('_dd.log')]
+
+def emit_dd_event(message, payload):
+	# writes one json event to the _dd.log handler(s) only, so the plain log doesn't get the blob
+	handlers = _dd_handlers()
+	if not handlers:
+		logger.info(message, extra=payload)
+		return
+	record = logger.makeRecord(logger.name, logging.INFO, __file__, 0, message, (), None, extra=payload)
+	for handler in handlers:
+		if record.levelno >= handler.level:
+			handler.handle(record)
+
+def trace_span(name, **attributes):
+	# a span in the run's trace when cms_integration_logging is tracing it, otherwise nothing
+	# (the with ... as gets None then). every attempt vs_request sends gets one, the rest cover the work around them
+	tracer = getattr(sys.modules.get('cms_integration_logging'), 'tracer', None)
+	if tracer is None:
+		return nullcontext()
+	return tracer.span(name, **attributes)
+
+def dump_metrics():
+	snapshot = metrics_snapshot()
+	if snapshot:
+		emit_dd_event('vs_request_metrics', {'vs_request_metrics': snapshot, 'vs_single_flight': single_flight_stats(), 'vs_governor': governor_stats()})
+
+@atexit.register
+def _shutdown_metrics():
+	if collect_metrics:
+		dump_metrics()
+
+# READ CACHE
+# metadata and shape reads are cached per process for a few seconds so scripts that read
+# the same field more than once only pay for it once. our own writes and deletes go through
+# invalidate_item so the cache never hands back something we just changed.
+# anything written by someone else (Vantage, VS jobs, another script) can read up to cache_ttl
+# seconds stale, so set_cache(ttl=0) in anything that polls for a field another system sets.
+# every hit is a copy, changing what you got back doesn't change what the next caller gets
+# keys look like (vs, item_id, kind, name) where kind is system, group, values, shape, shape_ids or shape_index
+
+# seconds an entry stays good and how many entries to keep. set cache_ttl to 0 to turn it off
+cache_ttl = 30
+cache_max_entries = 5000
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_metadata_kinds = ('system', 'group', 'values')
+_shape_kinds = ('shape', 'shape_ids', 'shape_index')
+
+def set_cache(ttl=None, max_entries=None):
+	global cache_ttl, cache_max_entries
+	if ttl is not None:
+		cache_ttl = ttl
+	if max_entries is not None:
+		cache_max_entries = max_entries
+	clear_cache()
+
+def cache_get(key):
+	# returns (True, value) on a fresh hit, (False, None) otherwise
+	if cache_ttl <= 0:
+		return False, None
+	with _cache_lock:
+		entry = _cache.get(key)
+		if entry is None:
+			return False, None
+		expires, value = entry
+		if expires < time.monotonic():
+			del _cache[key]
+			return False, None
+		_cache.move_to_end(key)
+		logger.debug(f'Cache hit for {key[1:]}.')
+		return True, value
+
+def cache_put(key, value):
+	if cache_ttl <= 0:
+		return
+	with _cache_lock:
+		_cache[key] = (time.monotonic() + cache_ttl, value)
+		_cache.move_to_end(key)
+		while len(_cache) > cache_max_entries:
+			_cache.popitem(last=False)
+
+def invalidate_item(vs, item_id=None, kinds=None):
+	# drop cached entries for an item (or every item if item_id is None), optionally only some kinds
+	with _cache_lock:
+		for key in list(_cache.keys()):
+			if key[0] != vs:
+				continue
+			if item_id is not None and key[1] != item_id:
+				continue
+			if kinds is not None and key[2] not in kinds:
+				continue
+			del _cache[key]
+
+def clear_cache():
+	with _cache_lock:
+		_cache.clear()
+
+# DISK FUNCTIONS
+# small helpers for state shared between the many short lived processes on a box
+
+# where the shared files live. override before the first call if the temp dir isn't shared between users
+disk_cache_dir = os.path.join(tempfile.gettempdir(), 'eng_vs_token')
+
+def disk_cache_path(vs, name) -> str:
+	# one file per vs host, e.g. /tmp/eng_vs_token/prod-vs_8080_storage_topology.json
+	host = urlsplit(vs).netloc.replace(':', '_') or 'local'
+	os.makedirs(disk_cache_dir, exist_ok=True)
+	return os.path.join(disk_cache_dir, f'{host}_{name}')
+
+@contextmanager
+def file_lock(path):
+	# exclusive lock held across processes for the length of the with block
+	with open(f'{path}.lock', 'a+') as lock_file:
+		if fcntl is not None:
+			fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+		else:
+			lock_file.seek(0)
+			msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+		try:
+			yield
+		finally:
+			if fcntl is not None:
+				fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+			else:
+				lock_file.seek(0)
+				msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def read_json_file(path):
+	# None if the file isn't there or is half written garbage
+	try:
+		with open(path, 'r', encoding='utf-8') as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return None
+
+def write_json_file(path, data):
+	# write to a temp file next to it and swap it in, so readers never see a partial file
+	fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp_')
+	try:
+		with os.fdopen(fd, 'w', encoding='utf-8') as f:
+			json.dump(data, f)
+		os.replace(temp_path, path)
+	except OSError:
+		if os.path.exists(temp_path):
+			os.remove(temp_path)
+		raise
+
+# HOST GOVERNOR
+# Vantage starts dozens of these scripts at once on a node and each one hits VS on its own, so a
+# burst overloads VS and everything slows down. every request now takes one of governor_limit slots
+# for its vs first. a slot is a lock file under disk_cache_dir so the cap holds across every process
+# on the box, per vs so prod and uat don't share, and a process that dies lets go of its slots with it.
+# bulk callers only get the first governor_bulk_limit slots and stand back while any interactive
+# caller is waiting, so a backfill can't starve a Vantage submit. only VS API calls are governed,
+# solr and anything else that goes through vs_request doesn't take a slot
+#   eng_vs_token.set_priority('bulk')              # the whole script is a backfill
+#   with eng_vs_token.priority_class('bulk'): ...  # just this block on this thread
+
+# slots per vs per box, 0 turns the governor off
+governor_limit = 32
+governor_bulk_limit = 16
+# longest sleep between tries while waiting for a slot
+governor_poll = 0.05
+governor_priority = 'interactive'
+priority_classes = ('interactive', 'bulk')
+
+_governor_local = threading.local()
+_governor_lock = threading.Lock()
+_governor_counts = {'acquired': 0, 'waited': 0}
+_governor_waits = {}
+# {(vs, priority): (monotonic time, count)}, see recent_waiting_count
+_waiting_counts = {}
+
+def set_priority(priority):
+	global governor_priority
+	if priority not in priority_classes:
+		raise ValueError(f'priority has to be one of {priority_classes}, not {priority!r}')
+	governor_priority = priority
+
+def current_priority() -> str:
+	return getattr(_governor_local, 'priority', None) or governor_priority
+
+@contextmanager
+def priority_class(priority):
+	# priority for requests made on this thread inside the with block
+	if priority not in priority_classes:
+		raise ValueError(f'priority has to be one of {priority_classes}, not {priority!r}')
+	previous = getattr(_governor_local, 'priority', None)
+	_governor_local.priority = priority
+	try:
+		yield
+	finally:
+		_governor_local.priority = previous
+
+def _try_lock(lock_file) -> bool:
+	# file_lock without the waiting, False if someone else holds it
+	try:
+		if fcntl is not None:
+			fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+		else:
+			lock_file.seek(0)
+			msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+		return True
+	except OSError:
+		return False
+
+def _unlock(lock_file):
+	try:
+		if fcntl is not None:
+			fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+		else:
+			lock_file.seek(0)
+			msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+	finally:
+		lock_file.close()
+
+def _slot_count(priority) -> int:
+	if priority == 'bulk':
+		return max(1, min(governor_bulk_limit, governor_limit))
+	return governor_limit
+
+def waiting_count(vs, priority) -> int:
+	# callers on this box waiting for a slot on vs. every waiter holds a lock on its own file, a file
+	# nobody holds any more belongs to a process that died and gets cleared out
+	prefix = os.path.basename(disk_cache_path(vs, f'governor_wait_{priority}_'))
+	count = 0
+	for name in os.listdir(disk_cache_dir):
+		if not name.startswith(prefix):
+			continue
+		path = os.path.join(disk_cache_dir, name)
+		try:
+			# r+ so a file its waiter removed in the meantime isn't created again
+			lock_file = open(path, 'r+')
+		except OSError:
+			continue
+		if not _try_lock(lock_file):
+			lock_file.close()
+			count += 1
+			continue
+		_unlock(lock_file)
+		try:
+			# a waiter that has only just created its file may not have locked it yet
+			if time.time() - os.path.getmtime(path) > 5:
+				os.remove(path)
+		except OSError:
+			pass
+	return count
+
+def recent_waiting_count(vs, priority) -> int:
+	# waiting_count, but at most governor_poll old. every bulk request asks before it takes a slot,
+	# and listing the directory and trying every waiter's lock each time is the slow part of that
+	key = (vs, priority)
+	now = time.monotonic()
+	with _governor_lock:
+		checked = _waiting_counts.get(key)
+	if checked is not None and now - checked[0] < governor_poll:
+		return checked[1]
+	count = waiting_count(vs, priority)
+	with _governor_lock:
+		_waiting_counts[key] = (now, count)
+	return count
+
+def governed(url) -> bool:
+	return governor_limit > 0 and is_vs_url(url)
+
+def try_governor_slot(vs, priority=None):
+	# the open, locked slot file if one is free right now, otherwise None. release_governor_slot it after
+	priority = priority or current_priority()
+	if priority == 'bulk' and recent_waiting_count(vs, 'interactive'):
+		return None
+	slots = _slot_count(priority)
+	first = random.randrange(slots)
+	for offset in range(slots):
+		lock_file = open(disk_cache_path(vs, f'governor_slot_{(first + offset) % slots}.lock'), 'a+')
+		if _try_lock(lock_file):
+			return lock_file
+		lock_file.close()
+	return None
+
+def release_governor_slot(slot):
+	if slot is not None:
+		_unlock(slot)
+
+@contextmanager
+def governor_waiter(vs, priority):
+	# counts us in waiting_count for as long as the with block runs
+	prefix = disk_cache_path(vs, f'governor_wait_{priority}_')
+	fd, path = tempfile.mkstemp(dir=os.path.dirname(prefix), prefix=os.path.basename(prefix), suffix='.lock')
+	lock_file = os.fdopen(fd, 'a+')
+	_try_lock(lock_file)
+	try:
+		yield
+	finally:
+		try:
+			os.remove(path)
+		except OSError:
+			pass
+		_unlock(lock_file)
+
+def record_governor_wait(priority, seconds):
+	with _governor_lock:
+		_governor_counts['acquired'] += 1
+		if seconds > 0:
+			_governor_counts['waited'] += 1
+			if priority not in _governor_waits:
+				_governor_waits[priority] = Histogram()
+			_governor_waits[priority].add(seconds * 1000)
+
+def acquire_governor_slot(url, priority=None):
+	# waits for a slot for the vs url is on, hand what it returns to release_governor_slot
+	# None when the url isn't governed or the governor can't be used
+	if not governed(url):
+		return None
+	vs = _base_url(url)
+	priority = priority or current_priority()
+	waited = 0
+	try:
+		slot = try_governor_slot(vs, priority)
+		if slot is None:
+			started = time.perf_counter()
+			delay = 0.002
+			with governor_waiter(vs, priority), trace_span('vs governor wait', priority=priority):
+				while slot is None:
+					time.sleep(random.uniform(delay / 2, delay))
+					delay = min(delay * 2, governor_poll)
+					slot = try_governor_slot(vs, priority)
+			waited = time.perf_counter() - started
+			if waited > 5:
+				logger.info(f'Waited {waited:.1f}s for a {priority} VS slot on {vs}.')
+	except OSError as e:
+		# a governor that can't write its lock files shouldn't stop the request
+		logger.warning(f'VS governor unavailable ({e}), going ahead without a slot.')
+		return None
+	record_governor_wait(priority, waited)
+	return slot
+
+def _release_on_close(response, slot):
+	# a stream=True body is still coming off VS after the request returns, so its slot
+	# goes back when the response is closed instead
+	close = response.close
+
+	def close_and_release():
+		nonlocal slot
+		try:
+			close()
+		finally:
+			held, slot = slot, None
+			release_governor_slot(held)
+	response.close = close_and_release
+
+@contextmanager
+def governor_slot(url, priority=None):
+	# holds a slot for the vs url is on for the length of the with block
+	slot = acquire_governor_slot(url, priority)
+	try:
+		yield
+	finally:
+		release_governor_slot(slot)
+
+def governor_stats(vs=None) -> dict:
+	# this process's slot waits, plus the box wide picture for vs if it's given:
+	# {'acquired': 900, 'waited': 40, 'wait_ms': {'bulk': {...}}, 'in_use': 12, 'waiting': {'interactive': 0, 'bulk': 3}}
+	with _governor_lock:
+		stats = dict(_governor_counts, wait_ms={priority: histogram.to_dict() for priority, histogram in _governor_waits.items()})
+	if vs is not None and governor_limit > 0:
+		vs = _base_url(vs)
+		in_use = 0
+		for slot in range(governor_limit):
+			lock_file = open(disk_cache_path(vs, f'governor_slot_{slot}.lock'), 'a+')
+			if _try_lock(lock_file):
+				_unlock(lock_file)
+			else:
+				lock_file.close()
+				in_use += 1
+		stats.update(limit=governor_limit, bulk_limit=_slot_count('bulk'), in_use=in_use)
+		stats['waiting'] = {priority: waiting_count(vs, priority) for priority in priority_classes}
+	return stats
+
+# XML FUNCTIONS
+# VS documents all declare the vidispine default namespace on the root element. instead of
+# decoding, string replacing and re-encoding the whole body, the parser is fed the original bytes
+# with the declaration skipped over, so the tags come out bare and nothing gets copied. documents
+# that declare it again further in (embedded documents) get every declaration dropped, like xml_prep did
+
+VS_NAMESPACE = 'http://xml.vidispine.com/schema/vidispine'
+_ns_declaration = f' xmlns="{VS_NAMESPACE}"'.encode('utf-8')
+_ns_prefix = '{' + VS_NAMESPACE + '}'
+
+# 'etree' (default, always available) or 'lxml'
+xml_backend = 'etree'
+
+def set_xml_backend(backend):
+	global xml_backend
+	if backend == 'lxml' and lxml_etree is None:
+		logger.warning('lxml is not installed, staying on ElementTree.')
+		return
+	xml_backend = backend
+
+def _find_ns_declaration(content):
+	# index of the only declaration, or -1 with content stripped of all of them when there's more than one
+	index = content.find(_ns_declaration)
+	if index >= 0 and content.find(_ns_declaration, index + len(_ns_declaration)) >= 0:
+		return -1, content.replace(_ns_declaration, b'')
+	return index, content
+
+def parse_vs_xml(content):
+	# bytes in, element with namespace-free tags out
+	index, content = _find_ns_declaration(bytes(content))
+	if xml_backend == 'lxml':
+		if index >= 0:
+			content = content[:index] + content[index + len(_ns_declaration):]
+		return lxml_etree.fromstring(content)
+	if index < 0:
+		return ET.fromstring(content)
+	parser = ET.XMLParser()
+	view = memoryview(content)
+	parser.feed(view[:index])
+	parser.feed(view[index + len(_ns_declaration):])
+	return parser.close()
+
+def _strip_ns(element):
+	for child in element.iter():
+		if isinstance(child.tag, str) and child.tag.startswith(_ns_prefix):
+			child.tag = child.tag[len(_ns_prefix):]
+
+def iter_vs_elements(source, tag):
+	# incremental parse for big ItemListDocuments and storage file lists
+	# yields each top level <tag> element (e.g. 'item' or 'file') as soon as it has been read and
+	# throws it away once the caller moves on, so memory stays flat no matter how long the list is.
+	# copy anything you need out of the element before asking for the next one.
+	# source can be bytes, a file object, or a response made with vs_request(..., stream=True)
+	if isinstance(source, (bytes, bytearray)):
+		source = BytesIO(source)
+	elif isinstance(source, requests.Response):
+		source.raw.decode_content = True
+		source = source.raw
+	namespaced_tag = _ns_prefix + tag
+	depth = 0
+	root = None
+	for event, element in ET.iterparse(source, events=('start', 'end')):
+		if event == 'start':
+			if root is None:
+				root = element
+			depth += 1
+			continue
+		depth -= 1
+		if depth == 1 and element.tag in (tag, namespaced_tag):
+			_strip_ns(element)
+			yield element
+			element.clear()
+			root.remove(element)
+
+class VSPath:
+	# a find path compiled once and reused for every document
+	# ElementTree already caches compiled paths, with lxml this becomes a compiled XPath
+	#   FILE_STORAGE = VSPath('.//file/storage')
+	#   FILE_STORAGE.findall(shape)
+
+	def __init__(self, path):
+		self.path = path
+		self._xpath = lxml_etree.XPath(path) if lxml_etree is not None else None
+
+	def _is_lxml(self, element):
+		return self._xpath is not None and isinstance(element, lxml_etree._Element)
+
+	def findall(self, element) -> list:
+		if self._is_lxml(element):
+			return self._xpath(element)
+		return element.findall(self.path)
+
+	def find(self, element):
+		found = self.findall(element)
+		return found[0] if found else None
+
+	def findtext(self, element, default=None):
+		found = self.find(element)
+		if found is None:
+			return default
+		return found.text or ''
+
+# JSON FUNCTIONS
+# VS will answer the same reads in json. with set_transport('json') the metadata, shape, job and
+# search reads ask for gzipped json, decode it with orjson when it's installed, and hand back the
+# same values the xml path does. eng_vs_transport_benchmark.py compares the two on the wire and in cpu
+
+# 'xml' (default) or 'json'
+transport = 'xml'
+
+def set_transport(name):
+	global transport
+	if name not in ('xml', 'json'):
+		raise ValueError(f'Unknown transport {name}, use xml or json.')
+	transport = name
+
+def json_loads(content):
+	if orjson is not None:
+		return orjson.loads(content)
+	return json.loads(content)
+
+def json_prep(res):
+	# json version of xml_prep
+	started = time.perf_counter()
+	with trace_span('json parse', bytes=len(res.content)):
+		document = json_loads(res.content)
+	record_parse(res, time.perf_counter() - started)
+	return document
+
+def read_headers(token) -> dict:
+	# headers for a read in the current transport
+	if transport == 'json':
+		return {'Accept': 'application/json', 'Accept-Encoding': 'gzip', 'Authorization': f'token {token}'}
+	return {'Accept': 'application/xml', 'Authorization': f'token {token}'}
+
+def prep_response(res):
+	# xml_prep or json_prep, whichever the response came back as
+	if 'json' in res.headers.get('Content-Type', ''):
+		return json_prep(res)
+	return xml_prep(res)
+
+def json_list(node, key) -> list:
+	# repeated elements come back as lists, be forgiving if one shows up as a single object
+	value = node.get(key) if isinstance(node, dict) else None
+	if value is None:
+		return []
+	return value if isinstance(value, list) else [value]
+
+def json_first_value(fields):
+	# json version of find('field/value').text, the first value of the first field that has one
+	for field in fields:
+		for value in json_list(field, 'value'):
+			return value.get('value') if isinstance(value, dict) else value
+	raise AttributeError('no value')
+
+def json_timespans(metadata):
+	# every timespan of every item in a json MetadataListDocument/ItemListDocument
+	for item in json_list(metadata, 'item'):
+		yield from json_list(item.get('metadata'), 'timespan')
+
+def json_field_values(node, found=None) -> dict:
+	# {name: first value} for every field under node, groups and nested groups included
+	found = {} if found is None else found
+	for field in json_list(node, 'field'):
+		name = field.get('name')
+		if name not in found:
+			try:
+				found[name] = json_first_value([field])
+			except AttributeError:
+				pass
+	for group in json_list(node, 'group'):
+		json_field_values(group, found)
+	return found
+
 # HELPER FUNCTIONS
 
 def get_basic_auth(username,password):
@@ -23,30 +1096,35 @@ def get_basic_auth(username,password):
 	basic_auth = f'Basic {token}'
 	return basic_auth
 
-def get_token_no_auto_refresh(vs,basic_auth,seconds) -> dict:
-	# this function uses basic auth to get a vs token which will expire after X seconds
-	# the output dict will include the token, expiry time, and token_life so we know how long to renew it
-	# {'token':'/5ZtWKVetT14+DuyXW+d2zx9N7vNp3Ei0iWFwhWG', 'expiry':1714524862.839222, 'token_life': 60, 'vs': vs}
+def _request_token(vs,authorization,seconds,auto_refresh) -> dict:
+	# one API/token call, returns a token_auth_dict or None if VS said no
 	auth_time = time.time()
-	expires = auth_time + seconds
-	token_auth_dict = {}
-	url = f'{vs}API/token?seconds={seconds}&autoRefresh=false'
+	url = f'{vs}API/token?seconds={seconds}&autoRefresh={"true" if auto_refresh else "false"}'
 	headers = {
 		'Accept': 'application/json',
-		'Authorization': basic_auth
+		'Authorization': authorization
 	}
-	response = requests.request("GET", url, headers=headers, verify=crt_file)
+	with trace_span('vs token', seconds=seconds, auto_refresh=auto_refresh):
+		response = vs_request("GET", url, headers=headers)
 	if response.status_code >= 300:
 		logger.error(f'Could not get Vidispine token. status code {response.status_code}')
+		return None
+	auth_res_json = response.json()
+	return {'token': auth_res_json['token'], 'expiry': auth_time + seconds, 'token_life': seconds, 'vs': vs}
+
+def get_token_no_auto_refresh(vs,basic_auth,seconds) -> dict:
+	# this function uses basic auth to get a vs token which will expire after X seconds
+	# the output dict will include the token, expiry time, and token_life so we know how long to renew it
+	# {'token':'/5ZtWKVetT14+DuyXW+d2zx9N7vNp3Ei0iWFwhWG', 'expiry':1714524862.839222, 'token_life': 60, 'vs': vs}
+	# with share_tokens on, this hands back the token shared by every process on the box for this
+	# vs/user as long as it still has at least X seconds left, and only mints a new one when it doesn't
+	if share_tokens:
+		return get_token_manager(vs,basic_auth).get(min_remaining=seconds)
+	token_auth_dict = _request_token(vs,basic_auth,seconds,False)
+	if token_auth_dict is None:
 		exit(1)
-	else:
-		logger.info('Created Vidispine token.')
-		auth_res_json = response.json()
-		token_auth_dict['token'] = auth_res_json['token']
-		token_auth_dict['expiry'] = expires
-		token_auth_dict['token_life'] = seconds
-		token_auth_dict['vs'] = vs
-		return token_auth_dict
+	logger.info('Created Vidispine token.')
+	return token_auth_dict
 
 def get_auto_refresh_token(vs,basic_auth,seconds) -> dict:
 	# this function uses basic auth to get a vs token which will expire after X seconds if it isn't used
@@ -55,26 +1133,11 @@ def get_auto_refresh_token(vs,basic_auth,seconds) -> dict:
 	# the output dict will include the token, expiry time, and token_life so we know how long to renew it
 	# the output dict also contains the vs base_url where it was originally called from
 	# {'token':'/5ZtWKVetT14+DuyXW+d2zx9N7vNp3Ei0iWFwhWG', 'expiry':1714524862.839222, 'token_life': 60, 'vs': vs}
-	auth_time = time.time()
-	expires = auth_time + seconds
-	token_auth_dict = {}
-	url = f'{vs}API/token?seconds={seconds}&autoRefresh=true'
-	headers = {
-		'Accept': 'application/json',
-		'Authorization': basic_auth
-	}
-	response = requests.request("GET", url, headers=headers, verify=crt_file)
-	if response.status_code >= 300:
-		logger.error(f'Could not get Vidispine token. status code {response.status_code}')
+	token_auth_dict = _request_token(vs,basic_auth,seconds,True)
+	if token_auth_dict is None:
 		exit(1)
-	else:
-		logger.info('Created Vidispine token.')
-		auth_res_json = response.json()
-		token_auth_dict['token'] = auth_res_json['token']
-		token_auth_dict['expiry'] = expires
-		token_auth_dict['token_life'] = seconds
-		token_auth_dict['vs'] = vs
-		return token_auth_dict
+	logger.info('Created Vidispine token.')
+	return token_auth_dict
 
 def refresh_token(token_auth_dict) -> dict:
 	# receives a token_auth_dict
@@ -82,81 +1145,247 @@ def refresh_token(token_auth_dict) -> dict:
 	# returns a new token_auth_dict
 	# WARNING uses the same vs url as previous auth i.e. if http://prod-vs:8080/ was specified, it stays with that on the refresh
 	# assumes we are working with a non autoRefresh token and producing a new one.
-	new_token_auth_dict = {}
-	auth_time = time.time()
-	seconds = token_auth_dict['seconds']
-	expires = auth_time + seconds
-	vs = token_auth_dict["vs"]
-	url = f'{vs}API/token?seconds={seconds}&autoRefresh=false'
-	headers = {
-		'Accept': 'application/json',
-		'Authorization': f'token {token_auth_dict["token"]}'
-	}
-	response = requests.request("GET", url, headers=headers, verify=crt_file)
-	if response.status_code >= 300:
-		logger.error(f'Could not refresh Vidispine token. status code {response.status_code}')
+	new_token_auth_dict = _request_token(token_auth_dict["vs"],f'token {token_auth_dict["token"]}',token_auth_dict['token_life'],False)
+	if new_token_auth_dict is None:
+		logger.error('Could not refresh Vidispine token.')
 		exit(1)
-	else:
-		logger.info('Refreshed Vidispine token.')
-		auth_res_json = response.json()
-		new_token_auth_dict['token'] = auth_res_json['token']
-		new_token_auth_dict['expiry'] = expires
-		new_token_auth_dict['token_life'] = seconds
-		new_token_auth_dict['vs'] = vs
-		return token_auth_dict
+	logger.info('Refreshed Vidispine token.')
+	return new_token_auth_dict
 
 def xml_prep(res):
 	# prepare a VS xml for parsing with ET
-	res = res.content
-	res = res.decode(encoding='utf-8', errors='strict')
-	# because I hate dealing with the namespace in ET
-	res = res.replace(' xmlns=\"http://xml.vidispine.com/schema/vidispine\"', "")
-	res = res.encode(encoding='utf-8', errors='strict')
-	res = ET.fromstring(res)
-	return res
+	# because I hate dealing with the namespace in ET, parse_vs_xml drops it on the way in
+	started = time.perf_counter()
+	with trace_span('xml parse', bytes=len(res.content)):
+		document = parse_vs_xml(res.content)
+	record_parse(res, time.perf_counter() - started)
+	return document
 
 def status_check(vs_token_data, job_id):
 	vs = vs_token_data['vs']
 	token = vs_token_data["token"]
 	url = f'{vs}API/job/{job_id}'
-	headers = {
-		'Authorization': f'token {token}'
-	}
-	response = requests.get(url, headers=headers, verify=crt_file)
-	status_doc = xml_prep(response)
+	headers = read_headers(token)
+	response = vs_request("GET", url, headers=headers)
+	status_doc = prep_response(response)
+	return job_status_from_doc(status_doc)
+
+def job_status_from_doc(status_doc) -> str:
+	# status out of an xml prepped or json prepped JobDocument
+	if isinstance(status_doc, dict):
+		return status_doc.get('status')
 	return status_doc.find('status').text
 
 
+# TOKEN MANAGER
+# Vantage starts a lot of these scripts at once on the same node. instead of each one doing a basic
+# auth round trip, the token is kept on disk per vs/user and reused until it gets close to expiring.
+# if VS answers 401 to a shared token, vs_request drops it everywhere, mints a new one and sends the
+# request again, so a revoked token doesn't get handed to every script on the box until it expires
+
+# opt in: turn on to make get_token_no_auto_refresh hand back the shared token instead of a private one
+share_tokens = False
+# life of a shared token, and how close to expiry it gets replaced
+shared_token_seconds = 900
+shared_token_refresh_margin = 60
+
+_token_managers = {}
+_token_managers_lock = threading.Lock()
+
+class TokenManager:
+	# thread safe holder of one shared token for a vs and user
+	# get() always returns the same dict and updates it in place on refresh,
+	# so anything holding on to it (MetadataBatch, JobWatcher...) picks the new token up for free
+
+	def __init__(self, vs, basic_auth, seconds=None, refresh_margin=None):
+		self.vs = vs
+		self.basic_auth = basic_auth
+		self.seconds = seconds or shared_token_seconds
+		self.refresh_margin = refresh_margin or shared_token_refresh_margin
+		self.token_data = {}
+		# tokens VS has turned down, so every caller that got a 401 for one gets the replacement
+		self.rejected = set()
+		self._lock = threading.Lock()
+		self._timer = None
+		# the basic auth header holds the password, so only a hash of it goes in the file name
+		user_hash = hashlib.sha256(basic_auth.encode('utf-8')).hexdigest()[:16]
+		self.path = disk_cache_path(vs, f'token_{user_hash}.json')
+
+	def _remaining(self, token_data):
+		return token_data.get('expiry', 0) - time.time() if token_data else 0
+
+	def _usable(self, token_data, min_remaining):
+		return self._remaining(token_data) >= max(min_remaining, self.refresh_margin)
+
+	def get(self, min_remaining=0) -> dict:
+		# returns a token_auth_dict with at least min_remaining seconds left on it
+		with self._lock:
+			if self._usable(self.token_data, min_remaining):
+				return self.token_data
+			seconds = max(self.seconds, min_remaining + self.refresh_margin)
+			shared = None
+			try:
+				with file_lock(self.path):
+					# another process may have already replaced it
+					shared = read_json_file(self.path)
+					if shared and shared.get('vs') == self.vs and self._usable(shared, min_remaining):
+						logger.info('Reusing shared Vidispine token.')
+					else:
+						shared = self._new_token(shared, seconds)
+						write_json_file(self.path, shared)
+			except OSError as e:
+				if isinstance(e, requests.exceptions.RequestException):
+					raise
+				# can't share it, keep a token to ourselves rather than fail
+				logger.debug(f'Shared token file unavailable ({e}), using a private token.')
+				if not (shared and shared.get('vs') == self.vs and self._usable(shared, min_remaining)):
+					shared = self._new_token(None, seconds)
+			# update, don't clear, so other threads never see a half empty dict
+			self.token_data.update(shared)
+			return self.token_data
+
+	def invalidate(self, token) -> bool:
+		# VS turned token down (revoked, VS restarted...). forget it here, and on disk if it's still the shared one
+		# False if token was never this manager's
+		with self._lock:
+			if token in self.rejected:
+				return True
+			if self.token_data.get('token') != token:
+				return False
+			logger.warning('VS rejected the shared Vidispine token, getting a new one.')
+			self.rejected.add(token)
+			self.token_data['expiry'] = 0
+			try:
+				with file_lock(self.path):
+					shared = read_json_file(self.path)
+					if shared and shared.get('token') == token:
+						os.remove(self.path)
+			except OSError as e:
+				logger.debug(f'Could not clear the shared token file ({e}).')
+			return True
+
+	def _new_token(self, old, seconds):
+		# trade the old token in while it still works, fall back to basic auth
+		new = None
+		if old and self._remaining(old) > 5:
+			new = _request_token(self.vs, f'token {old["token"]}', seconds, False)
+		if new is None:
+			new = _request_token(self.vs, self.basic_auth, seconds, False)
+		if new is None:
+			exit(1)
+		logger.info('Created shared Vidispine token.')
+		return new
+
+	def start_auto_refresh(self):
+		# for long running scripts: replace the token in the background before it runs out
+		def refresh():
+			self.get(min_remaining=self.refresh_margin * 2)
+			self._schedule()
+		self._refresh = refresh
+		self.get()
+		self._schedule()
+
+	def _schedule(self):
+		delay = max(self._remaining(self.token_data) - self.refresh_margin * 2, 1)
+		self._timer = threading.Timer(delay, self._refresh)
+		self._timer.daemon = True
+		self._timer.start()
+
+	def stop_auto_refresh(self):
+		if self._timer is not None:
+			self._timer.cancel()
+			self._timer = None
+
+def renew_shared_token(authorization):
+	# authorization is a 'token ...' header VS just answered 401 to. if that's one of the shared tokens,
+	# drop it and return the header for a fresh one, otherwise None
+	if not authorization or not authorization.startswith('token '):
+		return None
+	token = authorization[len('token '):]
+	with _token_managers_lock:
+		managers = list(_token_managers.values())
+	for manager in managers:
+		if manager.invalidate(token):
+			return f'token {manager.get()["token"]}'
+	return None
+
+def get_token_manager(vs,basic_auth) -> TokenManager:
+	# one manager per vs/user per process
+	key = (vs, basic_auth)
+	with _token_managers_lock:
+		manager = _token_managers.get(key)
+		if manager is None:
+			manager = TokenManager(vs,basic_auth)
+			_token_managers[key] = manager
+	return manager
+
 # ITEM FUNCTIONS
 
 def search_items(vs_token_data,search_doc) -> list:
 	# use an auto refresh token if this is a long list being composed
+	# returns every item id in one list, use iter_search_items to work on them as they come in
+	logger.info('Compiling list of items.')
+	return list(iter_search_items(vs_token_data,search_doc))
+
+def iter_search_items(vs_token_data,search_doc,number=1000,prefetch=4):
+	# generator version of search_items that yields item ids as pages arrive
+	# the first page also gives us the hit count, and the next `prefetch` pages are always in flight
+	# while the caller is busy with the current one
 	vs = vs_token_data["vs"]
+	as_json = transport == 'json'
+	for page in iter_search_pages(vs_token_data,search_doc,f'{vs}API/item',number,prefetch,as_json):
+		if as_json:
+			for item in json_list(page, 'item'):
+				yield item['id']
+		else:
+			for item in page.findall('item'):
+				yield item.attrib['id']
+
+def iter_search_pages(vs_token_data,search_doc,url,number=1000,prefetch=4,as_json=False):
+	# yields each xml prepped page of a paged PUT search in order, json prepped with as_json
+	# url is the search endpoint without matrix params, e.g. f'{vs}API/item'
 	token = vs_token_data["token"]
-	url = f'{vs}API/item'
 	headers = {
-		'Accept': 'application/xml',
+		'Accept': 'application/json' if as_json else 'application/xml',
 		'Content-type': 'application/xml',
 		'Authorization': f'token {token}'
 	}
-	data = search_doc
-	response = requests.request("PUT", url, headers=headers, data=data, verify=crt_file)
-	item_list_doc = xml_prep(response)
-	hits = int(item_list_doc.find('hits').text)
+	if as_json:
+		headers['Accept-Encoding'] = 'gzip'
+	base_url, _, query = url.partition('?')
+	query = f'?{query}' if query else ''
+
+	def get_page(first):
+		response = vs_request("PUT", f'{base_url};first={first};number={number}{query}', headers=headers, data=search_doc)
+		return json_prep(response) if as_json else xml_prep(response)
+
+	page = get_page(1)
+	hits = int(page.get('hits', 0) if as_json else page.find('hits').text)
 	logger.info(f'There are {str(hits)} hits returned in this search.')
-	logger.info('Compiling list of items.')
-	number = 1000
-	first = 1
-	item_list = []
-	while hits >= first:
-		url = vs+'API/item;first=%s;number=%s' %(str(first),str(number))
-		response = requests.request("PUT", url, headers=headers, data=data, verify=crt_file)
-		items = xml_prep(response)
-		for item in items.findall('item'):
-			item_id = item.attrib['id']
-			item_list.append(item_id)
-		first = first + number
-	return item_list
+	yield page
+	yield from prefetch_pages(get_page, range(1 + number, hits + 1, number), prefetch)
+
+def prefetch_pages(get_page, firsts, prefetch=4):
+	# yields get_page(first) for each first in order, keeping the next `prefetch` pages in flight
+	# on a thread pool while the caller works on the current one
+	firsts = iter(firsts)
+	with ThreadPoolExecutor(max_workers=max(prefetch, 1)) as executor:
+		pending = deque()
+		for first in firsts:
+			pending.append(executor.submit(get_page, first))
+			if len(pending) >= prefetch:
+				break
+		try:
+			while pending:
+				page = pending.popleft().result()
+				next_first = next(firsts, None)
+				if next_first is not None:
+					pending.append(executor.submit(get_page, next_first))
+				yield page
+		finally:
+			# caller stopped early, don't wait on pages nobody will read
+			for future in pending:
+				future.cancel()
 
 def put_item_metadata(vs_token_data,item_id,metadata_doc):
 	# metadata_doc can be an xml or a dict which will be converted to a json string
@@ -175,7 +1404,10 @@ def put_item_metadata(vs_token_data,item_id,metadata_doc):
 			'Content-Type': 'application/xml',
 			'Authorization': f'token {token}'
 		}
-	response = requests.request("PUT", url, headers=headers, data=metadata_doc, verify=crt_file)
+	with trace_span('metadata write', item_id=item_id):
+		response = vs_request("PUT", url, headers=headers, data=metadata_doc)
+	# even a failed PUT may have partly applied, so always drop what we had
+	invalidate_item(vs, item_id, _metadata_kinds)
 	if response.status_code >= 300:
 		logger.error('PUT vs metadata status: %s content: %s' % (str(response.status_code),response.text))
 		return response.status_code
@@ -191,7 +1423,7 @@ def is_mapped(vs_token_data,item_id):
 		'Accept': 'application/xml',
 		'Authorization': f'token {token}'
 	}
-	response = requests.request("GET", url, headers=headers, verify=crt_file)
+	response = vs_request("GET", url, headers=headers)
 	metadata = xml_prep(response)
 	try:
 		indab_master_id = metadata.find('item/metadata/timespan/group/field/value').text
@@ -204,20 +1436,34 @@ def is_mapped(vs_token_data,item_id):
 		# doesn't have the field
 		return False
 
-def get_system_metadata_value(vs_token_data,item_id,field) -> str:
+def get_system_metadata_value(vs_token_data,item_id,field,snapshot=None) -> str:
 	# returns a string of the system metadata value
 	# returns False if it can't find it
+	# pass an ItemMetadata snapshot to read from it instead of making a call
+	if snapshot is not None:
+		return snapshot.get_system_value(field)
 	vs = vs_token_data["vs"]
 	token = vs_token_data["token"]
+	key = (vs, item_id, 'system', field)
+	hit, metadata_value = cache_get(key)
+	if hit:
+		return metadata_value
 	url = f'{vs}API/item/{item_id}/metadata;field={field}'
-	headers = {
-		'Accept': 'application/xml',
-		'Authorization': f'token {token}'
-	}
-	response = requests.request("GET", url, headers=headers, verify=crt_file)
-	metadata = xml_prep(response)
+	headers = read_headers(token)
+	response = vs_request("GET", url, headers=headers)
+	metadata = prep_response(response)
+	metadata_value = system_value_from_doc(metadata,field)
+	cache_put(key, metadata_value)
+	return metadata_value
+
+def system_value_from_doc(metadata,field) -> str:
+	# pulls a system field value out of an xml prepped ItemListDocument/MetadataListDocument
+	# or the json prepped version of one
 	try:
-		metadata_value = metadata.find('item/metadata/timespan/field/value').text
+		if isinstance(metadata, dict):
+			metadata_value = json_first_value(field for timespan in json_timespans(metadata) for field in json_list(timespan, 'field'))
+		else:
+			metadata_value = metadata.find('item/metadata/timespan/field/value').text
 		logger.info(f'Found value of {metadata_value} in {field} field.')
 		return metadata_value
 	except AttributeError:
@@ -225,19 +1471,32 @@ def get_system_metadata_value(vs_token_data,item_id,field) -> str:
 		logger.warning(f'Did not find metadata in {field} field.')
 		return False
 
-def get_group_metadata_value(vs_token_data,item_id,field) -> str:
+def get_group_metadata_value(vs_token_data,item_id,field,snapshot=None) -> str:
 	# returns a string from a group metadata value
 	# returns False if it can't find it
+	# pass an ItemMetadata snapshot to read from it instead of making a call
+	if snapshot is not None:
+		return snapshot.get_group_value(field)
 	vs = vs_token_data["vs"]
 	token = vs_token_data["token"]
+	key = (vs, item_id, 'group', field)
+	hit, metadata_value = cache_get(key)
+	if hit:
+		return metadata_value
 	url = f'{vs}API/item/{item_id}/metadata;field={field}'
-	headers = {
-		'Accept': 'application/xml',
-		'Authorization': f'token {token}'
-	}
-	response = requests.request("GET", url, headers=headers, verify=crt_file)
-	metadata = xml_prep(response)
+	headers = read_headers(token)
+	response = vs_request("GET", url, headers=headers)
+	metadata = prep_response(response)
+	metadata_value = group_value_from_doc(metadata,field)
+	cache_put(key, metadata_value)
+	return metadata_value
+
+def group_value_from_doc(metadata,field) -> str:
+	# pulls a group field value out of an xml prepped ItemListDocument/MetadataListDocument
+	# or the json prepped version of one
 	try:
+		if isinstance(metadata, dict):
+			return _json_group_value(metadata,field)
 		groups = metadata.findall('item/metadata/timespan/group')
 		metadata_value = ''
 		for group in groups:
@@ -255,14 +1514,166 @@ def get_group_metadata_value(vs_token_data,item_id,field) -> str:
 		logger.warning(f'Metadata field/value not found in {field} field.')
 		return False
 
-def delete_item(vs_token_data,item_id):
+def _json_group_value(metadata,field) -> str:
+	metadata_value = ''
+	for timespan in json_timespans(metadata):
+		for group in json_list(timespan, 'group'):
+			group_fields = json_list(group, 'field')
+			if group_fields and group_fields[0].get('name') == field:
+				try:
+					metadata_value = json_first_value(group_fields)
+				except AttributeError:
+					metadata_value = None
+				logger.info(f'Found value of {metadata_value} in {field} field.')
+				break
+		else:
+			continue
+		break
+	if metadata_value == '' or metadata_value == None:
+		logger.warning(f'Metadata field/value is empty in {field} field.')
+		return False
+	return metadata_value
+
+def get_metadata_values(vs_token_data,item_id,fields) -> dict:
+	# fetches a list of system and/or group fields in one request
+	# returns {field: value} with False for any field that is missing or empty
+	vs = vs_token_data["vs"]
+	token = vs_token_data["token"]
+	key = (vs, item_id, 'values', tuple(fields))
+	hit, values = cache_get(key)
+	if hit:
+		return dict(values)
+	if transport == 'json':
+		url = f'{vs}API/item/{item_id}/metadata;field={",".join(fields)}'
+	else:
+		url = f'{vs}API/item/{item_id}?content=metadata&field={",".join(fields)}&terse=true'
+	headers = read_headers(token)
+	response = vs_request("GET", url, headers=headers)
+	found = terse_values_from_doc(prep_response(response), fields)
+	values = {}
+	for field in fields:
+		metadata_value = found.get(field)
+		if metadata_value == '' or metadata_value == None:
+			logger.warning(f'Metadata field/value not found in {field} field.')
+			values[field] = False
+		else:
+			logger.info(f'Found value of {metadata_value} in {field} field.')
+			values[field] = metadata_value
+	cache_put(key, dict(values))
+	return values
+
+def terse_values_from_doc(metadata,fields) -> dict:
+	# terse output puts every field straight in as <field_name>value</field_name>, groups or not
+	# returns {field: text} for the fields found, first value wins
+	# a json prepped MetadataListDocument works too, json has no terse mode so its fields get walked
+	wanted = set(fields)
+	if isinstance(metadata, dict):
+		found = {}
+		for timespan in json_timespans(metadata):
+			json_field_values(timespan, found)
+		return {field: value for field, value in found.items() if field in wanted}
+	found = {}
+	for element in metadata.iter():
+		if element.tag in wanted and element.tag not in found:
+			found[element.tag] = element.text
+	return found
+
+def iter_search_values(vs_token_data,search_doc,fields,number=1000,prefetch=4):
+	# yields (item_id, {field: value}) for every hit of search_doc with the fields projected inline
+	# (content=metadata&field=...&terse=true), so filtering hits doesn't need a GET per hit per field
+	# missing or empty fields are False, same as get_metadata_values. each item's values also go in
+	# the read cache so a get_metadata_values for the same fields afterwards doesn't hit VS
+	vs = vs_token_data["vs"]
+	fields = list(fields)
+	url = f'{vs}API/item?content=metadata&field={",".join(fields)}&terse=true'
+	for page in iter_search_pages(vs_token_data,search_doc,url,number,prefetch):
+		for item in page.findall('item'):
+			item_id = item.attrib['id']
+			found = terse_values_from_doc(item, fields)
+			values = {field: found.get(field) or False for field in fields}
+			cache_put((vs, item_id, 'values', tuple(fields)), dict(values))
+			yield item_id, values
+
+def search_item_values(vs_token_data,search_doc,fields) -> dict:
+	# {item_id: {field: value}} for every hit, in hit order
+	return dict(iter_search_values(vs_token_data,search_doc,fields))
+
+class ItemMetadata:
+	# snapshot of all of an item's metadata from a single GET
+	# every system field and every (nested) group field is indexed by name, first value wins,
+	# same as the ;field= lookups. use it anywhere a script reads more than a couple of fields:
+	#   snapshot = eng_vs_token.ItemMetadata(vs_token_data,item_id)
+	#   subtype = eng_vs_token.get_group_metadata_value(vs_token_data,item_id,'file_information_subtype',snapshot=snapshot)
+
+	def __init__(self, vs_token_data, item_id):
+		self.item_id = item_id
+		self.system_fields = {}
+		self.group_fields = {}
+		self.refresh(vs_token_data)
+
+	def refresh(self, vs_token_data):
+		vs = vs_token_data["vs"]
+		token = vs_token_data["token"]
+		url = f'{vs}API/item/{self.item_id}/metadata'
+		headers = {
+			'Accept': 'application/xml',
+			'Authorization': f'token {token}'
+		}
+		response = vs_request("GET", url, headers=headers)
+		self.load(xml_prep(response))
+		logger.info(f'Loaded {len(self.system_fields)} system and {len(self.group_fields)} group fields for {self.item_id}.')
+
+	def load(self, metadata):
+		# metadata is an xml prepped ItemListDocument/MetadataListDocument
+		self.system_fields = {}
+		self.group_fields = {}
+		for timespan in metadata.findall('.//metadata/timespan'):
+			for field in timespan.findall('field'):
+				self.system_fields.setdefault(field.find('name').text, self._first_value(field))
+			for field in timespan.findall('.//group/field'):
+				self.group_fields.setdefault(field.find('name').text, self._first_value(field))
+
+	@staticmethod
+	def _first_value(field):
+		# False means the field has no <value> at all, None means an empty <value/>,
+		# the same two answers the old field=... calls gave
+		value = field.find('value')
+		if value is None:
+			return False
+		return value.text
+
+	def get_system_value(self, field) -> str:
+		# same return values as get_system_metadata_value
+		if self.system_fields.get(field, False) is False:
+			logger.warning(f'Did not find metadata in {field} field.')
+			return False
+		metadata_value = self.system_fields[field]
+		logger.info(f'Found value of {metadata_value} in {field} field.')
+		return metadata_value
+
+	def get_group_value(self, field) -> str:
+		# same return values as get_group_metadata_value
+		metadata_value = self.group_fields.get(field)
+		if metadata_value is False or metadata_value == '' or metadata_value == None:
+			logger.warning(f'Metadata field/value is empty in {field} field.')
+			return False
+		logger.info(f'Found value of {metadata_value} in {field} field.')
+		return metadata_value
+
+def delete_item(vs_token_data,item_id,remove_locks=False):
+	# remove_locks=True clears the deletion locks on every file of every shape first
+	if remove_locks:
+		index = get_shape_index(vs_token_data,item_id)
+		file_ids = [entry['id'] for tag in index.tags() for entry in index.files(tag)]
+		delete_all_locks(vs_token_data,file_ids)
 	vs = vs_token_data["vs"]
 	token = vs_token_data["token"]
 	url = f'{vs}API/item/{item_id}'
 	headers = {
 		'Authorization': f'token {token}'
 	}
-	response = requests.request("DELETE", url, headers=headers, verify=crt_file)
+	response = vs_request("DELETE", url, headers=headers)
+	invalidate_item(vs, item_id)
 	if response.status_code < 300:
 		logger.info(f'Item ID {item_id} deleted.')
 	else:
@@ -308,6 +1719,54 @@ def make_group_metadata_doc(vs_group,vs_field,vs_value):
 
 	return metadata
 
+class MetadataBatch:
+	# collects group/field/value updates for one item and sends them as a single MetadataDocument
+	#   batch = eng_vs_token.MetadataBatch(vs_token_data,item_id)
+	#   batch.add('file_information','file_information_uwf_profile','True')
+	#   results = batch.flush()   # {'file_information_uwf_profile': 200}
+	# adding the same group/field twice keeps the last value, same as two PUTs in a row would
+
+	def __init__(self, vs_token_data, item_id):
+		self.vs_token_data = vs_token_data
+		self.item_id = item_id
+		self.updates = OrderedDict()
+
+	def add(self, vs_group, vs_field, vs_value):
+		logger.warning(f'Metadata update: group {vs_group}, field {vs_field}, value {vs_value}')
+		self.updates.setdefault(vs_group, OrderedDict())[vs_field] = vs_value
+
+	def __len__(self):
+		return sum(len(fields) for fields in self.updates.values())
+
+	def to_doc(self) -> dict:
+		# same shape as make_group_metadata_doc, just with every group and field in it
+		groups = []
+		for vs_group, fields in self.updates.items():
+			groups.append({
+				"name": vs_group,
+				"field": [{"name": vs_field, "value": [{"value": vs_value}]} for vs_field, vs_value in fields.items()]
+			})
+		return {"timespan": [{"start": "-INF", "end": "+INF", "group": groups}]}
+
+	def flush(self) -> dict:
+		# one PUT for everything added so far, returns {field: status_code}
+		if len(self) == 0:
+			return {}
+		status_code = put_item_metadata(self.vs_token_data, self.item_id, self.to_doc())
+		logger.warning(f'Batch update of {len(self)} fields status code: {status_code}')
+		results = {vs_field: status_code for fields in self.updates.values() for vs_field in fields}
+		self.updates = OrderedDict()
+		return results
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, tb):
+		# only write if the block finished cleanly
+		if exc_type is None:
+			self.flush()
+		return False
+
 def determine_run_time(token_data, item_id, workflow, env):
 	logger.warning(f'Starting Run Time Update for {item_id} {workflow} in {env} environment')
 	workflows = {
@@ -379,7 +1838,10 @@ def build_json(token_data, item_id, env):
 	else:
 		target_system = env
 
-	subtype = get_group_metadata_value(token_data,item_id,'file_information_subtype')
+	# every field this report reads comes out of one metadata GET
+	snapshot = ItemMetadata(token_data,item_id)
+
+	subtype = get_group_metadata_value(token_data,item_id,'file_information_subtype',snapshot=snapshot)
 
 	if 'mezz' in subtype.lower():
 		subtype = 'mezz'
@@ -392,8 +1854,8 @@ def build_json(token_data, item_id, env):
 		exit(0)
 	logger.warning(f'Subtype: {subtype}')
 
-	aggregate_result = get_group_metadata_value(token_data,item_id,'aggregate_test_result')
-	file_name = get_system_metadata_value(token_data,item_id,'originalFilename')
+	aggregate_result = get_group_metadata_value(token_data,item_id,'aggregate_test_result',snapshot=snapshot)
+	file_name = get_system_metadata_value(token_data,item_id,'originalFilename',snapshot=snapshot)
 
 	report['qc_report']['title'] = title
 	report['qc_report']['aggregate_result'] = aggregate_result.upper()
@@ -413,9 +1875,9 @@ def build_json(token_data, item_id, env):
 		for y in x.findall('sub_section'):
 			t = {'test':[],'_name':y.attrib['name']}
 			for z in y.findall('test'):
-				result = get_group_metadata_value(token_data,item_id,z.find('result_source').text)
+				result = get_group_metadata_value(token_data,item_id,z.find('result_source').text,snapshot=snapshot)
 				if result:
-					description = get_group_metadata_value(token_data,item_id,z.find('description_source').text)
+					description = get_group_metadata_value(token_data,item_id,z.find('description_source').text,snapshot=snapshot)
 					r = {'_name':z.attrib['name'],'result':result.upper(),'description':description}
 					t['test'].append(r)
 			s['sub_section'].append(t)
@@ -442,49 +1904,242 @@ def get_shape_ids(vs: str, token: str, item_id: str, shapetag: str) -> list:
 	shapes as "uri" elements.
 	get each VX id of the requested shape tag and construct a list
 	'''
+	key = (vs, item_id, 'shape_ids', shapetag)
+	hit, shape_ids = cache_get(key)
+	if hit:
+		return list(shape_ids)
 	url = f'{vs}API/item/{item_id}/shape?tag={shapetag}'
 	headers = {
 		'Accept': f'application/json',
 		'Authorization': f'token {token}'
 	}
 	try:
-		response = requests.request("GET", url, headers=headers, verify=crt_file)
+		response = vs_request("GET", url, headers=headers)
 		response.raise_for_status()  # Raises an HTTPError if the response was unsuccessful
 		uri_list_doc = response.json()
 	except HTTPError as http_err:
-		logger.error(f'HTTP error occurred: {http_err}', extra=extras)
+		logger.error(f'HTTP error occurred: {http_err}')
 		exit(1)
 	except Exception as err:
-		logger.error(f'Other error occurred: {err}', extra=extras)
+		logger.error(f'Other error occurred: {err}')
 		exit(1)
 	# make list to return
 	shape_ids = []
 	if "uri" in uri_list_doc:
 		for uri in uri_list_doc["uri"]:
 			shape_ids.append(uri)
-		return shape_ids
 	else:
 		logger.info(f"Shape tag {shapetag}, not found in item {item_id}")
-		return shape_ids
+	cache_put(key, list(shape_ids))
+	return shape_ids
 
 def get_shape_document(vs: str, token: str, item_id: str, shapetag: str) -> list:
+	# the raw xml is cached and parsed per call so every caller gets its own tree
+	key = (vs, item_id, 'shape', shapetag)
+	hit, content = cache_get(key)
+	if hit:
+		return parse_vs_xml(content)
 	url = f'{vs}API/item/{item_id}?content=shape&tag={shapetag}'
 	headers = {
 		'Authorization': f'token {token}'
 	}
 	try:
-		response = requests.get(url, headers=headers, verify=crt_file)
+		response = vs_request("GET", url, headers=headers)
 		response.raise_for_status()  # Raises an HTTPError if the response was unsuccessful
-		return xml_prep(response)
+		shape = xml_prep(response)
+		cache_put(key, response.content)
+		return shape
 	except HTTPError as http_err:
-		logger.error(f'HTTP error occurred: {http_err}', extra=extras)
+		logger.error(f'HTTP error occurred: {http_err}')
 		exit(1)
 	except Exception as err:
-		logger.error(f'Other error occurred: {err}', extra=extras)
+		logger.error(f'Other error occurred: {err}')
 		exit(1)
 
+class ShapeIndex:
+	# every shape on an item from one content=shape GET, indexed by tag and storage
+	#   index = eng_vs_token.ShapeIndex(vs_token_data,item_id)
+	#   index.shape_ids('original')             -> ['VX-123']
+	#   index.storages('original')              -> ['VX-143','VX-266']
+	#   index.file('original','VX-143')         -> {'id','uri','path','state','timestamp','storage'}
+	#   index.current_storage(local_storage)    -> first storage in the list that has the shape, or False
+	# storage_presence, current_storage_id, find_storage_id and download_from_s3 all take one of these
+
+	def __init__(self, vs_token_data, item_id, document=None):
+		# pass document (an xml prepped ItemDocument with content=shape) to build from something already fetched
+		self.item_id = item_id
+		self.shapes = {}
+		if document is None:
+			document = self._fetch(vs_token_data, item_id)
+		self.load(document)
+
+	@staticmethod
+	def _fetch(vs_token_data, item_id):
+		vs = vs_token_data["vs"]
+		token = vs_token_data["token"]
+		url = f'{vs}API/item/{item_id}?content=shape'
+		headers = read_headers(token)
+		response = vs_request("GET", url, headers=headers)
+		response.raise_for_status()
+		return prep_response(response)
+
+	@staticmethod
+	def _file_entry(file):
+		entry = {}
+		for key in ['id','uri','path','state','timestamp','storage']:
+			element = file.find(key)
+			entry[key] = element.text if element is not None else None
+		return entry
+
+	@staticmethod
+	def _json_file_entry(file):
+		entry = {}
+		for key in ['id','uri','path','state','timestamp','storage']:
+			value = file.get(key)
+			# uri is a list in json
+			entry[key] = value[0] if isinstance(value, list) and value else value or None
+		return entry
+
+	@staticmethod
+	def _json_files(node):
+		# every file under a json shape, in document order like .//file
+		if isinstance(node, list):
+			for child in node:
+				yield from ShapeIndex._json_files(child)
+		elif isinstance(node, dict):
+			for key, child in node.items():
+				if key == 'file':
+					yield from json_list(node, 'file')
+				elif isinstance(child, (dict, list)):
+					yield from ShapeIndex._json_files(child)
+
+	def _shape_entries(self, document):
+		# (shape id, tags, file entries) for every shape in the document
+		if isinstance(document, dict):
+			for shape in json_list(document, 'shape'):
+				files = [self._json_file_entry(file) for file in self._json_files(shape)]
+				yield shape.get('id'), json_list(shape, 'tag'), files
+		else:
+			for shape in document.iter('shape'):
+				files = [self._file_entry(file) for file in shape.findall('.//file')]
+				yield shape.findtext('id'), [tag.text for tag in shape.findall('tag')], files
+
+	def load(self, document):
+		# {tag: {'shape_ids': [...], 'files': {storage: [file entries in document order]}}}
+		# document can be xml prepped or json prepped
+		self.shapes = {}
+		for shape_id, tags, entries in self._shape_entries(document):
+			files = {}
+			seen = set()
+			for entry in entries:
+				# the same file shows up under every component it belongs to
+				if entry['id'] in seen:
+					continue
+				seen.add(entry['id'])
+				files.setdefault(entry['storage'], []).append(entry)
+			for tag in tags:
+				indexed = self.shapes.setdefault(tag, {'shape_ids': [], 'files': {}})
+				indexed['shape_ids'].append(shape_id)
+				for storage, entries in files.items():
+					indexed['files'].setdefault(storage, []).extend(entries)
+
+	def tags(self) -> list:
+		return list(self.shapes.keys())
+
+	def shape_ids(self, shapetag) -> list:
+		return list(self.shapes.get(shapetag, {}).get('shape_ids', []))
+
+	def storages(self, shapetag='original') -> list:
+		return list(self.shapes.get(shapetag, {}).get('files', {}).keys())
+
+	def files(self, shapetag='original', storage=None) -> list:
+		# every file entry for the tag, or only the ones on storage (a storage id or a list of them)
+		files = self.shapes.get(shapetag, {}).get('files', {})
+		if storage is None:
+			return [entry for entries in files.values() for entry in entries]
+		if isinstance(storage, str):
+			storage = [storage]
+		return [entry for storage_id in files if storage_id in storage for entry in files[storage_id]]
+
+	def file(self, shapetag, storage) -> dict:
+		# first file entry on storage, None if the shape isn't there
+		files = self.files(shapetag, storage)
+		return files[0] if files else None
+
+	def has_storage(self, storage, shapetag='original') -> bool:
+		return self.file(shapetag, storage) is not None
+
+	def current_storage(self, storage_list, shapetag='original'):
+		present = self.shapes.get(shapetag, {}).get('files', {})
+		for storage in storage_list:
+			if storage in present:
+				return storage
+		return False
+
+def get_shape_index(vs_token_data,item_id) -> ShapeIndex:
+	# cached version of ShapeIndex(vs_token_data,item_id)
+	key = (vs_token_data["vs"], item_id, 'shape_index', None)
+	hit, index = cache_get(key)
+	if hit:
+		return copy.deepcopy(index)
+	index = ShapeIndex(vs_token_data,item_id)
+	cache_put(key, copy.deepcopy(index))
+	return index
+
+def make_item_id_search_doc(item_ids) -> str:
+	# ItemSearchDocument that matches exactly these item ids
+	values = ''.join(f'<value>{item_id}</value>' for item_id in item_ids)
+	return f'<ItemSearchDocument xmlns="{VS_NAMESPACE}"><field><name>itemId</name>{values}</field></ItemSearchDocument>'
+
+def iter_search_shapes(vs_token_data,search_doc,shapetag=None,number=500,prefetch=4):
+	# yields (item_id, ShapeIndex) for every hit of search_doc, number items' shapes per request
+	# with shapetag only that tag's shapes come back, otherwise all of them
+	vs = vs_token_data["vs"]
+	query = 'content=shape' + (f'&tag={shapetag}' if shapetag else '')
+	for page in iter_search_pages(vs_token_data,search_doc,f'{vs}API/item?{query}',number,prefetch):
+		for item in page.findall('item'):
+			item_id = item.attrib['id']
+			yield item_id, ShapeIndex(vs_token_data,item_id,document=item)
+
+def get_shape_indexes(vs_token_data,item_ids=None,search_doc=None,shapetag=None,number=500,prefetch=4) -> dict:
+	# bulk get_shape_index, {item_id: ShapeIndex} from paged content=shape searches instead of a GET per item
+	# pass item_ids (any iterable) or a search_doc. ids are looked up number at a time with up to
+	# prefetch searches in flight, ids VS doesn't know are left out of the dict
+	vs = vs_token_data["vs"]
+	if search_doc is not None:
+		indexes = dict(iter_search_shapes(vs_token_data,search_doc,shapetag,number,prefetch))
+		if shapetag is None:
+			for item_id, index in indexes.items():
+				cache_put((vs, item_id, 'shape_index', None), copy.deepcopy(index))
+		return indexes
+	indexes = {}
+	wanted = []
+	for item_id in dict.fromkeys(item_ids):
+		# a tag filtered index isn't the full index, so only the untagged lookups share the cache
+		hit, index = cache_get((vs, item_id, 'shape_index', None)) if shapetag is None else (False, None)
+		if hit:
+			indexes[item_id] = copy.deepcopy(index)
+		else:
+			wanted.append(item_id)
+	chunks = [wanted[i:i + number] for i in range(0, len(wanted), number)]
+
+	def fetch_chunk(chunk):
+		return dict(iter_search_shapes(vs_token_data,make_item_id_search_doc(chunk),shapetag,number,prefetch=1))
+
+	for result in map_items(fetch_chunk, chunks, concurrency=prefetch, progress=None):
+		if not result.ok:
+			raise result.error
+		for item_id, index in result.value.items():
+			indexes[item_id] = index
+			if shapetag is None:
+				cache_put((vs, item_id, 'shape_index', None), copy.deepcopy(index))
+	missing = [item_id for item_id in wanted if item_id not in indexes]
+	if missing:
+		logger.warning(f'No shapes returned for {len(missing)} item(s): {", ".join(missing[:20])}')
+	return indexes
+
 def download_from_s3(vs_token_data,shape,target_storage,s3_storage,item_id,original_filename):
-	# expects shape to be xml prepped
+	# expects shape to be xml prepped or a ShapeIndex
 	vs = vs_token_data['vs']
 	token = vs_token_data['token']
 	headers = {
@@ -496,7 +2151,7 @@ def download_from_s3(vs_token_data,shape,target_storage,s3_storage,item_id,origi
 	if state not in ['CLOSED','ARCHIVED']:
 		return False
 	url = f'{vs}API/storage/{current_storage}/file/{file_id}/storage/{target_storage}?move=false&jobmetadata=ind_filename={original_filename}&jobmetadata=itemId={item_id}'
-	download = requests.post(url,headers=headers)
+	download = vs_request("POST", url, headers=headers)
 	job_doc = xml_prep(download)
 	return job_doc.find('jobId').text
 
@@ -507,7 +2162,7 @@ def shape_presence(vs_token_data,item_id,shapetag):
 		'Authorization': f'token {token}'
 	}
 	metadata_url = f'{vs}API/item/{item_id}?content=metadata&terse=true'
-	metadata = xml_prep(requests.get(metadata_url,headers=headers))
+	metadata = xml_prep(vs_request("GET", metadata_url, headers=headers))
 	for field in metadata.findall('field'):
 		if field.find('name').text == 'shapeTag':
 			for shape in field.findall('value'):
@@ -543,18 +2198,11 @@ def handle_bad_audio(vs_token_data, item_id, audio_profile_number, env):
         'aggregate_test':[('status','Completed'),('end',time),('date',time),('result','Fail')]
     }
 
+    batch = MetadataBatch(vs_token_data,item_id)
     for group in updates:
         for dataset in updates[group]:
-            vs_group = group
-            vs_field = f'{group}_{dataset[0]}'
-            vs_value = dataset[1]
-            logger.warning(f'Metadata update: group {vs_group}, field {vs_field}, value {vs_value}')
-            metadata = {"timespan": [{"start": "-INF","end": "+INF",
-                                     "group": [{"name": vs_group,
-                                                "field": [{"name": vs_field,
-                                                           "value": [{"value": vs_value}]}]}]}]}
-            u = put_item_metadata(vs_token_data,item_id,metadata)
-            logger.warning(f'Update status code: {u}')
+            batch.add(group, f'{group}_{dataset[0]}', dataset[1])
+    batch.flush()
             
     determine_run_time(vs_token_data, item_id, 'qc', env)
     build_json(item_id, env)
@@ -565,8 +2213,13 @@ def handle_bad_audio(vs_token_data, item_id, audio_profile_number, env):
 
 # STORAGE FUNCTIONS
 
-def find_storage_id(shape, storage_type, target):
-	# expects shape to be xml prepped
+def find_storage_id(shape, storage_type, target, shapetag='original'):
+	# expects shape to be xml prepped or a ShapeIndex (shapetag is only used for a ShapeIndex)
+	if isinstance(shape, ShapeIndex):
+		for file in shape.files(shapetag):
+			if file['storage'] in storage_type:
+				return file['id'] if target == 'file' else file['storage']
+		return None
 	for file in shape.findall('.//file'):
 		if file.find('storage').text in storage_type:
 			if target == 'file':
@@ -575,8 +2228,33 @@ def find_storage_id(shape, storage_type, target):
 				result = file.find('storage').text
 			return result
 
-def get_storage_groups(vs_token_data,group_name):
-	# returns list of all ID values connected to a storage group name
+# storage topology barely ever changes, so storage names and groups are cached on disk per vs
+# and shared by every process on the box. set storage_cache_ttl to 0 to always ask VS
+storage_cache_ttl = 12 * 60 * 60
+
+_storage_topology = {}
+_storage_topology_lock = threading.Lock()
+
+def _fetch_storage_names(vs_token_data) -> dict:
+	# {storage name: storage id} for every storage
+	vs = vs_token_data["vs"]
+	token = vs_token_data["token"]
+	url = f'{vs}API/storage'
+	headers = {
+		'Accept': 'application/xml',
+		'Authorization': f'token {token}'
+	}
+	response = vs_request("GET", url, headers=headers)
+	response.raise_for_status()
+	storage_list_doc = xml_prep(response)
+	names = {}
+	for storage in storage_list_doc.findall('storage'):
+		for field in storage.findall('metadata/field'):
+			if field.find('key').text == 'name':
+				names.setdefault(field.find('value').text, storage.find('id').text)
+	return names
+
+def _fetch_storage_group(vs_token_data,group_name) -> list:
 	vs = vs_token_data["vs"]
 	token = vs_token_data["token"]
 	url = f'{vs}API/storage/storage-group/{group_name}'
@@ -584,35 +2262,86 @@ def get_storage_groups(vs_token_data,group_name):
 		'Accept': 'application/xml',
 		'Authorization': f'token {token}'
 	}
-	response = requests.get(url, headers=headers, verify=crt_file)
+	response = vs_request("GET", url, headers=headers)
+	response.raise_for_status()
 	results = xml_prep(response)
 	storage_ids = []
 	for storage in results.findall('storage'):
 		storage_ids.append(storage.find('id').text)
 	return storage_ids
 
-def get_storage_id_from_name(vs_token_data,storage_name) -> str:
-	# use the storage name to locate and return the storage id
+def _storage_entry(vs_token_data, section, key, fetch, force=False, max_age=None):
+	# looks up topology[section][key] in memory, then on disk, then from VS
+	# entries are {'fetched': epoch seconds, 'value': ...}, each with its own age
+	# max_age overrides storage_cache_ttl for this one lookup
 	vs = vs_token_data["vs"]
-	token = vs_token_data["token"]
-	url = f'{vs}API/storage'
-	headers = {
-		'Accept': 'application/xml',
-		'Authorization': f'token {token}'
-	}
-	response = requests.request("GET", url, headers=headers, verify=crt_file)
-	#print(response.status_code)
-	storage_list_doc = xml_prep(response)
-	storages = []
-	for storage in storage_list_doc.findall('storage'):
-		for field in storage.findall('metadata/field'):
-			if field.find('key').text == 'name':
-				name = field.find('value').text
-				if name == storage_name:
-					storage_id = storage.find('id').text
-					return storage_id
+	now = time.time()
+	max_age = storage_cache_ttl if max_age is None else max_age
+
+	def fresh(entry):
+		return entry is not None and now - entry['fetched'] < max_age
+
+	with _storage_topology_lock:
+		topology = _storage_topology.get(vs)
+		entry = topology.get(section, {}).get(key) if topology else None
+		if not force and fresh(entry):
+			return entry['value']
 
-def storage_presence(vs_token_data,item_id,storage,shapetag='original'):
+	fetched = None
+	try:
+		path = disk_cache_path(vs, 'storage_topology.json')
+		with file_lock(path):
+			# someone else may have refreshed it while we waited on the lock
+			topology = read_json_file(path) or {}
+			entry = topology.get(section, {}).get(key)
+			if force or not fresh(entry):
+				logger.info(f'Refreshing storage topology {section} {key} from {vs}.')
+				entry = fetched = {'fetched': now, 'value': fetch()}
+				topology.setdefault(section, {})[key] = entry
+				write_json_file(path, topology)
+	except OSError as e:
+		# requests errors are OSErrors too, those are VS failing and go to the caller
+		if isinstance(e, requests.exceptions.RequestException):
+			raise
+		# the disk cache is only a cache (read only tmp, lock file owned by another user...), go to VS
+		logger.debug(f'Storage topology disk cache unavailable ({e}), using VS directly.')
+		if fetched is None:
+			fetched = {'fetched': now, 'value': fetch()}
+		with _storage_topology_lock:
+			topology = _storage_topology.setdefault(vs, {})
+			topology.setdefault(section, {})[key] = fetched
+		return fetched['value']
+	with _storage_topology_lock:
+		_storage_topology[vs] = topology
+	return entry['value']
+
+def refresh_storage_topology(vs_token_data, groups=('local','cloud','library')):
+	# force a refresh of the storage names and the given groups, e.g. right after adding a storage
+	_storage_entry(vs_token_data, 'names', 'all', lambda: _fetch_storage_names(vs_token_data), force=True)
+	for group_name in groups:
+		_storage_entry(vs_token_data, 'groups', group_name, lambda: _fetch_storage_group(vs_token_data,group_name), force=True)
+
+def get_storage_groups(vs_token_data,group_name):
+	# returns list of all ID values connected to a storage group name
+	if storage_cache_ttl <= 0:
+		return _fetch_storage_group(vs_token_data,group_name)
+	return list(_storage_entry(vs_token_data, 'groups', group_name, lambda: _fetch_storage_group(vs_token_data,group_name)))
+
+def get_storage_id_from_name(vs_token_data,storage_name) -> str:
+	# use the storage name to locate and return the storage id
+	if storage_cache_ttl <= 0:
+		return _fetch_storage_names(vs_token_data).get(storage_name)
+	names = _storage_entry(vs_token_data, 'names', 'all', lambda: _fetch_storage_names(vs_token_data))
+	if storage_name not in names:
+		# could be brand new, check VS again unless the list is only a few minutes old
+		names = _storage_entry(vs_token_data, 'names', 'all', lambda: _fetch_storage_names(vs_token_data), max_age=300)
+	return names.get(storage_name)
+
+def storage_presence(vs_token_data,item_id,storage,shapetag='original',index=None):
+	# storage can be a storage id or a list of them
+	# pass a ShapeIndex as index to answer from it instead of fetching the shape
+	if index is not None:
+		return index.has_storage(storage, shapetag)
 	vs = vs_token_data["vs"]
 	token = vs_token_data["token"]
 	shape = get_shape_document(vs, token, item_id, shapetag)
@@ -623,14 +2352,14 @@ def storage_presence(vs_token_data,item_id,storage,shapetag='original'):
 			return True
 	return False
 
-def current_storage_id(vs_token_data,item_id,storage_list,shapetag='original'):
-	for storage in storage_list:
-		if storage_presence(vs_token_data,item_id,storage,shapetag):
-			return storage
-	return False
+def current_storage_id(vs_token_data,item_id,storage_list,shapetag='original',index=None):
+	# returns the first storage in storage_list that has the shape, False if none do
+	if index is None:
+		index = ShapeIndex(vs_token_data,item_id,get_shape_document(vs_token_data["vs"],vs_token_data["token"],item_id,shapetag))
+	return index.current_storage(storage_list, shapetag)
 
-def delete_locks(vs_token_data,file_id):
-	# delete all locks on a file
+def get_lock_ids(vs_token_data,file_id) -> list:
+	# ids of every deletion lock on a file
 	vs = vs_token_data["vs"]
 	token = vs_token_data["token"]
 	url = f'{vs}API/storage/file/{file_id}/deletion-lock'
@@ -638,15 +2367,17 @@ def delete_locks(vs_token_data,file_id):
 		'Accept': 'application/xml',
 		'Authorization': f'token {token}'
 	}
-	response = requests.request("GET", url, headers=headers, verify=crt_file)
+	response = vs_request("GET", url, headers=headers)
+	response.raise_for_status()
 	deletion_locks = xml_prep(response)
-	if len(deletion_locks) > 0:
-		index = 1
-		while index <= len(deletion_locks):
-			lock_id = deletion_locks.find(f'lock[{index}]/id').text
-			delete_lock(vs,vs_auth,lock_id)
-			index += 1
+	return [lock.findtext('id') for lock in deletion_locks.findall('lock')]
+
+def delete_locks(vs_token_data,file_id):
+	# delete all locks on a file
+	result = delete_all_locks(vs_token_data,[file_id],concurrency=4)[file_id]
+	if result['locks'] and not result['failed'] and not result['error']:
 		logger.info(f'all locks deleted for {file_id}.')
+	return result
 
 def delete_lock(vs_token_data,lock_id):
 	# partner function to delete_locks
@@ -657,29 +2388,89 @@ def delete_lock(vs_token_data,lock_id):
 		'Accept': 'application/xml',
 		'Authorization': f'token {token}'
 	}
-	response = requests.request("DELETE", url, headers=headers, verify=crt_file)
+	response = vs_request("DELETE", url, headers=headers)
 	return response.status_code
 
+def delete_all_locks(vs_token_data,file_ids,concurrency=10) -> dict:
+	# clears the deletion locks on many files before a bulk delete
+	# lock lists are fetched concurrently, then every lock goes through one bounded pool of deletes
+	# returns {file_id: {'locks': n, 'deleted': n, 'failed': [lock ids], 'error': None or why the
+	# lock list couldn't be read}}. a file is clear when failed is empty and error is None
+	file_ids = list(dict.fromkeys(file_ids))
+	results = {}
+	lock_owner = {}
+	for listed in map_items(lambda file_id: get_lock_ids(vs_token_data,file_id), file_ids, concurrency, progress=None):
+		if not listed.ok:
+			logger.error(f'Could not list deletion locks for {listed.item_id}: {listed.error}')
+			results[listed.item_id] = {'locks': 0, 'deleted': 0, 'failed': [], 'error': str(listed.error)}
+			continue
+		results[listed.item_id] = {'locks': len(listed.value), 'deleted': 0, 'failed': [], 'error': None}
+		for lock_id in listed.value:
+			lock_owner[lock_id] = listed.item_id
+	if lock_owner:
+		logger.info(f'Deleting {len(lock_owner)} deletion lock(s) on {len(file_ids)} file(s).')
+	for deleted in map_items(lambda lock_id: delete_lock(vs_token_data,lock_id), list(lock_owner), concurrency, progress=None):
+		result = results[lock_owner[deleted.item_id]]
+		# a 404 means the lock is already gone, which is what we wanted anyway
+		if deleted.ok and (deleted.value < 300 or deleted.value == 404):
+			result['deleted'] += 1
+		else:
+			logger.warning(f'Deletion lock {deleted.item_id} on {lock_owner[deleted.item_id]} NOT deleted: {deleted.error or deleted.value}')
+			result['failed'].append(deleted.item_id)
+	return results
 
-def delete_unknown(vs_token_data,file_id):
-	# deletes unknown files from solr
+_solr_paths = {}
+
+def get_solr_path(vs_token_data) -> str:
+	# the solrpath configuration property, looked up once per vs per process
 	vs = vs_token_data["vs"]
-	token = vs_token_data["token"]
-	url = f'{vs}API/configuration/properties/solrpath'
-	headers = {
-		'Accept': 'application/xml',
-		'Authorization': f'token {token}'
-	}
-	response = requests.request("GET", url, headers=headers, verify=crt_file)
-	res = xml_prep(response)
-	solr = res.find('value').text
-	solr_url = f'{solr}/update?commit=true'
-	payload = f'<delete><query>entityId:{file_id} AND type:File</query></delete>'
+	solr = _solr_paths.get(vs)
+	if solr is None:
+		url = f'{vs}API/configuration/properties/solrpath'
+		headers = {
+			'Accept': 'application/xml',
+			'Authorization': f'token {vs_token_data["token"]}'
+		}
+		response = vs_request("GET", url, headers=headers)
+		res = xml_prep(response)
+		solr = _solr_paths[vs] = res.find('value').text
+	return solr
+
+# ids per solr delete query, keep well under solr's maxBooleanClauses (1024 by default)
+solr_delete_batch_size = 500
+
+def delete_unknown_files(vs_token_data,file_ids,batch_size=None,commit='hard') -> int:
+	# deletes unknown files from solr, batch_size ids per OR'd delete-by-query
+	# commit='hard' commits once per batch, 'soft' asks for a soft commit per batch and
+	# None leaves it to solr's autocommit. returns how many ids were sent
+	vs = vs_token_data["vs"]
+	solr = get_solr_path(vs_token_data)
+	batch_size = batch_size or solr_delete_batch_size
+	params = {'hard': '?commit=true', 'soft': '?softCommit=true'}.get(commit, '')
 	headers = {'Content-Type': 'text/xml; charset=utf-8'}
-	response = requests.request("POST", solr_url, headers=headers, data = payload)
+	file_ids = list(file_ids)
+	for i in range(0, len(file_ids), batch_size):
+		batch = file_ids[i:i + batch_size]
+		entity_ids = ' OR '.join(f'"{file_id}"' for file_id in batch)
+		payload = f'<delete><query>type:File AND entityId:({entity_ids})</query></delete>'
+		# deleting the same ids twice is harmless, so let the retry policy resend it
+		response = vs_request("POST", f'{solr}/update{params}', idempotent=True, headers=headers, data=payload)
+		# unlike the old delete_unknown a solr error raises, so UnknownFileCleaner counts the batch as failed
+		response.raise_for_status()
+		logger.info(f'Deleted {len(batch)} UNKNOWN file(s) from solr.')
+	if file_ids:
+		invalidate_item(vs, kinds=_shape_kinds)
+	return len(file_ids)
+
+def delete_unknown(vs_token_data,file_id):
+	# deletes one unknown file from solr, use delete_unknown_files or UnknownFileCleaner for many
+	delete_unknown_files(vs_token_data,[file_id])
 	return True
 
-def delete_file(vs_token_data,file_id):
+def delete_file(vs_token_data,file_id,remove_locks=False):
+	# remove_locks=True clears the file's deletion locks first
+	if remove_locks:
+		delete_locks(vs_token_data,file_id)
 	vs = vs_token_data["vs"]
 	token = vs_token_data["token"]
 	url = f'{vs}API/storage/file/{file_id}'
@@ -687,7 +2478,9 @@ def delete_file(vs_token_data,file_id):
 		'Accept': 'application/xml',
 		'Authorization': f'token {token}'
 	}
-	response = requests.request("DELETE", url, headers=headers, verify=crt_file)
+	response = vs_request("DELETE", url, headers=headers)
+	# we don't know which item the file belonged to, so drop every cached shape on this vs
+	invalidate_item(vs, kinds=_shape_kinds)
 	if response.status_code < 300:
 		logger.info(f'File ID {file_id} deleted.')
 	else:
@@ -695,57 +2488,168 @@ def delete_file(vs_token_data,file_id):
 		logger.warning(f'{response.text}')
 	return response.status_code
 
+def delete_files(vs_token_data,file_ids,remove_locks=True,concurrency=10) -> dict:
+	# bulk delete_file, {file_id: status code}. with remove_locks the locks on every file are
+	# cleared first, and a file whose locks couldn't all be removed is skipped (None)
+	file_ids = list(dict.fromkeys(file_ids))
+	statuses = {}
+	if remove_locks:
+		locks = delete_all_locks(vs_token_data,file_ids,concurrency)
+		for file_id, result in locks.items():
+			if result['failed'] or result['error']:
+				logger.warning(f'File ID {file_id} still has deletion locks, not deleting it.')
+				statuses[file_id] = None
+	deletable = [file_id for file_id in file_ids if file_id not in statuses]
+	for deleted in map_items(lambda file_id: delete_file(vs_token_data,file_id), deletable, concurrency):
+		statuses[deleted.item_id] = deleted.value if deleted.ok else None
+	return {file_id: statuses[file_id] for file_id in file_ids}
+
 def check_file_state(vs_token_data,storage_id,file_id):
 	vs = vs_token_data['vs']
 	token = vs_token_data['token']
 	headers = {
 		'Authorization': f'token {token}'
 	}
-	r = requests.get(f'{vs}API/storage/{storage_id}/file/{file_id}',headers=headers)
+	r = vs_request("GET", f'{vs}API/storage/{storage_id}/file/{file_id}', headers=headers)
 	file_doc = xml_prep(r)
 	return file_doc.find('state').text
 	
-def get_all_files_matching_state(vs_token_data,storage_id,file_state):
+# files per page for storage file listings. bigger pages mean fewer round trips, but every page in
+# flight is held in memory, so keep storage_page_size * prefetch reasonable
+storage_page_size = 5000
+
+def iter_storage_files(vs_token_data,storage_id,file_state=None,number=None,prefetch=4):
+	# streams every file on a storage as a dict {'id','uri','path','state','timestamp','storage'}
+	# file_state can be one state or a comma separated list, None for all of them
+	# the first page gives the hit count, after that `prefetch` pages are fetched concurrently and
+	# each one is parsed as it streams in, so memory stays flat however many files the storage has
 	vs = vs_token_data["vs"]
-	token = vs_token_data["token"]
-	url = f'{vs}API/storage/{storage_id}/file;number=10?state={file_state}'
+	number = number or storage_page_size
 	headers = {
 		'Accept': 'application/xml',
-		'Authorization': f'token {token}'
+		'Authorization': f'token {vs_token_data["token"]}'
 	}
-	response = requests.request("GET", url, headers=headers, verify=crt_file)
-	file_doc = xml_prep(response)
-	hits = int(file_doc.find('hits').text)
-	if hits > 0:
-		logger.info(f'{str(hits)} hits found on storage {storage_id} for files in state {file_state}.')
-		if hits > 1000:
-			number = 10000
-			first = 0
-		else:
-			number = hits
-			first = 0
-	else:
-		logger.warning(f'No hits found on storage {storage_id} for files in state {file_state}.')
-	files = []
-	while first < hits:
-		url = f'{vs}API/storage/{storage_id}/file;first={str(first)};number={str(number)}?state={file_state}'
-		response = requests.request("GET", url, headers=headers, verify=crt_file)
-		file_doc = xml_prep(response)
-		for file in file_doc:
-			file_state = file.find('state').text
-			file_id = file.find('id').text
-			if file_state == 'UNKNOWN':
-				logger.warning(f'file id {file_id} is in the UNKNOWN state. Attempting to delete.')
-				delete_unknown(vs,vs_auth,file_id)
-				continue
-			else:
-				files.append(file_id)
-		first = first + number
-	return files
+	query = f'?state={file_state}' if file_state else ''
 
+	def page_url(first):
+		return f'{vs}API/storage/{storage_id}/file;first={first};number={number}{query}'
 
+	def get_page(first):
+		response = vs_request("GET", page_url(first), headers=headers, stream=True)
+		try:
+			response.raise_for_status()
+			return [ShapeIndex._file_entry(file) for file in iter_vs_elements(response, 'file')]
+		finally:
+			response.close()
 
+	response = vs_request("GET", page_url(0), headers=headers)
+	response.raise_for_status()
+	file_doc = xml_prep(response)
+	hits = int(file_doc.find('hits').text)
+	if hits == 0:
+		logger.warning(f'No hits found on storage {storage_id} for files in state {file_state}.')
+		return
+	logger.info(f'{str(hits)} hits found on storage {storage_id} for files in state {file_state}.')
+	first_page = [ShapeIndex._file_entry(file) for file in file_doc.findall('file')]
+	del file_doc
+	yield from first_page
+	if not first_page:
+		logger.warning(f'Storage {storage_id} reported {hits} hits but served an empty first page.')
+		return
+	if len(first_page) < min(number, hits):
+		# VS caps the page size, so step by what it actually served or every page skips the difference
+		logger.debug(f'Storage {storage_id} served {len(first_page)} files per page, not {number}.')
+		number = len(first_page)
+	# offsets are fixed from the first hit count, a storage that changes a lot mid scan can
+	# shift a few files between pages
+	for page in prefetch_pages(get_page, range(number, hits, number), prefetch):
+		yield from page
+
+class UnknownFileCleaner:
+	# background queue that deletes UNKNOWN files from solr in batches while a scan keeps going
+	#   with eng_vs_token.UnknownFileCleaner(vs_token_data) as cleaner:
+	#       for file in eng_vs_token.iter_storage_files(vs_token_data,storage_id):
+	#           if file['state'] == 'UNKNOWN':
+	#               cleaner.put(file['id'])
+	#   cleaner.counts   -> {'queued': 12, 'deleted': 12, 'failed': 0}
+	# ids go to solr batch_size at a time, or whatever has collected after flush_seconds with nothing
+	# new coming in. the queue is bounded so a storage full of UNKNOWN files slows the scan down
+	# instead of piling up ids in memory. leaving the with block waits for the queue to drain
+
+	def __init__(self, vs_token_data, max_queued=10000, batch_size=None, flush_seconds=5, commit='hard'):
+		self.vs_token_data = vs_token_data
+		self.batch_size = batch_size or solr_delete_batch_size
+		self.flush_seconds = flush_seconds
+		self.commit = commit
+		self.counts = {'queued': 0, 'deleted': 0, 'failed': 0}
+		self._queue = queue.Queue(maxsize=max_queued)
+		self._lock = threading.Lock()
+		self._thread = threading.Thread(target=self._run, name='unknown-cleaner', daemon=True)
+		self._thread.start()
+
+	def put(self, file_id):
+		logger.warning(f'file id {file_id} is in the UNKNOWN state. Queued for deletion.')
+		self._count('queued')
+		self._queue.put(file_id)
+
+	def _count(self, key, amount=1):
+		with self._lock:
+			self.counts[key] += amount
+
+	def _run(self):
+		batch = []
+		done = False
+		while not done:
+			try:
+				file_id = self._queue.get(timeout=self.flush_seconds) if batch else self._queue.get()
+			except queue.Empty:
+				# nothing new for a while, send what we have
+				file_id = False
+			if file_id is None:
+				done = True
+			elif file_id:
+				batch.append(file_id)
+			if batch and (done or file_id is False or len(batch) >= self.batch_size):
+				self._delete(batch)
+				batch = []
+
+	def _delete(self, batch):
+		try:
+			delete_unknown_files(self.vs_token_data,batch,self.batch_size,self.commit)
+			self._count('deleted', len(batch))
+		except Exception as e:
+			logger.error(f'Could not delete {len(batch)} UNKNOWN file(s) starting at {batch[0]}: {e}')
+			self._count('failed', len(batch))
+
+	def close(self, wait=True) -> dict:
+		# stops the worker once everything already queued is sent
+		self._queue.put(None)
+		if wait:
+			self._thread.join()
+			logger.info(f'UNKNOWN file cleanup: {self.counts["deleted"]} deleted, {self.counts["failed"]} failed.')
+		return dict(self.counts)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+		return False
 
+def iter_files_matching_state(vs_token_data,storage_id,file_state,cleaner=None,number=None,prefetch=4):
+	# yields the ids of files in file_state on the storage as they are read
+	# UNKNOWN files are handed to cleaner (an UnknownFileCleaner) instead of being yielded
+	for file in iter_storage_files(vs_token_data,storage_id,file_state,number,prefetch):
+		if file['state'] == 'UNKNOWN':
+			if cleaner is not None:
+				cleaner.put(file['id'])
+			continue
+		yield file['id']
+
+def get_all_files_matching_state(vs_token_data,storage_id,file_state) -> list:
+	# list version of iter_files_matching_state, UNKNOWN files are deleted in the background
+	with UnknownFileCleaner(vs_token_data) as cleaner:
+		return list(iter_files_matching_state(vs_token_data,storage_id,file_state,cleaner))
 
 # JOBS
 
@@ -755,33 +2659,269 @@ def update_job_metadata(vs_token_data,job_id,key,value):
 	url = f'{vs}API/job/{job_id}/step/0/data'
 	headers = {'Content-Type': "application/xml",'Accept': "application/xml",'Authorization': f'token {token}'}
 	data = f'<SimpleMetadataDocument xmlns="http://xml.vidispine.com/schema/vidispine"><field><key>{key}</key><value>{value}</value></field></SimpleMetadataDocument>'
-	put_response = requests.request("PUT", url, headers=headers, data=data, verify=crt_file)
+	put_response = vs_request("PUT", url, headers=headers, data=data)
 	if put_response.status_code == 200:
 		return True
 	else:
 		return False
 
-def wait_for_job(vs_token_data,job_id):
-	vs = vs_token_data["vs"]
-	token = vs_token_data["token"]
-	url = f'{vs}API/job/{job_id}'
-	headers = {'Content-Type': 'application/xml','Accept': 'application/xml','Authorization': f'token {token}'}
-	done = False
+# longest gap between checks in wait_for_job, the old loop checked every 5 seconds
+wait_for_job_max_interval = 5
+
+def wait_for_job(vs_token_data,job_id,timeout=None):
+	# blocks until the job is FINISHED, FAILED_TOTAL or ABORTED and returns that status
+	# returns None if timeout (seconds) runs out first
+	# one job is one cheap GET per check, so the backoff stops at wait_for_job_max_interval instead of
+	# JobWatcher's 60s and a finished job is noticed as quickly as it used to be
+	watcher = JobWatcher(vs_token_data, max_interval=wait_for_job_max_interval)
+	watcher.watch(job_id)
 	logger.info(f'Checking job {job_id} status')
-	while done == False:
-		response = requests.request("GET", url, headers=headers, verify=crt_file)
-		job_doc = xml_prep(response)
-		status = job_doc.find('status').text
+	return watcher.wait(timeout).get(job_id)
+
+# final states, anything else means the job is still going
+job_end_states = ('FINISHED','FAILED_TOTAL','ABORTED')
+
+class JobWatcher:
+	# waits on many VS jobs at once
+	#   watcher = eng_vs_token.JobWatcher(vs_token_data)
+	#   future = watcher.watch(job_id, callback=lambda job_id, status: ...)
+	#   results = watcher.wait(timeout=3600)   # {job_id: status, or None if it timed out}
+	# with more than direct_poll_limit jobs it asks VS for the list of unfinished jobs once per
+	# interval and only fetches the jobs that dropped off that list. the interval starts at
+	# min_interval, doubles every round nothing changes, up to max_interval, and drops back
+	# to min_interval when something does. so with the defaults a job can end up to a minute before
+	# it's noticed, fine for a backfill watching hundreds of jobs, pass a lower max_interval otherwise.
+	# nothing polls in the background: futures and callbacks only resolve while wait() or poll() is
+	# running, so run wait() on a thread of its own if the caller has other work to do meanwhile
+
+	direct_poll_limit = 3
+	page_size = 1000
+
+	def __init__(self, vs_token_data, min_interval=2, max_interval=60):
+		self.vs_token_data = vs_token_data
+		self.min_interval = min_interval
+		self.max_interval = max_interval
+		self.statuses = {}
+		self._futures = {}
+		self._callbacks = {}
+		self._lock = threading.Lock()
+
+	def watch(self, job_id, callback=None) -> Future:
+		# callback(job_id, status) runs once the job ends. the future's result is the end status
+		with self._lock:
+			if job_id not in self._futures:
+				self._futures[job_id] = Future()
+				self._callbacks[job_id] = []
+			if callback is not None:
+				self._callbacks[job_id].append(callback)
+			return self._futures[job_id]
+
+	def pending(self) -> list:
+		with self._lock:
+			return [job_id for job_id, future in self._futures.items() if not future.done()]
+
+	def _headers(self):
+		return {'Accept': 'application/xml','Authorization': f'token {self.vs_token_data["token"]}'}
+
+	def _job_status(self, job_id):
+		url = f'{self.vs_token_data["vs"]}API/job/{job_id}'
+		response = vs_request("GET", url, headers=read_headers(self.vs_token_data["token"]))
+		return job_status_from_doc(prep_response(response))
+
+	def _running_jobs(self) -> dict:
+		# {job_id: status} for every job VS still has in a non end state, one page at a time
+		vs = self.vs_token_data["vs"]
+		running = {}
+		first = 0
+		while True:
+			url = f'{vs}API/job;first={first};number={self.page_size}?state=NONE,READY,STARTED,STARTED_ASYNCHRONOUS,STARTED_PARALLEL,STARTED_PARALLEL_ASYNCHRONOUS,STARTED_SUBTASKS,FINISHED_SUBTASKS,WAITING,ABORTED_PENDING,FAILED_RETRY,DISAPPEARED'
+			job_list = xml_prep(vs_request("GET", url, headers=self._headers()))
+			jobs = job_list.findall('job')
+			for job in jobs:
+				running[job.findtext('jobId')] = job.findtext('status')
+			first += len(jobs)
+			hits = int(job_list.findtext('hits') or 0)
+			if not jobs or first >= hits:
+				return running
+
+	def poll(self) -> int:
+		# one round of status checks, returns how many jobs changed status
+		pending = self.pending()
+		if not pending:
+			return 0
+		if len(pending) <= self.direct_poll_limit:
+			current = {job_id: self._job_status(job_id) for job_id in pending}
+		else:
+			running = self._running_jobs()
+			current = {job_id: running[job_id] for job_id in pending if job_id in running}
+			# whatever isn't on the running list has ended (or just started), so ask about those directly
+			for job_id in pending:
+				if job_id not in current:
+					current[job_id] = self._job_status(job_id)
+		changed = 0
+		for job_id, status in current.items():
+			if self.statuses.get(job_id) != status:
+				changed += 1
+				logger.debug(f'Job {job_id} is in the {status} state!')
+			self.statuses[job_id] = status
+			if status in job_end_states:
+				self._finish(job_id, status)
+		return changed
+
+	def _finish(self, job_id, status):
 		if status == 'FINISHED':
 			logger.info(f'Job {job_id} is FINISHED!')
-			done = True
-			return status
-		elif status == 'FAILED_TOTAL':
-			logger.error(f'Job {job_id} is FAILED_TOTAL!')
-			return status
-		elif status == 'ABORTED':
-			logger.error(f'Job {job_id} is ABORTED!')
-			return status
 		else:
-			logger.debug(f'Job {job_id} is in the {status} state!')
-			time.sleep(5)
+			logger.error(f'Job {job_id} is {status}!')
+		with self._lock:
+			future = self._futures[job_id]
+			callbacks = self._callbacks.pop(job_id, [])
+		if not future.done():
+			future.set_result(status)
+		for callback in callbacks:
+			try:
+				callback(job_id, status)
+			except Exception as e:
+				logger.error(f'Callback for job {job_id} failed: {e}')
+
+	def wait(self, timeout=None) -> dict:
+		# polls until every watched job has ended or timeout seconds pass
+		# returns {job_id: end status}, None for jobs that hadn't ended
+		deadline = None if timeout is None else time.monotonic() + timeout
+		interval = self.min_interval
+		while self.pending():
+			if self.poll():
+				interval = self.min_interval
+			else:
+				interval = min(interval * 2, self.max_interval)
+			if not self.pending():
+				break
+			sleep_for = interval
+			if deadline is not None:
+				remaining = deadline - time.monotonic()
+				if remaining <= 0:
+					logger.warning(f'Gave up waiting on {len(self.pending())} job(s) after {timeout} seconds.')
+					break
+				sleep_for = min(interval, remaining)
+			time.sleep(sleep_for)
+		with self._lock:
+			return {job_id: future.result() if future.done() else None for job_id, future in self._futures.items()}
+
+# BULK FUNCTIONS
+# most of the one off scripts are a `for item in item_list:` loop of blocking calls, so the run
+# time is just VS round trips end to end. map_items runs the same func over the ids on a thread
+# pool that shares the pooled sessions above so the round trips overlap
+
+class ItemResult:
+	# what map_items hands back for each id. error is the exception func raised, value is None then
+
+	__slots__ = ('item_id', 'value', 'error', 'seconds')
+
+	def __init__(self, item_id, value=None, error=None, seconds=0.0):
+		self.item_id = item_id
+		self.value = value
+		self.error = error
+		self.seconds = seconds
+
+	@property
+	def ok(self) -> bool:
+		return self.error is None
+
+	def __repr__(self):
+		if self.ok:
+			return f'ItemResult({self.item_id!r}, value={self.value!r})'
+		return f'ItemResult({self.item_id!r}, error={self.error!r})'
+
+class RateLimiter:
+	# token bucket shared by every worker, rate calls per second with bursts of up to burst calls
+
+	def __init__(self, rate, burst=None):
+		self.rate = float(rate)
+		self.burst = float(burst or max(1, rate))
+		self._tokens = self.burst
+		self._last = time.monotonic()
+		self._lock = threading.Lock()
+
+	def acquire(self):
+		while True:
+			with self._lock:
+				now = time.monotonic()
+				self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+				self._last = now
+				if self._tokens >= 1:
+					self._tokens -= 1
+					return
+				wait_for = (1 - self._tokens) / self.rate
+			time.sleep(wait_for)
+
+def _log_progress(done, total, result):
+	if not result.ok:
+		logger.error(f'{result.item_id} failed: {result.error}')
+	if done == total or done % map_progress_every == 0:
+		logger.info(f'Processed {done} of {total} items.')
+
+# how often the default progress report logs a line
+map_progress_every = 100
+
+def map_items(func, item_ids, concurrency=10, rate=None, progress=_log_progress) -> list:
+	# runs func(item_id) for every id with at most concurrency calls in flight and, if rate is set,
+	# no more than rate calls started per second across all workers
+	# returns an ItemResult per id in the same order as item_ids. an exception (or a helper calling
+	# exit()) only fails its own item, it's kept on the result and the rest carry on
+	# progress(done, total, result) runs on the calling thread as each item finishes, pass None to
+	# turn it off. e.g.
+	#   results = eng_vs_token.map_items(lambda item_id: get_shape_index(vs_token_data, item_id), item_ids, concurrency=20)
+	item_ids = list(item_ids)
+	total = len(item_ids)
+	results = [None] * total
+	if total == 0:
+		return results
+	concurrency = max(1, min(concurrency, total))
+	if concurrency > pool_size:
+		# resizing here would close the sessions every other thread is using, including an outer
+		# map_items' workers, so the pools stay as they are and the extra workers open throwaway
+		# connections. call set_pool_size() at startup to avoid that
+		logger.warning(f'map_items concurrency {concurrency} is above the pool size {pool_size}, call set_pool_size({concurrency}) at startup to keep their connections alive.')
+	limiter = RateLimiter(rate) if rate else None
+	# the workers make their requests at the caller's priority
+	priority = current_priority()
+
+	def run_one(index):
+		if limiter is not None:
+			limiter.acquire()
+		item_id = item_ids[index]
+		started = time.perf_counter()
+		try:
+			with priority_class(priority):
+				result = ItemResult(item_id, value=func(item_id))
+		except (Exception, SystemExit) as e:
+			# plenty of the helpers exit(1) when VS says no, that only fails this item too
+			result = ItemResult(item_id, error=e)
+		result.seconds = time.perf_counter() - started
+		return index, result
+
+	done = 0
+	indexes = iter(range(total))
+	with ThreadPoolExecutor(max_workers=concurrency) as executor:
+		# only keep a couple of calls queued per worker so a 100k id list doesn't become 100k futures up front
+		pending = set()
+		for index in indexes:
+			pending.add(executor.submit(run_one, index))
+			if len(pending) >= concurrency * 2:
+				break
+		try:
+			while pending:
+				finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+				for future in finished:
+					index, result = future.result()
+					results[index] = result
+					done += 1
+					if progress is not None:
+						progress(done, total, result)
+					next_index = next(indexes, None)
+					if next_index is not None:
+						pending.add(executor.submit(run_one, next_index))
+		finally:
+			for future in pending:
+				future.cancel()
+	return results
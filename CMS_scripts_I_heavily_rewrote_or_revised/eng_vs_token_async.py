@@ -0,0 +1,457 @@
+import asyncio
+import json
+import random
+import time
+import weakref
+
+# aiohttp is only needed by this module, eng_vs_token itself runs on requests. see requirements.txt
+try:
+	import aiohttp
+except ImportError as e:
+	raise ImportError('eng_vs_token_async needs aiohttp, pip install -r requirements.txt') from e
+
+# asyncio mirror of eng_vs_token for fan-out work over thousands of items
+# same function names and return values as eng_vs_token, just awaitable
+# parsing and document building is shared with eng_vs_token so the two can't drift apart
+import eng_vs_token
+from eng_vs_token import xml_prep, make_group_metadata_doc, system_value_from_doc, group_value_from_doc, find_storage_id
+
+# import the logger from main so we can log stuff without it being passed in the functions
+# make sure that logger is created in main before importing this module
+from __main__ import logger
+
+# SESSION FUNCTIONS
+
+# how many VS calls this process can have in flight at once. change with set_max_in_flight() before the first call
+max_in_flight = 200
+
+class _LoopState:
+	# the session, semaphore and in flight GETs all belong to the event loop they were made on, so
+	# every loop gets its own. a script that calls run() twice, or runs loops on two threads, doesn't
+	# hand one loop's futures to the other
+
+	def __init__(self):
+		self.session = None
+		self.semaphore = None
+		# identical GETs in flight share one request, see vs_request. eng_vs_token.single_flight turns it off too
+		self.flights = {}
+		self.write_generation = 0
+
+_loop_states = weakref.WeakKeyDictionary()
+
+def _loop_state() -> _LoopState:
+	loop = asyncio.get_running_loop()
+	state = _loop_states.get(loop)
+	if state is None:
+		state = _loop_states[loop] = _LoopState()
+	return state
+
+class VSResponse:
+	# the bits of a requests.Response that eng_vs_token's parsers use
+	# the body is read inside the semaphore so the connection goes back to the pool right away
+
+	def __init__(self, status_code, content, headers, request_info=None, history=()):
+		self.status_code = status_code
+		self.content = content
+		self.headers = headers
+		self.request_info = request_info
+		self.history = history
+
+	@property
+	def text(self):
+		return self.content.decode('utf-8', errors='replace')
+
+	def json(self):
+		return json.loads(self.content)
+
+	def raise_for_status(self):
+		if self.status_code >= 400:
+			raise aiohttp.ClientResponseError(self.request_info, self.history, status=self.status_code, message=self.text, headers=self.headers)
+
+def set_max_in_flight(limit):
+	global max_in_flight
+	max_in_flight = limit
+	for state in list(_loop_states.values()):
+		state.semaphore = None
+
+def get_semaphore() -> asyncio.BoundedSemaphore:
+	state = _loop_state()
+	if state.semaphore is None:
+		state.semaphore = asyncio.BoundedSemaphore(max_in_flight)
+	return state.semaphore
+
+async def get_session() -> aiohttp.ClientSession:
+	# one ClientSession per event loop, connector sized to match the semaphore
+	state = _loop_state()
+	if state.session is None or state.session.closed:
+		connector = aiohttp.TCPConnector(limit=max_in_flight, ssl=eng_vs_token.get_ssl_context())
+		state.session = aiohttp.ClientSession(connector=connector)
+	return state.session
+
+async def close_session():
+	# call this before the event loop shuts down
+	state = _loop_state()
+	if state.session is not None and not state.session.closed:
+		await state.session.close()
+	state.session = None
+
+async def _file_io(loop, func, *args, undo=None):
+	# the governor's lock files are file io, so it runs on the default executor instead of on the loop
+	# a cancelled caller doesn't stop it half way, it finishes on its thread and undo(result) cleans up after it
+	call = loop.run_in_executor(None, func, *args)
+	try:
+		return await asyncio.shield(call)
+	except asyncio.CancelledError:
+		if undo is not None:
+			call.add_done_callback(lambda done: done.cancelled() or done.exception() or loop.run_in_executor(None, undo, done.result()))
+		raise
+
+async def _try_governor_slot(loop, url, priority):
+	return await _file_io(loop, eng_vs_token.try_governor_slot, url, priority, undo=eng_vs_token.release_governor_slot)
+
+async def release_governor_slot(slot):
+	if slot is not None:
+		await _file_io(asyncio.get_running_loop(), eng_vs_token.release_governor_slot, slot)
+
+async def governor_slot(url):
+	# eng_vs_token.governor_slot for the event loop, waits with asyncio.sleep instead of blocking it
+	# returns the slot to hand to release_governor_slot, None if the governor is off
+	if not eng_vs_token.governed(url):
+		return None
+	loop = asyncio.get_running_loop()
+	priority = eng_vs_token.current_priority()
+	try:
+		slot = await _try_governor_slot(loop, url, priority)
+		waited = 0
+		if slot is None:
+			started = time.perf_counter()
+			delay = 0.002
+			waiter = eng_vs_token.governor_waiter(url, priority)
+			await _file_io(loop, waiter.__enter__, undo=lambda _: waiter.__exit__(None, None, None))
+			try:
+				while slot is None:
+					await asyncio.sleep(random.uniform(delay / 2, delay))
+					delay = min(delay * 2, eng_vs_token.governor_poll)
+					slot = await _try_governor_slot(loop, url, priority)
+			finally:
+				await _file_io(loop, waiter.__exit__, None, None, None)
+			waited = time.perf_counter() - started
+	except OSError as e:
+		logger.warning(f'VS governor unavailable ({e}), going ahead without a slot.')
+		return None
+	eng_vs_token.record_governor_wait(priority, waited)
+	return slot
+
+async def _send(method, url, headers, data) -> VSResponse:
+	session = await get_session()
+	async with get_semaphore():
+		# the process wide semaphore first, then a slot shared with every other process on the box
+		slot = await governor_slot(url)
+		try:
+			async with session.request(method, url, headers=headers, data=data) as response:
+				content = await response.read()
+				return VSResponse(response.status, content, response.headers, response.request_info, response.history)
+		finally:
+			await release_governor_slot(slot)
+
+async def vs_request(method, url, headers=None, data=None) -> VSResponse:
+	# same single flight as eng_vs_token: a GET the same as one already in flight waits for that one
+	# instead of going to VS again, and our own writes start a new generation so later GETs don't join
+	# one from before the write. VSResponse already holds the body, so sharing it is safe
+	state = _loop_state()
+	if method.upper() != 'GET' or data is not None or not eng_vs_token.single_flight:
+		try:
+			return await _send(method, url, headers, data)
+		finally:
+			if method.upper() not in ('GET', 'HEAD', 'OPTIONS'):
+				state.write_generation += 1
+	flights = state.flights
+	key = (state.write_generation, url, tuple(sorted((headers or {}).items())))
+	flight = flights.get(key)
+	if flight is None:
+		flight = flights[key] = asyncio.ensure_future(_send(method, url, headers, data))
+		flight.add_done_callback(lambda done: flights.pop(key) if flights.get(key) is done else None)
+	# shielded so one caller being cancelled doesn't cancel the request for everyone else waiting on it
+	return await asyncio.shield(flight)
+
+def run(coro):
+	# convenience wrapper for sync scripts: run(some_coroutine) and close the session on the way out
+	async def runner():
+		try:
+			return await coro
+		finally:
+			await close_session()
+	return asyncio.run(runner())
+
+async def gather_items(func, vs_token_data, item_ids, *args):
+	# run func(vs_token_data, item_id, *args) for every item and return {item_id: result}
+	results = await asyncio.gather(*[func(vs_token_data, item_id, *args) for item_id in item_ids])
+	return dict(zip(item_ids, results))
+
+# HELPER FUNCTIONS
+
+async def status_check(vs_token_data, job_id):
+	vs = vs_token_data['vs']
+	token = vs_token_data["token"]
+	url = f'{vs}API/job/{job_id}'
+	headers = {
+		'Authorization': f'token {token}'
+	}
+	response = await vs_request("GET", url, headers=headers)
+	status_doc = xml_prep(response)
+	return status_doc.find('status').text
+
+# ITEM FUNCTIONS
+
+# search pages one search_items call asks for at once, so a 500k hit search isn't 500 requests queued together
+search_page_concurrency = 8
+
+async def search_items(vs_token_data,search_doc) -> list:
+	# same as eng_vs_token.search_items but the pages after the hit count are requested
+	# search_page_concurrency at a time instead of one after another
+	vs = vs_token_data["vs"]
+	token = vs_token_data["token"]
+	url = f'{vs}API/item'
+	headers = {
+		'Accept': 'application/xml',
+		'Content-type': 'application/xml',
+		'Authorization': f'token {token}'
+	}
+	data = search_doc
+	response = await vs_request("PUT", url, headers=headers, data=data)
+	item_list_doc = xml_prep(response)
+	hits = int(item_list_doc.find('hits').text)
+	logger.info(f'There are {str(hits)} hits returned in this search.')
+	logger.info('Compiling list of items.')
+	number = 1000
+	limit = asyncio.Semaphore(search_page_concurrency)
+
+	async def page(first):
+		async with limit:
+			return await vs_request("PUT", f'{vs}API/item;first={first};number={number}', headers=headers, data=data)
+
+	pages = [page(first) for first in range(1, hits + 1, number)]
+	item_list = []
+	for response in await asyncio.gather(*pages):
+		items = xml_prep(response)
+		for item in items.findall('item'):
+			item_list.append(item.attrib['id'])
+	return item_list
+
+async def put_item_metadata(vs_token_data,item_id,metadata_doc):
+	# metadata_doc can be an xml or a dict which will be converted to a json string
+	# return status_code
+	vs = vs_token_data["vs"]
+	token = vs_token_data["token"]
+	url = f'{vs}API/item/{item_id}/metadata'
+	if isinstance(metadata_doc,dict):
+		metadata_doc = json.dumps(metadata_doc)
+		headers = {
+			'Content-Type': 'application/json',
+			'Authorization': f'token {token}'
+		}
+	else:
+		headers = {
+			'Content-Type': 'application/xml',
+			'Authorization': f'token {token}'
+		}
+	response = await vs_request("PUT", url, headers=headers, data=metadata_doc)
+	if response.status_code >= 300:
+		logger.error('PUT vs metadata status: %s content: %s' % (str(response.status_code),response.text))
+	else:
+		logger.info('PUT vs metadata status: %s' % (str(response.status_code)))
+	return response.status_code
+
+async def _get_metadata_field(vs_token_data,item_id,field):
+	vs = vs_token_data["vs"]
+	token = vs_token_data["token"]
+	url = f'{vs}API/item/{item_id}/metadata;field={field}'
+	headers = {
+		'Accept': 'application/xml',
+		'Authorization': f'token {token}'
+	}
+	response = await vs_request("GET", url, headers=headers)
+	return xml_prep(response)
+
+async def is_mapped(vs_token_data,item_id):
+	metadata = await _get_metadata_field(vs_token_data,item_id,'indab_master_id')
+	try:
+		indab_master_id = metadata.find('item/metadata/timespan/group/field/value').text
+		logger.info(f'Found value of {indab_master_id} in indab_master_id field.')
+		return indab_master_id not in ('0', '')
+	except AttributeError:
+		# doesn't have the field
+		return False
+
+async def get_system_metadata_value(vs_token_data,item_id,field) -> str:
+	# returns a string of the system metadata value
+	# returns False if it can't find it
+	metadata = await _get_metadata_field(vs_token_data,item_id,field)
+	return system_value_from_doc(metadata,field)
+
+async def get_group_metadata_value(vs_token_data,item_id,field) -> str:
+	# returns a string from a group metadata value
+	# returns False if it can't find it
+	metadata = await _get_metadata_field(vs_token_data,item_id,field)
+	return group_value_from_doc(metadata,field)
+
+async def delete_item(vs_token_data,item_id):
+	vs = vs_token_data["vs"]
+	token = vs_token_data["token"]
+	url = f'{vs}API/item/{item_id}'
+	headers = {
+		'Authorization': f'token {token}'
+	}
+	response = await vs_request("DELETE", url, headers=headers)
+	if response.status_code < 300:
+		logger.info(f'Item ID {item_id} deleted.')
+	else:
+		logger.warning(f'Item ID {item_id} NOT deleted. status code: {response.status_code}')
+		logger.warning(f'{response.text}')
+	return response.status_code
+
+async def get_md5(vs_token_data,item_id):
+	md5 = await get_group_metadata_value(vs_token_data,item_id,'original_shape_mi_original_shape_mi_md5_hash')
+	if md5:
+		return md5
+	for field in ['__shapetag_original_hash','minidam_information_checksum']:
+		md5 = await get_system_metadata_value(vs_token_data,item_id,field)
+		if md5 and md5 != '':
+			return md5
+	return False
+
+# SHAPE FUNCTIONS
+
+async def get_shape_ids(vs: str, token: str, item_id: str, shapetag: str) -> list:
+	url = f'{vs}API/item/{item_id}/shape?tag={shapetag}'
+	headers = {
+		'Accept': 'application/json',
+		'Authorization': f'token {token}'
+	}
+	response = await vs_request("GET", url, headers=headers)
+	response.raise_for_status()
+	uri_list_doc = response.json()
+	if "uri" in uri_list_doc:
+		return list(uri_list_doc["uri"])
+	logger.info(f"Shape tag {shapetag}, not found in item {item_id}")
+	return []
+
+async def get_shape_document(vs: str, token: str, item_id: str, shapetag: str):
+	url = f'{vs}API/item/{item_id}?content=shape&tag={shapetag}'
+	headers = {
+		'Authorization': f'token {token}'
+	}
+	response = await vs_request("GET", url, headers=headers)
+	response.raise_for_status()
+	return xml_prep(response)
+
+async def shape_presence(vs_token_data,item_id,shapetag):
+	vs = vs_token_data['vs']
+	token = vs_token_data['token']
+	headers = {
+		'Authorization': f'token {token}'
+	}
+	metadata_url = f'{vs}API/item/{item_id}?content=metadata&terse=true'
+	metadata = xml_prep(await vs_request("GET", metadata_url, headers=headers))
+	for field in metadata.findall('field'):
+		if field.find('name').text == 'shapeTag':
+			for shape in field.findall('value'):
+				if shape.text == shapetag:
+					return True
+	return False
+
+# STORAGE FUNCTIONS
+
+async def get_storage_groups(vs_token_data,group_name):
+	# returns list of all ID values connected to a storage group name
+	vs = vs_token_data["vs"]
+	token = vs_token_data["token"]
+	url = f'{vs}API/storage/storage-group/{group_name}'
+	headers = {
+		'Accept': 'application/xml',
+		'Authorization': f'token {token}'
+	}
+	results = xml_prep(await vs_request("GET", url, headers=headers))
+	return [storage.find('id').text for storage in results.findall('storage')]
+
+async def get_storage_id_from_name(vs_token_data,storage_name) -> str:
+	vs = vs_token_data["vs"]
+	token = vs_token_data["token"]
+	url = f'{vs}API/storage'
+	headers = {
+		'Accept': 'application/xml',
+		'Authorization': f'token {token}'
+	}
+	storage_list_doc = xml_prep(await vs_request("GET", url, headers=headers))
+	for storage in storage_list_doc.findall('storage'):
+		for field in storage.findall('metadata/field'):
+			if field.find('key').text == 'name' and field.find('value').text == storage_name:
+				return storage.find('id').text
+
+async def storage_presence(vs_token_data,item_id,storage,shapetag='original'):
+	shape = await get_shape_document(vs_token_data["vs"], vs_token_data["token"], item_id, shapetag)
+	for file in shape.findall('.//file'):
+		if isinstance(storage, list) and file.find('storage').text in storage:
+			return True
+		elif isinstance(storage, str) and file.find('storage').text == storage:
+			return True
+	return False
+
+async def current_storage_id(vs_token_data,item_id,storage_list,shapetag='original'):
+	# one shape fetch instead of one per storage
+	shape = await get_shape_document(vs_token_data["vs"], vs_token_data["token"], item_id, shapetag)
+	present = set(file.find('storage').text for file in shape.findall('.//file'))
+	for storage in storage_list:
+		if storage in present:
+			return storage
+	return False
+
+async def check_file_state(vs_token_data,storage_id,file_id):
+	vs = vs_token_data['vs']
+	token = vs_token_data['token']
+	headers = {
+		'Authorization': f'token {token}'
+	}
+	file_doc = xml_prep(await vs_request("GET", f'{vs}API/storage/{storage_id}/file/{file_id}', headers=headers))
+	return file_doc.find('state').text
+
+async def delete_file(vs_token_data,file_id):
+	vs = vs_token_data["vs"]
+	token = vs_token_data["token"]
+	url = f'{vs}API/storage/file/{file_id}'
+	headers = {
+		'Accept': 'application/xml',
+		'Authorization': f'token {token}'
+	}
+	response = await vs_request("DELETE", url, headers=headers)
+	if response.status_code < 300:
+		logger.info(f'File ID {file_id} deleted.')
+	else:
+		logger.warning(f'File ID {file_id} NOT deleted. status code: {response.status_code}')
+		logger.warning(f'{response.text}')
+	return response.status_code
+
+# JOBS
+
+async def update_job_metadata(vs_token_data,job_id,key,value):
+	vs = vs_token_data["vs"]
+	token = vs_token_data["token"]
+	url = f'{vs}API/job/{job_id}/step/0/data'
+	headers = {'Content-Type': "application/xml",'Accept': "application/xml",'Authorization': f'token {token}'}
+	data = f'<SimpleMetadataDocument xmlns="http://xml.vidispine.com/schema/vidispine"><field><key>{key}</key><value>{value}</value></field></SimpleMetadataDocument>'
+	put_response = await vs_request("PUT", url, headers=headers, data=data)
+	return put_response.status_code == 200
+
+async def wait_for_job(vs_token_data,job_id,interval=5):
+	# sleeps with asyncio so hundreds of jobs can be waited on from one loop
+	logger.info(f'Checking job {job_id} status')
+	while True:
+		status = await status_check(vs_token_data,job_id)
+		if status == 'FINISHED':
+			logger.info(f'Job {job_id} is FINISHED!')
+			return status
+		elif status in ('FAILED_TOTAL','ABORTED'):
+			logger.error(f'Job {job_id} is {status}!')
+			return status
+		logger.debug(f'Job {job_id} is in the {status} state!')
+		await asyncio.sleep(interval)
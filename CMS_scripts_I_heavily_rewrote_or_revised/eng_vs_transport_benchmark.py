@@ -0,0 +1,217 @@
+#!/usr/bin/python3
+'''
+Benchmark for the eng_vs_token xml and json transports. No VS needed, documents are generated.
+
+USAGE:
+python3 eng_vs_transport_benchmark.py [search hits] [rounds]
+
+WHAT THIS SCRIPT DOES:
+-Builds the same item metadata, shape, search page and job documents as VS xml and VS json
+-Checks that both transports give back the same values through the eng_vs_token readers
+-Prints raw and gzipped bytes on the wire for each document
+-Times parse plus value extraction for xml (ElementTree, lxml if installed) and json (json, orjson if installed)
+'''
+
+# native imports
+import sys
+import json
+import gzip
+import time
+import logging
+
+# eng_vs_token imports these from main
+crt_file = None
+logging.basicConfig(level=logging.ERROR)
+logger = logging.getLogger()
+
+import eng_vs_token
+
+TIMESTAMP = '2024-05-01T12:00:00.000+0000'
+
+def value_attrs(i):
+	return {'uuid': f'6f0c1a2e-0000-4000-8000-{i:012d}', 'user': 'admin', 'timestamp': TIMESTAMP, 'change': f'VX-{100000 + i}'}
+
+def build_metadata(field_count=60, group_count=12):
+	# (system fields, groups) shaped like a real item, every group has a handful of fields
+	system = [(f'system_field_{i}', f'value {i}') for i in range(field_count)]
+	system[0] = ('originalFilename', 'ITEM_1234_CL_HD_MP2_15000.mpg')
+	system[1] = ('durationSeconds', '5400.0')
+	groups = []
+	for g in range(group_count):
+		groups.append((f'group_{g}', [(f'group_{g}_field_{i}', f'group value {g}.{i}') for i in range(8)]))
+	groups[0] = ('file_information', [('file_information_subtype_descriptor', 'CL_HD_MP2_15000'), ('file_information_is_trailer', 'false')])
+	groups[1] = ('indab', [('indab_master_id', '123456')])
+	return system, groups
+
+def metadata_xml(system, groups) -> bytes:
+	counter = iter(range(1000000))
+	def field(name, value):
+		attrs = ' '.join(f'{k}="{v}"' for k, v in value_attrs(next(counter)).items())
+		return f'<field><name>{name}</name><value {attrs}>{value}</value></field>'
+	fields = ''.join(field(name, value) for name, value in system)
+	group_xml = ''.join(f'<group><name>{name}</name>{"".join(field(n, v) for n, v in group_fields)}</group>' for name, group_fields in groups)
+	return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+		f'<MetadataListDocument xmlns="{eng_vs_token.VS_NAMESPACE}"><item id="VX-1234"><metadata><revision>VX-1,VX-2</revision>'
+		f'<timespan start="-INF" end="+INF">{fields}{group_xml}</timespan></metadata></item></MetadataListDocument>').encode('utf-8')
+
+def metadata_terse_xml(system, groups) -> bytes:
+	# what get_metadata_values asks for over xml, every field straight in as <name>value</name>
+	counter = iter(range(1000000))
+	def field(name, value):
+		attrs = ' '.join(f'{k}="{v}"' for k, v in value_attrs(next(counter)).items())
+		return f'<{name} {attrs}>{value}</{name}>'
+	fields = ''.join(field(name, value) for name, value in system)
+	fields += ''.join(field(n, v) for _, group_fields in groups for n, v in group_fields)
+	return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+		f'<ItemDocument xmlns="{eng_vs_token.VS_NAMESPACE}" id="VX-1234">{fields}</ItemDocument>').encode('utf-8')
+
+def metadata_json(system, groups) -> bytes:
+	counter = iter(range(1000000))
+	def field(name, value):
+		return {'name': name, 'value': [dict(value=value, **value_attrs(next(counter)))]}
+	document = {'item': [{'id': 'VX-1234', 'metadata': {'revision': 'VX-1,VX-2', 'timespan': [{
+		'start': '-INF',
+		'end': '+INF',
+		'field': [field(name, value) for name, value in system],
+		'group': [{'name': name, 'field': [field(n, v) for n, v in group_fields]} for name, group_fields in groups]
+	}]}}]}
+	return json.dumps(document).encode('utf-8')
+
+def build_shapes(audio_tracks=8):
+	# [(shape id, tag, [(component, [file dicts])])], files on a local and a cloud storage
+	shapes = []
+	for s, tag in enumerate(['original', 'lowres', 'mezzanine', 'audio_stems']):
+		components = []
+		for c, component in enumerate(['containerComponent', 'videoComponent'] + ['audioComponent'] * audio_tracks):
+			files = []
+			for storage in ['VX-143', 'VX-266']:
+				files.append({
+					'id': f'VX-{s}{c}{storage[3:]}',
+					'path': f'mezz/2024/ITEM_1234_{tag}.mxf',
+					'uri': f'file:///mnt/{storage}/mezz/2024/ITEM_1234_{tag}.mxf',
+					'state': 'CLOSED',
+					'size': '15000000000',
+					'hash': 'a' * 40,
+					'timestamp': TIMESTAMP,
+					'refreshFlag': '1',
+					'storage': storage
+				})
+			components.append((component, files))
+		shapes.append((f'VX-{5000 + s}', tag, components))
+	return shapes
+
+def shape_xml(shapes) -> bytes:
+	def file_xml(file):
+		return '<file>' + ''.join(f'<{k}>{v}</{k}>' for k, v in file.items()) + '<metadata/></file>'
+	body = ''
+	for shape_id, tag, components in shapes:
+		body += f'<shape><id>{shape_id}</id><tag>{tag}</tag>'
+		for c, (component, files) in enumerate(components):
+			body += f'<{component}><id>VX-{c}</id>{"".join(file_xml(f) for f in files)}<itemTrack>A{c}</itemTrack></{component}>'
+		body += '</shape>'
+	return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+		f'<ItemDocument xmlns="{eng_vs_token.VS_NAMESPACE}" id="VX-1234">{body}</ItemDocument>').encode('utf-8')
+
+def shape_json(shapes) -> bytes:
+	document = {'id': 'VX-1234', 'shape': []}
+	for shape_id, tag, components in shapes:
+		shape = {'id': shape_id, 'tag': [tag]}
+		for c, (component, files) in enumerate(components):
+			json_files = [dict(file, uri=[file['uri']], metadata={}) for file in files]
+			entry = {'id': f'VX-{c}', 'file': json_files, 'itemTrack': f'A{c}'}
+			if component == 'containerComponent':
+				shape[component] = entry
+			else:
+				shape.setdefault(component, []).append(entry)
+		document['shape'].append(shape)
+	return json.dumps(document).encode('utf-8')
+
+def search_xml(hits) -> bytes:
+	items = ''.join(f'<item id="VX-{i}" start="-INF" end="+INF"/>' for i in range(hits))
+	return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+		f'<ItemListDocument xmlns="{eng_vs_token.VS_NAMESPACE}"><hits>{hits}</hits>{items}</ItemListDocument>').encode('utf-8')
+
+def search_json(hits) -> bytes:
+	return json.dumps({'hits': hits, 'item': [{'id': f'VX-{i}', 'start': '-INF', 'end': '+INF'} for i in range(hits)]}).encode('utf-8')
+
+def job_xml() -> bytes:
+	return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><JobDocument xmlns="{eng_vs_token.VS_NAMESPACE}">'
+		f'<jobId>VX-99</jobId><user>admin</user><started>{TIMESTAMP}</started><status>FINISHED</status><type>TRANSCODE</type>'
+		f'<priority>MEDIUM</priority></JobDocument>').encode('utf-8')
+
+def job_json() -> bytes:
+	return json.dumps({'jobId': 'VX-99', 'user': 'admin', 'started': TIMESTAMP, 'status': 'FINISHED', 'type': 'TRANSCODE', 'priority': 'MEDIUM'}).encode('utf-8')
+
+# what each document is read for, the same readers eng_vs_token uses for both transports
+METADATA_FIELDS = ['originalFilename', 'durationSeconds', 'file_information_subtype_descriptor', 'file_information_is_trailer', 'indab_master_id']
+
+def read_metadata(document):
+	return eng_vs_token.terse_values_from_doc(document, METADATA_FIELDS)
+
+def read_shape(document):
+	return eng_vs_token.ShapeIndex(None, 'VX-1234', document=document).shapes
+
+def read_search(document):
+	if isinstance(document, dict):
+		return [item['id'] for item in eng_vs_token.json_list(document, 'item')]
+	return [item.attrib['id'] for item in document.findall('item')]
+
+def read_job(document):
+	return eng_vs_token.job_status_from_doc(document)
+
+def best_time(func, rounds):
+	best = None
+	for _ in range(rounds):
+		start = time.perf_counter()
+		func()
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+def decoders():
+	found = [('json', json.loads)]
+	if eng_vs_token.orjson is not None:
+		found.append(('orjson', eng_vs_token.orjson.loads))
+	return found
+
+def xml_parsers():
+	found = [('xml etree', 'etree')]
+	if eng_vs_token.lxml_etree is not None:
+		found.append(('xml lxml', 'lxml'))
+	return found
+
+def parse_xml(backend, content):
+	eng_vs_token.set_xml_backend(backend)
+	try:
+		return eng_vs_token.parse_vs_xml(content)
+	finally:
+		eng_vs_token.set_xml_backend('etree')
+
+def run(name, xml_content, json_content, reader, rounds):
+	# both transports have to agree before the numbers mean anything
+	xml_values = reader(eng_vs_token.parse_vs_xml(xml_content))
+	json_values = reader(json.loads(json_content))
+	if xml_values != json_values:
+		raise SystemExit(f'{name}: xml and json transports disagree\n  xml:  {xml_values}\n  json: {json_values}')
+	print(f'\n{name}')
+	for label, content in [('xml', xml_content), ('json', json_content)]:
+		print(f'  {label + " bytes":<14} {len(content):>10,} raw  {len(gzip.compress(content)):>9,} gzip')
+	for label, backend in xml_parsers():
+		elapsed = best_time(lambda: reader(parse_xml(backend, xml_content)), rounds)
+		print(f'  {label:<14} {elapsed * 1000:10.3f} ms parse + read')
+	for label, loads in decoders():
+		elapsed = best_time(lambda: reader(loads(json_content)), rounds)
+		print(f'  {label:<14} {elapsed * 1000:10.3f} ms parse + read')
+
+if __name__ == '__main__':
+	hits = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+	rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+	system, groups = build_metadata()
+	shapes = build_shapes()
+	run('item metadata (get_metadata_values)', metadata_terse_xml(system, groups), metadata_json(system, groups), read_metadata, rounds)
+	run('full item metadata', metadata_xml(system, groups), metadata_json(system, groups), lambda doc: eng_vs_token.group_value_from_doc(doc, 'indab_master_id'), rounds)
+	run('item shapes (ShapeIndex)', shape_xml(shapes), shape_json(shapes), read_shape, rounds)
+	run(f'search page ({hits} hits)', search_xml(hits), search_json(hits), read_search, rounds)
+	run('job status', job_xml(), job_json(), read_job, rounds)
+	if eng_vs_token.orjson is None:
+		print('\norjson not installed, json numbers are the stdlib decoder only')
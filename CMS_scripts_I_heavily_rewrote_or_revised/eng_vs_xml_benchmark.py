@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+'''
+Benchmark for the eng_vs_token xml parsers. No VS needed, documents are generated.
+
+USAGE:
+python3 eng_vs_xml_benchmark.py [item count] [rounds]
+
+WHAT THIS SCRIPT DOES:
+-Builds a synthetic ItemListDocument (about 1MB per 4000 items) and a FileListDocument in the vidispine namespace
+-Times the old decode/replace/encode xml_prep against parse_vs_xml (ElementTree and lxml if installed)
+-Times iter_vs_elements streaming through the same documents
+-Prints the best time per parser, MB/s and peak memory used while parsing
+'''
+
+# native imports
+import sys
+import time
+import logging
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+# eng_vs_token imports these from main
+crt_file = None
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger()
+
+import eng_vs_token
+
+def legacy_xml_prep(content):
+	# xml_prep as it was, kept here so there is something to compare against
+	res = content.decode(encoding='utf-8', errors='strict')
+	res = res.replace(' xmlns=\"http://xml.vidispine.com/schema/vidispine\"', "")
+	res = res.encode(encoding='utf-8', errors='strict')
+	return ET.fromstring(res)
+
+def build_item_list_doc(count) -> bytes:
+	items = []
+	for i in range(count):
+		items.append(
+			f'<item id="VX-{i}"><metadata><revision>VX-{i * 3}</revision><timespan start="-INF" end="+INF">'
+			f'<field><name>originalFilename</name><value>ITEM_{i}_CL_HD_MP2_15000.mpg</value></field>'
+			f'<field><name>durationSeconds</name><value>{5400 + i % 600}.0</value></field>'
+			f'<group><name>file_information</name>'
+			f'<field><name>file_information_subtype</name><value>HD Derivative</value></field>'
+			f'<field><name>file_information_is_trailer</name><value>false</value></field></group>'
+			f'<group><name>indab</name><field><name>indab_master_id</name><value>{100000 + i // 4}</value></field></group>'
+			f'</timespan></metadata></item>'
+		)
+	return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+		f'<ItemListDocument xmlns="{eng_vs_token.VS_NAMESPACE}"><hits>{count}</hits>{"".join(items)}</ItemListDocument>').encode('utf-8')
+
+def build_file_list_doc(count) -> bytes:
+	files = []
+	for i in range(count):
+		files.append(
+			f'<file><id>VX-{i}</id><path>mezz/2024/{i % 97}/ITEM_{i}.mpg</path>'
+			f'<uri>file:///mnt/mezz/2024/{i % 97}/ITEM_{i}.mpg</uri><state>{"UNKNOWN" if i % 50 == 0 else "CLOSED"}</state>'
+			f'<size>{i * 1024}</size><timestamp>2024-05-01T12:00:00.000+0000</timestamp><refreshFlag>1</refreshFlag>'
+			f'<storage>VX-143</storage><metadata/></file>'
+		)
+	return (f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+		f'<FileListDocument xmlns="{eng_vs_token.VS_NAMESPACE}"><hits>{count}</hits>{"".join(files)}</FileListDocument>').encode('utf-8')
+
+def stream_count(content, tag):
+	return sum(1 for element in eng_vs_token.iter_vs_elements(content, tag))
+
+def best_time(func, content, rounds):
+	best = None
+	for _ in range(rounds):
+		start = time.perf_counter()
+		func(content)
+		elapsed = time.perf_counter() - start
+		best = elapsed if best is None else min(best, elapsed)
+	return best
+
+def peak_memory(func, content):
+	tracemalloc.start()
+	result = func(content)
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	del result
+	return peak
+
+def run(name, content, tag, rounds):
+	size_mb = len(content) / 1024 / 1024
+	print(f'\n{name}: {size_mb:.2f} MB')
+	parsers = [('legacy xml_prep', legacy_xml_prep)]
+	eng_vs_token.set_xml_backend('etree')
+	parsers.append(('parse_vs_xml etree', eng_vs_token.parse_vs_xml))
+	parsers.append(('iter_vs_elements', lambda c: stream_count(c, tag)))
+	for label, func in parsers:
+		elapsed = best_time(func, content, rounds)
+		print(f'  {label:<22} {elapsed * 1000:8.1f} ms  {size_mb / elapsed:7.1f} MB/s  peak {peak_memory(func, content) / 1024 / 1024:7.1f} MB')
+	if eng_vs_token.lxml_etree is not None:
+		eng_vs_token.set_xml_backend('lxml')
+		elapsed = best_time(eng_vs_token.parse_vs_xml, content, rounds)
+		print(f'  {"parse_vs_xml lxml":<22} {elapsed * 1000:8.1f} ms  {size_mb / elapsed:7.1f} MB/s  (peak not tracked, lxml allocates outside python)')
+		eng_vs_token.set_xml_backend('etree')
+	else:
+		print('  lxml not installed, skipped')
+
+if __name__ == '__main__':
+	count = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+	rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+	run('ItemListDocument', build_item_list_doc(count), 'item', rounds)
+	run('FileListDocument', build_file_list_doc(count * 2), 'file', rounds)
@@ -0,0 +1,968 @@
+#!/usr/bin/python3
+'''
+Local stand-in for Vidispine so scripts can be load tested without touching a real VS.
+Standard library only, runs on a plain linux box with no network.
+
+USAGE:
+python3 fake_vidispine.py [--port 8080] [--items 100000] [--latency 0.05] [--jitter 0.02] [--error-rate 0.01]
+                          [--job-duration 2] [--max-page-size 1000] [--record UPSTREAM_URL CASSETTE | --replay CASSETTE [--strict]]
+
+or from a test/load script:
+	import fake_vidispine
+	with fake_vidispine.FakeVidispine(items=100000, latency=0.02) as server:
+		vs = server.url   # 'http://127.0.0.1:PORT/', use it anywhere a vs url goes
+		...
+	print(server.stats)
+
+WHAT THIS SCRIPT DOES:
+-Serves the endpoints eng_vs_token uses: token, item metadata GET/PUT, item search paging (with
+ content=metadata/shape projections), item shapes, storages and storage groups, storage file
+ listings, file state, file copy jobs, jobs and job lists, deletion locks, file/item deletes,
+ the solrpath property and a solr /update endpoint for UNKNOWN file cleanup
+-Answers in xml, or json when the client asks for it, gzipped when the client accepts gzip
+-Items VX-1 .. VX-N are synthetic and generated on demand, families of 4 items share an
+ indab_master_id, every 5th is a trailer, every 97th is corrupt, every 11th has no original shape
+ and every 50th original file is UNKNOWN. anything written (metadata PUTs, deletes, locks, jobs)
+ is kept in memory for the life of the server
+-Latency, jitter and an error rate (503s) can be injected on every request, tokens can be
+ revoked (server.revoke_token(token)) to get 401s, and paged listings can be capped at fewer
+ results than number= asks for
+-Record mode proxies every request to a real VS and saves the exchanges to a cassette (json),
+ replay mode answers from a cassette first and falls back to the synthetic store (or 404 with --strict)
+'''
+
+# native imports
+import re
+import time
+import json
+import gzip
+import uuid
+import base64
+import random
+import hashlib
+import argparse
+import threading
+import urllib.request
+import urllib.error
+import xml.etree.ElementTree as ET
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+
+VS_NAMESPACE = 'http://xml.vidispine.com/schema/vidispine'
+
+# storages the synthetic items live on, and the groups eng_vs_token.get_storage_groups asks for
+STORAGES = {'VX-1': 'local_mezz', 'VX-2': 'cloud_s3', 'VX-3': 'proxies'}
+STORAGE_GROUPS = {'local': ['VX-1'], 'cloud': ['VX-2'], 'library': ['VX-3']}
+
+SUBTYPES = ('CL_HD_MP2_15000', 'CL_SD_MP2_03750_DD20', 'PRORES_422_HQ')
+TIMESTAMP = '2024-05-01T12:00:00.000+0000'
+
+# id ranges, a file or shape id tells us which item and storage it belongs to
+ORIGINAL_SHAPE = 1000000
+LOWRES_SHAPE = 1500000
+LOCAL_FILE = 2000000
+LOWRES_FILE = 2500000
+CLOUD_FILE = 3000000
+LOCK = 4000000
+
+# ITEM STORE
+
+def _number(vx_id):
+	# 'VX-123' -> 123, None for anything else
+	match = re.fullmatch(r'VX-(\d+)', vx_id or '')
+	return int(match.group(1)) if match else None
+
+def synthetic_item(n) -> dict:
+	# {'fields': {name: [values]}, 'groups': [(name, {name: [values]})]}
+	subtype = SUBTYPES[n % 3]
+	return {
+		'fields': {
+			'originalFilename': [f'ITEM_{n}_{subtype}.mpg'],
+			'title': [f'Synthetic title {n // 4}'],
+			'durationSeconds': [f'{5400 + n % 600}.0'],
+			'shapeTag': ['lowres'] if n % 11 == 0 else ['original', 'lowres']
+		},
+		'groups': [
+			('file_information', {
+				'file_information_subtype_descriptor': [subtype],
+				'file_information_subtype': [('HD Derivative', 'SD Derivative', 'Mezzanine')[n % 3]],
+				'file_information_is_trailer': ['true' if n % 5 == 0 else 'false']
+			}),
+			('indab', {'indab_master_id': [str(100000 + n // 4)]}),
+			('original_shape_mi', {'original_shape_mi_original_shape_mi_md5_hash': [hashlib.md5(f'VX-{n}'.encode()).hexdigest()]}),
+			('media_management', {'media_management_corrupt': ['true' if n % 97 == 0 else 'false']})
+		]
+	}
+
+class ItemStore:
+	# synthetic items generated on demand, with whatever the clients changed layered on top
+
+	def __init__(self, count):
+		self.count = count
+		self.lock = threading.RLock()
+		self.items = {}
+		self.deleted_items = set()
+		self.deleted_files = set()
+		self.locks = {}
+		self.deleted_locks = set()
+		self.jobs = {}
+		self._index = {}
+		self._listings = {}
+		self._next_id = 5000000
+
+	def new_id(self) -> str:
+		with self.lock:
+			self._next_id += 1
+			return f'VX-{self._next_id}'
+
+	# items and metadata
+
+	def exists(self, n) -> bool:
+		return n is not None and 1 <= n <= self.count and n not in self.deleted_items
+
+	def item(self, n) -> dict:
+		with self.lock:
+			return self.items.get(n) or synthetic_item(n)
+
+	def all_values(self, n) -> dict:
+		# {field name: [values]} with group fields flattened in, for searching
+		item = self.item(n)
+		values = dict(item['fields'])
+		for _, fields in item['groups']:
+			for name, field_values in fields.items():
+				values.setdefault(name, field_values)
+		return values
+
+	def put_metadata(self, n, fields, groups):
+		with self.lock:
+			item = self.items.get(n) or synthetic_item(n)
+			item['fields'].update(fields)
+			for group_name, group_fields in groups:
+				for name, existing in item['groups']:
+					if name == group_name:
+						existing.update(group_fields)
+						break
+				else:
+					item['groups'].append((group_name, dict(group_fields)))
+			self.items[n] = item
+			# values changed, any search index on those fields is stale now
+			for name in list(fields) + [name for _, group_fields in groups for name in group_fields]:
+				self._index.pop(name, None)
+
+	def delete_item(self, n):
+		with self.lock:
+			self.deleted_items.add(n)
+			self._listings.clear()
+
+	def search(self, criteria) -> list:
+		# item numbers matching every (field, [values]) in criteria, in id order
+		with self.lock:
+			matches = None
+			for field, values in criteria:
+				if field == 'itemId':
+					found = {_number(value) for value in values}
+				else:
+					index = self._field_index(field)
+					found = set()
+					for value in values:
+						found.update(index.get(value, ()))
+				matches = found if matches is None else matches & found
+			if matches is None:
+				return [n for n in range(1, self.count + 1) if n not in self.deleted_items]
+			return sorted(n for n in matches if self.exists(n))
+
+	def _field_index(self, field) -> dict:
+		# {value: [item numbers]}, built the first time a field is searched on
+		index = self._index.get(field)
+		if index is None:
+			index = {}
+			for n in range(1, self.count + 1):
+				for value in self.all_values(n).get(field, ()):
+					index.setdefault(value, []).append(n)
+			self._index[field] = index
+		return index
+
+	# shapes and files
+
+	def shapes(self, n) -> list:
+		# [(shape id, tag, [file dicts])]
+		shapes = []
+		if n % 11 != 0:
+			files = [self.file(LOCAL_FILE + n)]
+			if n % 3 == 0:
+				files.append(self.file(CLOUD_FILE + n))
+			shapes.append((f'VX-{ORIGINAL_SHAPE + n}', 'original', [f for f in files if f is not None]))
+		shapes.append((f'VX-{LOWRES_SHAPE + n}', 'lowres', [f for f in [self.file(LOWRES_FILE + n)] if f is not None]))
+		return shapes
+
+	def _file_location(self, file_number):
+		# (item number, storage id) for a file number, None if there is no such file
+		for base, storage, has_file in [
+			(LOCAL_FILE, 'VX-1', lambda n: n % 11 != 0),
+			(LOWRES_FILE, 'VX-3', lambda n: True),
+			(CLOUD_FILE, 'VX-2', lambda n: n % 3 == 0 and n % 11 != 0)
+		]:
+			n = file_number - base
+			if 1 <= n <= self.count and has_file(n):
+				return n, storage
+		return None
+
+	def file(self, file_number) -> dict:
+		location = self._file_location(file_number)
+		if location is None or file_number in self.deleted_files:
+			return None
+		n, storage = location
+		if not self.exists(n):
+			return None
+		kind = 'lowres' if storage == 'VX-3' else 'mezz'
+		return {
+			'id': f'VX-{file_number}',
+			'path': f'{kind}/{n % 97}/ITEM_{n}.mpg',
+			'uri': f'file:///mnt/{STORAGES[storage]}/{kind}/{n % 97}/ITEM_{n}.mpg',
+			'state': 'UNKNOWN' if storage == 'VX-1' and n % 50 == 0 else 'CLOSED',
+			'size': str(1000000 + n),
+			'timestamp': TIMESTAMP,
+			'refreshFlag': '1',
+			'storage': storage,
+			'item': f'VX-{n}'
+		}
+
+	def storage_files(self, storage_id, states) -> list:
+		# file numbers on a storage in the given states (None for all), cached until something is deleted
+		key = (storage_id, tuple(states) if states else None)
+		with self.lock:
+			listing = self._listings.get(key)
+			if listing is None:
+				base = {'VX-1': LOCAL_FILE, 'VX-2': CLOUD_FILE, 'VX-3': LOWRES_FILE}.get(storage_id)
+				listing = []
+				if base is not None:
+					for n in range(1, self.count + 1):
+						file = self.file(base + n)
+						if file is not None and (not states or file['state'] in states):
+							listing.append(base + n)
+				self._listings[key] = listing
+			return listing
+
+	def delete_file(self, file_number) -> bool:
+		with self.lock:
+			if self.file(file_number) is None:
+				return False
+			self.deleted_files.add(file_number)
+			self._listings.clear()
+			return True
+
+	# deletion locks
+
+	def file_locks(self, file_number) -> list:
+		with self.lock:
+			locks = []
+			location = self._file_location(file_number)
+			if location is not None and location[1] == 'VX-1' and location[0] % 10 == 0:
+				locks.append(f'VX-{LOCK + location[0]}')
+			locks.extend(self.locks.get(file_number, []))
+			return [lock_id for lock_id in locks if lock_id not in self.deleted_locks]
+
+	def add_lock(self, file_number) -> str:
+		lock_id = self.new_id()
+		with self.lock:
+			self.locks.setdefault(file_number, []).append(lock_id)
+		return lock_id
+
+	def delete_lock(self, lock_id) -> bool:
+		with self.lock:
+			n = _number(lock_id)
+			synthetic = n is not None and LOCK < n <= LOCK + self.count and (n - LOCK) % 10 == 0
+			added = any(lock_id in locks for locks in self.locks.values())
+			if lock_id in self.deleted_locks or not (synthetic or added):
+				return False
+			self.deleted_locks.add(lock_id)
+			return True
+
+	# jobs
+
+	def add_job(self, job_type, duration) -> str:
+		job_id = self.new_id()
+		with self.lock:
+			self.jobs[job_id] = {'type': job_type, 'started': time.time(), 'duration': duration, 'data': {}}
+		return job_id
+
+	def job_status(self, job_id):
+		job = self.jobs.get(job_id)
+		if job is None:
+			return None
+		if time.time() - job['started'] < job['duration']:
+			return 'STARTED'
+		return 'FINISHED'
+
+# DOCUMENTS
+# xml built with ElementTree and the vidispine namespace declared on the root, json shaped the way
+# VS shapes it (repeated elements as lists, values as [{"value": ...}])
+
+def element(parent, tag, text=None, **attrs):
+	child = ET.SubElement(parent, tag, attrs)
+	if text is not None:
+		child.text = str(text)
+	return child
+
+def root(tag, **attrs) -> ET.Element:
+	return ET.Element(tag, dict(xmlns=VS_NAMESPACE, **attrs))
+
+def xml_bytes(document) -> bytes:
+	return b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>' + ET.tostring(document, encoding='utf-8')
+
+def wanted_metadata(item, fields):
+	# (system fields, groups) from item, only the named ones if fields is set
+	system = {name: values for name, values in item['fields'].items() if not fields or name in fields}
+	groups = []
+	for group_name, group_fields in item['groups']:
+		kept = {name: values for name, values in group_fields.items() if not fields or name in fields}
+		if kept:
+			groups.append((group_name, kept))
+	return system, groups
+
+def metadata_xml(parent, item, fields):
+	metadata = element(parent, 'metadata')
+	element(metadata, 'revision', 'VX-1')
+	timespan = element(metadata, 'timespan', start='-INF', end='+INF')
+	system, groups = wanted_metadata(item, fields)
+	for name, values in system.items():
+		field_xml(timespan, name, values)
+	for group_name, group_fields in groups:
+		group = element(timespan, 'group')
+		element(group, 'name', group_name)
+		for name, values in group_fields.items():
+			field_xml(group, name, values)
+
+def field_xml(parent, name, values):
+	field = element(parent, 'field')
+	element(field, 'name', name)
+	for value in values:
+		element(field, 'value', value, user='admin', timestamp=TIMESTAMP, change='VX-1')
+
+def metadata_json(item, fields) -> dict:
+	system, groups = wanted_metadata(item, fields)
+	return {'revision': 'VX-1', 'timespan': [{
+		'start': '-INF',
+		'end': '+INF',
+		'field': [field_json(name, values) for name, values in system.items()],
+		'group': [{'name': group_name, 'field': [field_json(name, values) for name, values in group_fields.items()]} for group_name, group_fields in groups]
+	}]}
+
+def field_json(name, values) -> dict:
+	return {'name': name, 'value': [{'value': value, 'user': 'admin', 'timestamp': TIMESTAMP, 'change': 'VX-1'} for value in values]}
+
+def terse_xml(parent, item, fields):
+	system, groups = wanted_metadata(item, fields)
+	for name, values in list(system.items()) + [pair for _, group_fields in groups for pair in group_fields.items()]:
+		for value in values:
+			element(parent, name, value)
+
+def file_xml(parent, file):
+	node = element(parent, 'file')
+	for key in ['id', 'path', 'uri', 'state', 'size', 'timestamp', 'refreshFlag', 'storage']:
+		element(node, key, file[key])
+	element(node, 'metadata')
+	return node
+
+def file_json(file) -> dict:
+	entry = {key: file[key] for key in ['id', 'path', 'state', 'size', 'timestamp', 'refreshFlag', 'storage']}
+	entry['uri'] = [file['uri']]
+	return entry
+
+def shapes_xml(parent, shapes, tag):
+	for shape_id, shape_tag, files in shapes:
+		if tag and shape_tag != tag:
+			continue
+		shape = element(parent, 'shape')
+		element(shape, 'id', shape_id)
+		element(shape, 'tag', shape_tag)
+		container = element(shape, 'containerComponent')
+		element(container, 'id', f'{shape_id}-C')
+		for file in files:
+			file_xml(container, file)
+
+def shapes_json(shapes, tag) -> list:
+	return [{
+		'id': shape_id,
+		'tag': [shape_tag],
+		'containerComponent': {'id': f'{shape_id}-C', 'file': [file_json(file) for file in files]}
+	} for shape_id, shape_tag, files in shapes if not tag or shape_tag == tag]
+
+def parse_metadata_doc(body, content_type):
+	# ({name: [values]}, [(group, {name: [values]})]) out of a MetadataDocument PUT, xml or json
+	fields = {}
+	groups = []
+	if 'json' in content_type:
+		document = json.loads(body)
+		for timespan in document.get('timespan', []):
+			for field in timespan.get('field', []):
+				fields[field['name']] = [value.get('value') for value in field.get('value', [])]
+			for group in timespan.get('group', []):
+				groups.append((group['name'], {field['name']: [value.get('value') for value in field.get('value', [])] for field in group.get('field', [])}))
+		return fields, groups
+	document = strip_ns(ET.fromstring(body))
+	for timespan in document.iter('timespan'):
+		for field in timespan.findall('field'):
+			fields[field.findtext('name')] = [value.text for value in field.findall('value')]
+		for group in timespan.findall('group'):
+			groups.append((group.findtext('name'), {field.findtext('name'): [value.text for value in field.findall('value')] for field in group.findall('field')}))
+	return fields, groups
+
+def parse_search_doc(body) -> list:
+	# [(field, [values])] from an ItemSearchDocument, top level fields and group fields alike
+	criteria = []
+	if not body:
+		return criteria
+	document = strip_ns(ET.fromstring(body))
+	for field in document.iter('field'):
+		values = [value.text for value in field.findall('value')]
+		if field.findtext('name') and values:
+			criteria.append((field.findtext('name'), values))
+	return criteria
+
+def strip_ns(document):
+	for node in document.iter():
+		if node.tag.startswith('{'):
+			node.tag = node.tag.split('}', 1)[1]
+	return document
+
+# CASSETTES
+# a cassette is a json list of {"method", "path", "body_sha1", "status", "content_type", "body"}
+# with body base64 encoded. requests are matched on method, path+query and a hash of the request
+# body. when the same request was recorded more than once the answers are replayed in order and
+# the last one repeats, so polling a job replays its progress
+
+class Cassette:
+
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+		self.interactions = []
+		self._replay = {}
+
+	@staticmethod
+	def key(method, path, body):
+		return method, path, hashlib.sha1(body or b'').hexdigest()
+
+	def load(self):
+		with open(self.path, 'r', encoding='utf-8') as f:
+			self.interactions = json.load(f)
+		for interaction in self.interactions:
+			key = (interaction['method'], interaction['path'], interaction['body_sha1'])
+			self._replay.setdefault(key, []).append(interaction)
+		return self
+
+	def record(self, method, path, body, status, content_type, response_body):
+		if path.startswith('/API/token'):
+			# never keep a real token around
+			response_body = json.dumps({'token': 'recorded-token'}).encode('utf-8')
+		with self.lock:
+			self.interactions.append({
+				'method': method,
+				'path': path,
+				'body_sha1': self.key(method, path, body)[2],
+				'status': status,
+				'content_type': content_type,
+				'body': base64.b64encode(response_body).decode('ascii')
+			})
+
+	def save(self):
+		with self.lock:
+			with open(self.path, 'w', encoding='utf-8') as f:
+				json.dump(self.interactions, f, indent=1)
+
+	def find(self, method, path, body):
+		with self.lock:
+			answers = self._replay.get(self.key(method, path, body))
+			if not answers:
+				return None
+			interaction = answers.pop(0) if len(answers) > 1 else answers[0]
+		return interaction['status'], base64.b64decode(interaction['body']), interaction['content_type']
+
+# SERVER
+
+class Response(Exception):
+	# raised by a route to answer with something other than 200
+	def __init__(self, status, body=b'', content_type='text/plain'):
+		self.status = status
+		self.body = body if isinstance(body, bytes) else str(body).encode('utf-8')
+		self.content_type = content_type
+
+class Handler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+
+	def log_message(self, format, *args):
+		pass
+
+	def do_GET(self):
+		self.handle_request()
+
+	def do_PUT(self):
+		self.handle_request()
+
+	def do_POST(self):
+		self.handle_request()
+
+	def do_DELETE(self):
+		self.handle_request()
+
+	def handle_request(self):
+		fake = self.server.fake
+		length = int(self.headers.get('Content-Length') or 0)
+		body = self.rfile.read(length) if length else b''
+		if fake.latency or fake.jitter:
+			time.sleep(fake.latency + random.uniform(0, fake.jitter))
+		if fake.error_rate and random.random() < fake.error_rate:
+			fake.count('injected_error')
+			return self.send(503, b'injected error', 'text/plain')
+		if fake.mode == 'record':
+			return self.send(*fake.forward(self.command, self.path, self.headers, body))
+		if fake.cassette is not None:
+			answer = fake.cassette.find(self.command, self.path, body)
+			if answer is not None:
+				fake.count('replayed')
+				return self.send(*answer)
+			if fake.strict:
+				return self.send(404, b'not in cassette', 'text/plain')
+		try:
+			status, content_type, response_body = fake.route(self.command, self.path, self.headers, body)
+		except Response as response:
+			status, content_type, response_body = response.status, response.content_type, response.body
+		except Exception as e:
+			status, content_type, response_body = 500, 'text/plain', repr(e).encode('utf-8')
+		self.send(status, response_body, content_type)
+
+	def send(self, status, body, content_type):
+		if 'gzip' in self.headers.get('Accept-Encoding', '') and len(body) > 1024:
+			body = gzip.compress(body, compresslevel=5)
+			encoding = 'gzip'
+		else:
+			encoding = None
+		self.send_response(status)
+		self.send_header('Content-Type', content_type)
+		self.send_header('Content-Length', str(len(body)))
+		if encoding:
+			self.send_header('Content-Encoding', encoding)
+		self.end_headers()
+		if self.command != 'HEAD':
+			self.wfile.write(body)
+
+class FakeVidispine:
+
+	def __init__(self, items=100000, port=0, host='127.0.0.1', latency=0.0, jitter=0.0, error_rate=0.0,
+			job_duration=2.0, mode=None, cassette=None, upstream=None, strict=False, max_page_size=None):
+		# mode None serves the synthetic store, 'replay' answers from cassette first, 'record' proxies to upstream
+		# max_page_size caps number= on the paged listings the way a real VS does, None for no cap
+		self.store = ItemStore(items)
+		self.host = host
+		self.port = port
+		self.latency = latency
+		self.jitter = jitter
+		self.error_rate = error_rate
+		self.job_duration = job_duration
+		self.max_page_size = max_page_size
+		self.mode = mode
+		self.upstream = upstream.rstrip('/') + '/' if upstream else None
+		self.strict = strict
+		self.cassette = None
+		if mode == 'replay':
+			self.cassette = Cassette(cassette).load()
+		elif mode == 'record':
+			if not (cassette and upstream):
+				raise ValueError('record mode needs a cassette path and an upstream VS url')
+			self.cassette = Cassette(cassette)
+		self.stats = {}
+		self._stats_lock = threading.Lock()
+		# tokens that get a 401 from now on, see revoke_token
+		self.revoked_tokens = set()
+		self._httpd = None
+		self._thread = None
+
+	@property
+	def url(self) -> str:
+		return f'http://{self.host}:{self.port}/'
+
+	def start(self):
+		self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+		self._httpd.daemon_threads = True
+		self._httpd.fake = self
+		self.port = self._httpd.server_address[1]
+		self._thread = threading.Thread(target=self._httpd.serve_forever, name='fake-vidispine', daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self):
+		if self._httpd is not None:
+			self._httpd.shutdown()
+			self._httpd.server_close()
+			self._httpd = None
+		if self.mode == 'record':
+			self.cassette.save()
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, *exc):
+		self.stop()
+		return False
+
+	def revoke_token(self, token):
+		# like an admin revoking it on a real VS, every request carrying it gets a 401
+		self.revoked_tokens.add(token)
+
+	def count(self, key):
+		with self._stats_lock:
+			self.stats[key] = self.stats.get(key, 0) + 1
+
+	def forward(self, method, path, headers, body):
+		# record mode, send the request on to the real VS and keep what came back
+		request = urllib.request.Request(self.upstream + path.lstrip('/'), data=body or None, method=method)
+		for name in ['Authorization', 'Accept', 'Content-Type']:
+			if headers.get(name):
+				request.add_header(name, headers[name])
+		try:
+			with urllib.request.urlopen(request, timeout=120) as response:
+				status, content_type, response_body = response.status, response.headers.get('Content-Type', ''), response.read()
+		except urllib.error.HTTPError as e:
+			status, content_type, response_body = e.code, e.headers.get('Content-Type', ''), e.read()
+		self.cassette.record(method, path, body, status, content_type, response_body)
+		self.count('recorded')
+		return status, response_body, content_type
+
+	# routing
+
+	def route(self, method, raw_path, headers, body):
+		# returns (status, content type, body)
+		parts = urlsplit(raw_path)
+		query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+		segments = []
+		matrix = {}
+		for segment in unquote(parts.path).strip('/').split('/'):
+			name, *params = segment.split(';')
+			segments.append(name)
+			for param in params:
+				key, _, value = param.partition('=')
+				matrix[key] = value
+		path = '/'.join(segments)
+		as_json = 'json' in headers.get('Accept', '')
+		if path == 'solr/update':
+			self.count('solr/update')
+			return self.solr_update(body)
+		if not path.startswith('API/'):
+			raise Response(404, 'not found')
+		path = path[4:]
+		template = re.sub(r'VX-\d+', '{id}', path)
+		self.count(f'{method} {template}')
+		if path != 'token' and not headers.get('Authorization'):
+			raise Response(401, 'no authorization')
+		authorization = headers.get('Authorization', '')
+		if authorization.startswith('token ') and authorization[len('token '):] in self.revoked_tokens:
+			self.count('401')
+			raise Response(401, 'token revoked')
+		for pattern, route_method, handler in self.routes():
+			match = re.fullmatch(pattern, path)
+			if match and method == route_method:
+				status, document = handler(*match.groups(), query=query, matrix=matrix, headers=headers, body=body, as_json=as_json)
+				if isinstance(document, (dict, list)):
+					return status, 'application/json', json.dumps(document).encode('utf-8')
+				if isinstance(document, ET.Element):
+					return status, 'application/xml', xml_bytes(document)
+				return status, 'text/plain', (document or '').encode('utf-8')
+		raise Response(404, f'no route for {method} {path}')
+
+	def routes(self):
+		return [
+			(r'token', 'GET', self.get_token),
+			(r'item', 'PUT', self.search_items),
+			(r'item/(VX-\d+)', 'GET', self.get_item),
+			(r'item/(VX-\d+)', 'DELETE', self.delete_item),
+			(r'item/(VX-\d+)/metadata', 'GET', self.get_metadata),
+			(r'item/(VX-\d+)/metadata', 'PUT', self.put_metadata),
+			(r'item/(VX-\d+)/shape', 'GET', self.get_shape_ids),
+			(r'storage', 'GET', self.get_storages),
+			(r'storage/storage-group/([^/]+)', 'GET', self.get_storage_group),
+			(r'storage/(VX-\d+)/file', 'GET', self.get_storage_files),
+			(r'storage/(VX-\d+)/file/(VX-\d+)', 'GET', self.get_file),
+			(r'storage/(VX-\d+)/file/(VX-\d+)/storage/(VX-\d+)', 'POST', self.copy_file),
+			(r'storage/file/(VX-\d+)', 'DELETE', self.delete_file),
+			(r'storage/file/(VX-\d+)/deletion-lock', 'GET', self.get_locks),
+			(r'file/(VX-\d+)/deletion-lock', 'POST', self.add_lock),
+			(r'deletion-lock/(VX-\d+)', 'DELETE', self.delete_lock),
+			(r'job', 'GET', self.get_jobs),
+			(r'job/(VX-\d+)', 'GET', self.get_job),
+			(r'job/(VX-\d+)/step/(\d+)/data', 'PUT', self.put_job_data),
+			(r'configuration/properties/solrpath', 'GET', self.get_solrpath)
+		]
+
+	def _item_number(self, item_id):
+		n = _number(item_id)
+		if not self.store.exists(n):
+			raise Response(404, f'Item {item_id} not found')
+		return n
+
+	def get_token(self, query, headers, **_):
+		if not headers.get('Authorization'):
+			raise Response(401, 'no authorization')
+		return 200, {'token': uuid.uuid4().hex}
+
+	def _item_xml(self, parent, n, content, fields, terse, tag):
+		item = element(parent, 'item', id=f'VX-{n}', start='-INF', end='+INF')
+		self._item_content_xml(item, n, content, fields, terse, tag)
+		return item
+
+	def _item_content_xml(self, node, n, content, fields, terse, tag):
+		if 'metadata' in content:
+			if terse:
+				terse_xml(node, self.store.item(n), fields)
+			else:
+				metadata_xml(node, self.store.item(n), fields)
+		if 'shape' in content:
+			shapes_xml(node, self.store.shapes(n), tag)
+
+	def _item_json(self, n, content, fields, tag) -> dict:
+		# json has no terse form, it always gets the full metadata structure
+		item = {'id': f'VX-{n}', 'start': '-INF', 'end': '+INF'}
+		if 'metadata' in content:
+			item['metadata'] = metadata_json(self.store.item(n), fields)
+		if 'shape' in content:
+			item['shape'] = shapes_json(self.store.shapes(n), tag)
+		return item
+
+	def _page_size(self, matrix):
+		number = int(matrix.get('number', 100))
+		return min(number, self.max_page_size) if self.max_page_size else number
+
+	@staticmethod
+	def _content(query, matrix):
+		content = (query.get('content') or '').split(',')
+		fields = set(filter(None, (query.get('field') or matrix.get('field') or '').split(',')))
+		return content, fields, query.get('terse') == 'true', query.get('tag')
+
+	def search_items(self, query, matrix, body, as_json, **_):
+		first = int(matrix.get('first', 1))
+		number = self._page_size(matrix)
+		matches = self.store.search(parse_search_doc(body))
+		page = matches[max(first - 1, 0):max(first - 1, 0) + number]
+		content, fields, terse, tag = self._content(query, matrix)
+		if as_json:
+			return 200, {'hits': len(matches), 'item': [self._item_json(n, content, fields, tag) for n in page]}
+		document = root('ItemListDocument')
+		element(document, 'hits', len(matches))
+		for n in page:
+			self._item_xml(document, n, content, fields, terse, tag)
+		return 200, document
+
+	def get_item(self, item_id, query, matrix, as_json, **_):
+		n = self._item_number(item_id)
+		content, fields, terse, tag = self._content(query, matrix)
+		if as_json:
+			return 200, self._item_json(n, content, fields, tag)
+		document = root('ItemDocument', id=item_id)
+		self._item_content_xml(document, n, content, fields, terse, tag)
+		return 200, document
+
+	def delete_item(self, item_id, **_):
+		self.store.delete_item(self._item_number(item_id))
+		return 200, ''
+
+	def get_metadata(self, item_id, matrix, as_json, **_):
+		n = self._item_number(item_id)
+		fields = set(filter(None, matrix.get('field', '').split(',')))
+		if as_json:
+			return 200, {'item': [{'id': item_id, 'metadata': metadata_json(self.store.item(n), fields)}]}
+		document = root('MetadataListDocument')
+		item = element(document, 'item', id=item_id)
+		metadata_xml(item, self.store.item(n), fields)
+		return 200, document
+
+	def put_metadata(self, item_id, headers, body, **_):
+		n = self._item_number(item_id)
+		fields, groups = parse_metadata_doc(body, headers.get('Content-Type', ''))
+		self.store.put_metadata(n, fields, groups)
+		document = root('MetadataDocument')
+		element(document, 'revision', 'VX-2')
+		return 200, document
+
+	def get_shape_ids(self, item_id, query, as_json, **_):
+		n = self._item_number(item_id)
+		tag = query.get('tag')
+		shape_ids = [shape_id for shape_id, shape_tag, _ in self.store.shapes(n) if not tag or shape_tag == tag]
+		if as_json:
+			return 200, {'uri': shape_ids} if shape_ids else {}
+		document = root('URIListDocument')
+		for shape_id in shape_ids:
+			element(document, 'uri', shape_id)
+		return 200, document
+
+	def get_storages(self, **_):
+		document = root('StorageListDocument')
+		for storage_id, name in STORAGES.items():
+			storage = element(document, 'storage')
+			element(storage, 'id', storage_id)
+			element(storage, 'state', 'READY')
+			metadata = element(storage, 'metadata')
+			field = element(metadata, 'field')
+			element(field, 'key', 'name')
+			element(field, 'value', name)
+		return 200, document
+
+	def get_storage_group(self, group_name, **_):
+		if group_name not in STORAGE_GROUPS:
+			raise Response(404, f'Storage group {group_name} not found')
+		document = root('StorageGroupDocument')
+		element(document, 'name', group_name)
+		for storage_id in STORAGE_GROUPS[group_name]:
+			storage = element(document, 'storage')
+			element(storage, 'id', storage_id)
+		return 200, document
+
+	def get_storage_files(self, storage_id, query, matrix, **_):
+		if storage_id not in STORAGES:
+			raise Response(404, f'Storage {storage_id} not found')
+		states = [state for state in (query.get('state') or '').split(',') if state]
+		first = int(matrix.get('first', 0))
+		number = self._page_size(matrix)
+		listing = self.store.storage_files(storage_id, states)
+		document = root('FileListDocument')
+		element(document, 'hits', len(listing))
+		for file_number in listing[first:first + number]:
+			file = self.store.file(file_number)
+			if file is not None:
+				file_xml(document, file)
+		return 200, document
+
+	def _file(self, file_id, storage_id=None) -> dict:
+		file = self.store.file(_number(file_id) or 0)
+		if file is None or (storage_id and file['storage'] != storage_id):
+			raise Response(404, f'File {file_id} not found')
+		return file
+
+	def get_file(self, storage_id, file_id, **_):
+		document = root('FileDocument')
+		for key, value in self._file(file_id, storage_id).items():
+			if key != 'item':
+				element(document, key, value)
+		return 200, document
+
+	def copy_file(self, storage_id, file_id, target_storage, **_):
+		self._file(file_id, storage_id)
+		job_id = self.store.add_job('COPY_FILE', self.job_duration)
+		document = root('JobDocument')
+		element(document, 'jobId', job_id)
+		element(document, 'status', 'READY')
+		element(document, 'type', 'COPY_FILE')
+		return 200, document
+
+	def delete_file(self, file_id, **_):
+		if not self.store.delete_file(_number(file_id) or 0):
+			raise Response(404, f'File {file_id} not found')
+		return 200, ''
+
+	def get_locks(self, file_id, **_):
+		self._file(file_id)
+		document = root('DeletionLockListDocument')
+		for lock_id in self.store.file_locks(_number(file_id)):
+			lock = element(document, 'lock')
+			element(lock, 'id', lock_id)
+			element(lock, 'file', file_id)
+			element(lock, 'user', 'admin')
+		return 200, document
+
+	def add_lock(self, file_id, **_):
+		self._file(file_id)
+		document = root('DeletionLockDocument')
+		element(document, 'id', self.store.add_lock(_number(file_id)))
+		return 200, document
+
+	def delete_lock(self, lock_id, **_):
+		if not self.store.delete_lock(lock_id):
+			raise Response(404, f'Deletion lock {lock_id} not found')
+		return 200, ''
+
+	def _job_doc(self, job_id, as_json):
+		status = self.store.job_status(job_id)
+		if status is None:
+			raise Response(404, f'Job {job_id} not found')
+		job = self.store.jobs[job_id]
+		if as_json:
+			return {'jobId': job_id, 'user': 'admin', 'status': status, 'type': job['type'], 'priority': 'MEDIUM'}
+		document = root('JobDocument')
+		for key, value in [('jobId', job_id), ('user', 'admin'), ('status', status), ('type', job['type']), ('priority', 'MEDIUM')]:
+			element(document, key, value)
+		return document
+
+	def get_job(self, job_id, as_json, **_):
+		return 200, self._job_doc(job_id, as_json)
+
+	def get_jobs(self, query, matrix, **_):
+		states = set(filter(None, (query.get('state') or '').split(',')))
+		first = int(matrix.get('first', 0))
+		number = self._page_size(matrix)
+		with self.store.lock:
+			job_ids = list(self.store.jobs)
+		matching = [job_id for job_id in job_ids if not states or self.store.job_status(job_id) in states]
+		document = root('JobListDocument')
+		element(document, 'hits', len(matching))
+		for job_id in matching[first:first + number]:
+			job = self._job_doc(job_id, False)
+			job.attrib.pop('xmlns', None)
+			job.tag = 'job'
+			document.append(job)
+		return 200, document
+
+	def put_job_data(self, job_id, step, body, **_):
+		if self.store.job_status(job_id) is None:
+			raise Response(404, f'Job {job_id} not found')
+		for field in strip_ns(ET.fromstring(body)).iter('field'):
+			self.store.jobs[job_id]['data'][field.findtext('key')] = field.findtext('value')
+		return 200, ''
+
+	def get_solrpath(self, **_):
+		document = root('PropertyDocument')
+		element(document, 'key', 'solrpath')
+		element(document, 'value', f'{self.url}solr')
+		return 200, document
+
+	def solr_update(self, body):
+		# <delete><query>type:File AND entityId:("VX-1" OR "VX-2")</query></delete>, or a single id
+		deleted = 0
+		for query in strip_ns(ET.fromstring(body)).iter('query'):
+			for file_id in re.findall(r'VX-\d+', query.text or ''):
+				deleted += self.store.delete_file(_number(file_id))
+		return 200, 'application/json', json.dumps({'responseHeader': {'status': 0}, 'deleted': deleted}).encode('utf-8')
+
+def main():
+	parser = argparse.ArgumentParser(description='Local stand-in for Vidispine.')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8080)
+	parser.add_argument('--items', type=int, default=100000)
+	parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every request')
+	parser.add_argument('--jitter', type=float, default=0.0, help='up to this many more seconds, at random')
+	parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with a 503')
+	parser.add_argument('--job-duration', type=float, default=2.0, help='seconds before a job reports FINISHED')
+	parser.add_argument('--max-page-size', type=int, help='most results a paged listing returns, whatever number= asks for')
+	parser.add_argument('--record', nargs=2, metavar=('UPSTREAM_URL', 'CASSETTE'))
+	parser.add_argument('--replay', metavar='CASSETTE')
+	parser.add_argument('--strict', action='store_true', help='with --replay, 404 anything not in the cassette')
+	args = parser.parse_args()
+	mode, cassette, upstream = None, None, None
+	if args.record:
+		mode, (upstream, cassette) = 'record', args.record
+	elif args.replay:
+		mode, cassette = 'replay', args.replay
+	server = FakeVidispine(items=args.items, port=args.port, host=args.host, latency=args.latency, jitter=args.jitter,
+		error_rate=args.error_rate, job_duration=args.job_duration, mode=mode, cassette=cassette, upstream=upstream, strict=args.strict,
+		max_page_size=args.max_page_size)
+	server.start()
+	print(f'Fake Vidispine with {args.items} items listening on {server.url}', flush=True)
+	try:
+		while True:
+			time.sleep(3600)
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.stop()
+		print(json.dumps(server.stats, indent=1, sort_keys=True))
+
+if __name__ == '__main__':
+	main()
@@ -96,6 +96,8 @@ def main(vs_token_data):
     rating = 2
     timed_text_message = ''
     fails = []
+    # every update below goes out in one PUT at the end
+    batch = eng_vs_token.MetadataBatch(vs_token_data,item_id)
 
     fields_to_check = {
         'embedded_duration_status': ['embedded_duration_summary', 'Caption Duration.', 5],
@@ -106,15 +108,20 @@ def main(vs_token_data):
         'embedded_missing_status': ['embedded_missing_summary', 'Missing Captions.', 10]
     }
 
-    shift_result = eng_vs_token.get_group_metadata_value(vs_token_data,item_id,f'{subtype}_qc_orig_caption_analysis_embedded_shift_status')
-    shift_summary = eng_vs_token.get_group_metadata_value(vs_token_data,item_id,f'{subtype}_qc_orig_caption_analysis_embedded_shift_summary')
+    # every status/summary field in one round trip
+    shift_drift_fields = [f'{group}_embedded_{check}_{kind}' for check in ['shift','drift'] for kind in ['status','summary']]
+    category_fields = [f'{group}_{field}' for field in fields_to_check] + [f'{group}_{fields_to_check[field][0]}' for field in fields_to_check]
+    values = eng_vs_token.get_metadata_values(vs_token_data,item_id,shift_drift_fields + category_fields)
 
-    drift_result = eng_vs_token.get_group_metadata_value(vs_token_data,item_id,f'{subtype}_qc_orig_caption_analysis_embedded_drift_status')
-    drift_summary = eng_vs_token.get_group_metadata_value(vs_token_data,item_id,f'{subtype}_qc_orig_caption_analysis_embedded_drift_summary')
+    shift_result = values[f'{group}_embedded_shift_status']
+    shift_summary = values[f'{group}_embedded_shift_summary']
+
+    drift_result = values[f'{group}_embedded_drift_status']
+    drift_summary = values[f'{group}_embedded_drift_summary']
 
     for field in fields_to_check:
-        result = eng_vs_token.get_group_metadata_value(vs_token_data,item_id,f'{group}_{field}')
-        summary = eng_vs_token.get_group_metadata_value(vs_token_data,item_id,f'{group}_{fields_to_check[field][0]}')
+        result = values[f'{group}_{field}']
+        summary = values[f'{group}_{fields_to_check[field][0]}']
         if str(result) == 'Pass':
             rating += fields_to_check[field][2]
         elif str(result) == 'Fail':
@@ -127,9 +134,7 @@ def main(vs_token_data):
             timed_text_message += f'{fields_to_check[field][1]} '
             update = {group: {'name': f'{group}_{fields_to_check[field][0]}', 'value': new_summary}}
             logger.warning(update)
-            update_doc = eng_vs_token.make_group_metadata_doc(group, f'{group}_{fields_to_check[field][0]}', new_summary)
-            r = eng_vs_token.put_item_metadata(vs_token_data,item_id,update_doc)
-            logger.warning(f'Update response: {r}')
+            batch.add(group, f'{group}_{fields_to_check[field][0]}', new_summary)
 
     '''
     Leaving this here for posterity:
@@ -158,9 +163,7 @@ def main(vs_token_data):
         timed_text_message += 'Shift. '
         shift_update = {group: {'name': f'{group}_embedded_shift_summary', 'value': new_shift_summary}}
         logger.warning(shift_update)
-        shift_update_doc = eng_vs_token.make_group_metadata_doc(group, f'{group}_embedded_shift_summary', new_shift_summary)
-        r = eng_vs_token.put_item_metadata(vs_token_data,item_id,shift_update_doc)
-        logger.warning(f'Update response: {r}')
+        batch.add(group, f'{group}_embedded_shift_summary', new_shift_summary)
 
     if drift_result == 'Pass':
         rating += 31
@@ -173,9 +176,7 @@ def main(vs_token_data):
         timed_text_message += 'Drift. '
         drift_update = {group: {'name': f'{group}_embedded_drift_summary', 'value': new_drift_summary}}
         logger.warning(drift_update)
-        drift_update_doc = eng_vs_token.make_group_metadata_doc(group, f'{group}_embedded_shift_summary', new_drift_summary)
-        r = eng_vs_token.put_item_metadata(vs_token_data,item_id,drift_update_doc)
-        logger.warning(f'Update response: {r}')
+        batch.add(group, f'{group}_embedded_drift_summary', new_drift_summary)
 
     if shift_result == 'Fail' or drift_result == 'Fail':
         timed_text_result = 'Fail'
@@ -204,21 +205,16 @@ def main(vs_token_data):
 
     rating_update = {group: {'name': f'{group}_embedded_rating', 'value': str(rating)}}
     logger.warning(rating_update)
-    rating_update_doc = eng_vs_token.make_group_metadata_doc(group, f'{group}_embedded_rating', str(rating))
-    r = eng_vs_token.put_item_metadata(vs_token_data,item_id,rating_update_doc)
-    logger.warning(f'Update response: {r}')
+    batch.add(group, f'{group}_embedded_rating', str(rating))
 
     result_update = {f'{subtype}_qc_orig_category_results': {'name': f'{subtype}_qc_orig_category_results_timed_text_result', 'value': timed_text_result}}
     logger.warning(result_update)
-    result_update_doc = eng_vs_token.make_group_metadata_doc(f'{subtype}_qc_orig_category_results', f'{subtype}_qc_orig_category_results_timed_text_result', timed_text_result)
-    r = eng_vs_token.put_item_metadata(vs_token_data,item_id,result_update_doc)
-    logger.warning(f'Update response: {r}')
+    batch.add(f'{subtype}_qc_orig_category_results', f'{subtype}_qc_orig_category_results_timed_text_result', timed_text_result)
 
     message_update = {f'{subtype}_qc_orig_category_results': {'name': f'{subtype}_qc_orig_category_results_timed_text_message', 'value': timed_text_message.strip()}}
     logger.warning(message_update)
-    message_update_doc = eng_vs_token.make_group_metadata_doc(f'{subtype}_qc_orig_category_results', f'{subtype}_qc_orig_category_results_timed_text_message', timed_text_message.strip())
-    r = eng_vs_token.put_item_metadata(vs_token_data,item_id,message_update_doc)
-    logger.warning(f'Update response: {r}')
+    batch.add(f'{subtype}_qc_orig_category_results', f'{subtype}_qc_orig_category_results_timed_text_message', timed_text_message.strip())
+    batch.flush()
 
     exit(0)
 
@@ -119,6 +119,8 @@ logger.info(f'{workflow_name} provided as the target workflow.', extra=extras)
 logger.info(f'manual submit is set to {str(manual_submit)}.', extra=extras)
 if profile_number:
     logger.info(f'{profile_number} provided as audio profile number.', extra=extras)
+# tag the run's trace so it can be found by item in datadog
+cms_integration_logging.tracer.root.set(item_id=item_id, workflow=workflow_name, manual_submit=manual_submit)
 
 # project imports
 import eng_vault_agent # need this for pretty much everything to get auth and ip addresses
@@ -182,14 +184,15 @@ def submit_to_vantage(vs,vs_token_data,bbq_data,vantage):
     md5 = eng_vs_token.get_md5(vs_token_data,item_id)
 
     # check for local shape
+    # one shape fetch answers every shape/storage/file question from here on
+    shape_index = eng_vs_token.ShapeIndex(vs_token_data,item_id)
     shape = workflow['required_shapes'][0]
     logger.warning(f'Checking for {shape} shape presence')
-    # get_shape_ids and get_storage_group return lists
-    shape_id = eng_vs_token.get_shape_ids(vs,vs_token_data['token'],item_id,shape)[0]
+    # shape_ids and get_storage_group return lists
+    shape_id = shape_index.shape_ids(shape)[0]
     logger.warning(f'{shape} shape id {shape_id}')
-    shape_document = eng_vs_token.get_shape_document(vs,vs_token_data['token'],item_id,shape)
     local_storage = eng_vs_token.get_storage_groups(vs_token_data,'local')
-    shape_location = eng_vs_token.current_storage_id(vs_token_data,item_id,local_storage,shape)
+    shape_location = eng_vs_token.current_storage_id(vs_token_data,item_id,local_storage,shape,index=shape_index)
     cloud_storage = eng_vs_token.get_storage_groups(vs_token_data,'cloud')
     library_storage = eng_vs_token.get_storage_groups(vs_token_data,'library')
 
@@ -202,11 +205,11 @@ def submit_to_vantage(vs,vs_token_data,bbq_data,vantage):
             download_location = download_locations[1]
         original_filename = eng_vs_token.get_system_metadata_value(vs_token_data,item_id,'originalFilename')
         try:
-            download_job = eng_vs_token.download_from_s3(vs_token_data, shape_document, download_location, library_storage, item_id, original_filename)
+            download_job = eng_vs_token.download_from_s3(vs_token_data, shape_index, download_location, library_storage, item_id, original_filename)
         except Exception as e:
             logger.error(f'Error downloading from Library {e}')
             try:
-                download_job = eng_vs_token.download_from_s3(vs_token_data, shape_document, download_location, cloud_storage, item_id, original_filename)
+                download_job = eng_vs_token.download_from_s3(vs_token_data, shape_index, download_location, cloud_storage, item_id, original_filename)
             except Exception as e:
                 logger.error(f'Error downloading from Cloud {e}')
                 exit(1)
@@ -240,10 +243,9 @@ def submit_to_vantage(vs,vs_token_data,bbq_data,vantage):
 
 
     for index, shape in enumerate(workflow['required_shapes']):
-        shape_id = eng_vs_token.get_shape_ids(vs,vs_token_data['token'],item_id,shape)[0]
-        shape_document = eng_vs_token.get_shape_document(vs,vs_token_data['token'],item_id,shape)
-        shape_location = eng_vs_token.current_storage_id(vs_token_data,item_id,local_storage,shape)
-        file_uri = shape_document.find(f'shape/*[1]/file[storage="{shape_location}"]/uri').text
+        shape_id = shape_index.shape_ids(shape)[0]
+        shape_location = eng_vs_token.current_storage_id(vs_token_data,item_id,local_storage,shape,index=shape_index)
+        file_uri = shape_index.file(shape,shape_location)['uri']
         windows_path = file_uri.replace('file:///mnt/','').split('/')
         if windows_path[0].lower() == 'xdrive':
             windows_path[0] = '\\\\vc67.vcnyc.indemand.net\\vodstorage'
@@ -251,19 +253,21 @@ def submit_to_vantage(vs,vs_token_data,bbq_data,vantage):
         elif windows_path[0].lower() == 'mezz':
             windows_path[0] = 'M:'
             windows_path = '\\'.join(windows_path)
-        shapes[index] = {'name':shape,'shape_id':shape_id,'shape_document':shape_document,'current_storage':shape_location,'windows_path':unquote(windows_path)}
+        shapes[index] = {'name':shape,'shape_id':shape_id,'current_storage':shape_location,'windows_path':unquote(windows_path)}
         logger.warning(f'Windows path {windows_path}')
         logger.warning(f'Shapes {shapes}')
 
     extracted_audio_shape_presence = eng_vs_token.shape_presence(vs_token_data,item_id,'extracted_audio')
-    s3_copy_presence = eng_vs_token.storage_presence(vs_token_data,item_id,cloud_storage)
+    s3_copy_presence = eng_vs_token.storage_presence(vs_token_data,item_id,cloud_storage,index=shape_index)
     wid = profiles[workflow_name]['wid']
 
     looking_for = shapes[0]['current_storage']
-    file_uri = shapes[0]['shape_document'].find(f'shape/*[1]/file[storage="{looking_for}"]/uri').text
-    file_id = shapes[0]['shape_document'].find(f'shape/*[1]/file[storage="{looking_for}"]/id').text
+    local_file = shape_index.file(shapes[0]['name'],looking_for)
+    file_uri = local_file['uri']
+    file_id = local_file['id']
 
-    job_inputs = json.loads(requests.get(f'{vantage}REST/Workflows/{wid}/JobInputs',verify=False).content)
+    with cms_integration_logging.span('vantage job inputs', workflow_id=wid):
+        job_inputs = json.loads(requests.get(f'{vantage}REST/Workflows/{wid}/JobInputs',verify=False).content)
 
     # implement new versions doc
     versions = 'M:\\ADMIN\\Vantage\\Vantage_Version_Attachment\\master_vantage_versions.xml'
@@ -319,7 +323,8 @@ def submit_to_vantage(vs,vs_token_data,bbq_data,vantage):
         logger.warning('Unable to fill job inputs')
         logger.warning(e)
 
-    r = requests.post(f'{vantage}REST/Workflows/{wid}/Submit',headers={'content-type':'application/json'},data=json.dumps(job_inputs),verify=False)
+    with cms_integration_logging.span('vantage submit', workflow_id=wid):
+        r = requests.post(f'{vantage}REST/Workflows/{wid}/Submit',headers={'content-type':'application/json'},data=json.dumps(job_inputs),verify=False)
     results = json.loads(r.content)
     if results['JobIdentifier'] == "00000000-0000-0000-0000-000000000000":
         logger.warning(f'SDK Error {item_id}')
@@ -335,7 +340,8 @@ if __name__ == "__main__":
     # get_vault_secret_data function returns a dict
     # vidispine
     vidi_path = f'v1/secret/{env}/vidispine/vantage'
-    vs_secret_data = eng_vault_agent.get_secret(vidi_path)
+    with cms_integration_logging.span('vault get_secret', path=vidi_path):
+        vs_secret_data = eng_vault_agent.get_secret(vidi_path)
     vs_username = vs_secret_data["username"]
     vs_password = vs_secret_data["password"]
     vs = vs_secret_data["api_url"]
@@ -349,14 +355,16 @@ if __name__ == "__main__":
     # bbq
     bbq_data = {}
     bbq_path = f'v1/secret/{env}/bbq/vantage'
-    bbq_secret_data = eng_vault_agent.get_secret(bbq_path)
+    with cms_integration_logging.span('vault get_secret', path=bbq_path):
+        bbq_secret_data = eng_vault_agent.get_secret(bbq_path)
     bbq_data['host'] = bbq_secret_data['host']
     bbq_data['protocol'] = bbq_secret_data['protocol']
     bbq_data['token'] = bbq_secret_data['token']
 
     # vantage
     vantage_path = f'v1/secret/{env}/vantage/vantage'
-    vantage = eng_vault_agent.get_secret(vantage_path)['api_url']
+    with cms_integration_logging.span('vault get_secret', path=vantage_path):
+        vantage = eng_vault_agent.get_secret(vantage_path)['api_url']
 
     # here we go
     s = submit_to_vantage(vs,vs_token_data,bbq_data,vantage)
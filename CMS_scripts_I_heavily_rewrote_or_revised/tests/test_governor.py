@@ -0,0 +1,109 @@
+import time
+import asyncio
+import threading
+from unittest import mock
+
+from vs_fixture import FakeVSTestCase, eng_vs_token
+
+try:
+	import eng_vs_token_async
+except ImportError:
+	eng_vs_token_async = None
+
+class GovernorTests(FakeVSTestCase):
+
+	def setUp(self):
+		super().setUp()
+		eng_vs_token.governor_limit = 1
+		eng_vs_token.governor_bulk_limit = 1
+		self.api_url = f'{self.vs}API/item/VX-1/metadata'
+
+	def test_only_vs_api_calls_take_a_slot(self):
+		held = eng_vs_token.try_governor_slot(self.vs)
+		self.assertIsNotNone(held)
+		try:
+			started = time.perf_counter()
+			# solr lives on its own host and path, it doesn't queue behind VS
+			with eng_vs_token.governor_slot('http://solr.local:8983/solr/vidispine/update?commit=true'):
+				pass
+			self.assertLess(time.perf_counter() - started, 0.05)
+			entered = threading.Event()
+
+			def take_slot():
+				with eng_vs_token.governor_slot(self.api_url):
+					entered.set()
+
+			waiter = threading.Thread(target=take_slot)
+			waiter.start()
+			self.assertFalse(entered.wait(0.2))
+		finally:
+			eng_vs_token.release_governor_slot(held)
+		self.assertTrue(entered.wait(2))
+		waiter.join()
+
+	def test_only_vs_sessions_use_the_crt_file_context(self):
+		self.assertIsInstance(eng_vs_token.get_session(self.api_url).get_adapter(self.api_url), eng_vs_token.VSAdapter)
+		# solr keeps requests' default ca bundle
+		solr = 'https://solr.local:8983/solr/vidispine/update?commit=true'
+		self.assertNotIsInstance(eng_vs_token.get_session(solr).get_adapter(solr), eng_vs_token.VSAdapter)
+
+	def test_streamed_responses_keep_the_slot_until_closed(self):
+		headers = {'Authorization': f'token {self.token_data["token"]}'}
+		response = eng_vs_token.vs_request('GET', self.api_url, headers=headers, stream=True)
+		# the body hasn't been read yet, so VS is still working for us
+		self.assertIsNone(eng_vs_token.try_governor_slot(self.vs))
+		response.close()
+		response.close()
+		slot = eng_vs_token.try_governor_slot(self.vs)
+		self.assertIsNotNone(slot)
+		eng_vs_token.release_governor_slot(slot)
+
+	def test_bulk_checks_reuse_a_recent_waiting_count(self):
+		eng_vs_token.governor_poll = 0.2
+		with mock.patch.object(eng_vs_token, 'waiting_count', wraps=eng_vs_token.waiting_count) as waiting_count:
+			for _ in range(20):
+				eng_vs_token.release_governor_slot(eng_vs_token.try_governor_slot(self.vs, 'bulk'))
+			self.assertEqual(waiting_count.call_count, 1)
+			time.sleep(eng_vs_token.governor_poll)
+			eng_vs_token.release_governor_slot(eng_vs_token.try_governor_slot(self.vs, 'bulk'))
+			self.assertEqual(waiting_count.call_count, 2)
+
+	def test_bulk_stands_back_for_a_waiting_interactive_caller(self):
+		with eng_vs_token.governor_waiter(self.vs, 'interactive'):
+			self.assertIsNone(eng_vs_token.try_governor_slot(self.vs, 'bulk'))
+		eng_vs_token._waiting_counts.clear()
+		slot = eng_vs_token.try_governor_slot(self.vs, 'bulk')
+		self.assertIsNotNone(slot)
+		eng_vs_token.release_governor_slot(slot)
+
+	def test_async_requests_share_the_slots(self):
+		if eng_vs_token_async is None:
+			self.skipTest('aiohttp is not installed')
+		headers = {'Authorization': f'token {self.token_data["token"]}'}
+		eng_vs_token.single_flight = False
+
+		async def fan_out():
+			try:
+				responses = await asyncio.gather(*[eng_vs_token_async.vs_request('GET', f'{self.vs}API/item/VX-{n}/metadata', headers=headers) for n in range(1, 9)])
+				return [response.status_code for response in responses]
+			finally:
+				await eng_vs_token_async.close_session()
+
+		file_io_threads = set()
+
+		def on_thread(func):
+			def wrapper(*args, **kwargs):
+				file_io_threads.add(threading.current_thread())
+				return func(*args, **kwargs)
+			return wrapper
+
+		with mock.patch.object(eng_vs_token, '_try_lock', on_thread(eng_vs_token._try_lock)), \
+			mock.patch.object(eng_vs_token, '_unlock', on_thread(eng_vs_token._unlock)):
+			self.assertEqual(asyncio.run(fan_out()), [200] * 8)
+		# the lock files were all handled on executor threads, never on the loop's
+		self.assertTrue(file_io_threads)
+		self.assertNotIn(threading.current_thread(), file_io_threads)
+		# every one of them got the single slot in turn, and gave it back
+		slot = eng_vs_token.try_governor_slot(self.vs)
+		self.assertIsNotNone(slot)
+		eng_vs_token.release_governor_slot(slot)
@@ -0,0 +1,13 @@
+import time
+
+from vs_fixture import FakeVSTestCase, eng_vs_token
+
+class WaitForJobTests(FakeVSTestCase):
+
+	def test_finished_job_noticed_within_the_old_interval(self):
+		job_id = self.server.store.add_job('COPY_FILE', 7)
+		started = time.monotonic()
+		status = eng_vs_token.wait_for_job(self.token_data, job_id, timeout=30)
+		self.assertEqual(status, 'FINISHED')
+		# checks at 0, 2, 6 and 11s with the backoff capped at 5s. uncapped the fourth check is at 14s
+		self.assertLess(time.monotonic() - started, 12.5)
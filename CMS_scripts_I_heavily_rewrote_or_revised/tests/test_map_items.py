@@ -0,0 +1,34 @@
+from vs_fixture import FakeVSTestCase, eng_vs_token
+
+class MapItemsTests(FakeVSTestCase):
+
+	def filename(self, item_id):
+		return eng_vs_token.get_system_metadata_value(self.token_data, item_id, 'originalFilename')
+
+	def test_results_in_order_with_errors_kept(self):
+		item_ids = ['VX-3', 'VX-1', 'VX-bad', 'VX-2']
+		results = eng_vs_token.map_items(self.filename, item_ids, concurrency=3, progress=None)
+		self.assertEqual([result.item_id for result in results], item_ids)
+		self.assertEqual([result.ok for result in results], [True, True, False, True])
+		self.assertTrue(results[1].value.startswith('ITEM_1_'))
+
+	def test_nested_map_items_keep_the_outer_sessions(self):
+		session = eng_vs_token.get_session(self.vs)
+
+		def outer(item_id):
+			inner = eng_vs_token.map_items(self.filename, [item_id] * 4, concurrency=4, progress=None)
+			return all(result.ok for result in inner)
+
+		item_ids = [f'VX-{n}' for n in range(1, 21)]
+		results = eng_vs_token.map_items(outer, item_ids, concurrency=eng_vs_token.pool_size + 5, progress=None)
+		self.assertTrue(all(result.ok and result.value for result in results))
+		# no resize, so the session every worker was sharing was never closed out from under them
+		self.assertIs(eng_vs_token.get_session(self.vs), session)
+
+	def test_exit_in_a_helper_only_fails_its_item(self):
+		# get_shape_document exit(1)s when VS can't find the item
+		token = self.token_data['token']
+		results = eng_vs_token.map_items(lambda item_id: eng_vs_token.get_shape_document(self.vs, token, item_id, 'original'),
+			['VX-1', 'VX-99999', 'VX-2'], concurrency=3, progress=None)
+		self.assertEqual([result.ok for result in results], [True, False, True])
+		self.assertIsInstance(results[1].error, SystemExit)
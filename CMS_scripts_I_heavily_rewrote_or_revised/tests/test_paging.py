@@ -0,0 +1,37 @@
+from vs_fixture import FakeVSTestCase, eng_vs_token
+
+STORAGE = 'VX-1'
+
+class StoragePagingTests(FakeVSTestCase):
+	items = 300
+
+	def expected_ids(self, file_state=None):
+		# one unpaged listing straight off the fake server to compare against
+		headers = {'Authorization': f'token {self.token_data["token"]}'}
+		query = f'?state={file_state}' if file_state else ''
+		response = eng_vs_token.vs_request('GET', f'{self.vs}API/storage/{STORAGE}/file;first=0;number=100000{query}', headers=headers)
+		return [file.find('id').text for file in eng_vs_token.xml_prep(response).findall('file')]
+
+	def scanned_ids(self, **kwargs):
+		return [file['id'] for file in eng_vs_token.iter_storage_files(self.token_data, STORAGE, **kwargs)]
+
+	def test_every_file_once_in_order(self):
+		expected = self.expected_ids()
+		self.assertGreater(len(expected), 100)
+		self.assertEqual(self.scanned_ids(number=40, prefetch=3), expected)
+
+	def test_state_filter(self):
+		expected = self.expected_ids('CLOSED')
+		self.assertTrue(expected)
+		self.assertEqual(self.scanned_ids(file_state='CLOSED', number=25), expected)
+
+	def test_capped_pages_step_by_the_served_size(self):
+		expected = self.expected_ids()
+		self.server.max_page_size = 30
+		try:
+			self.assertEqual(self.scanned_ids(number=100, prefetch=2), expected)
+		finally:
+			self.server.max_page_size = None
+
+	def test_empty_listing(self):
+		self.assertEqual(self.scanned_ids(file_state='NO_SUCH_STATE'), [])
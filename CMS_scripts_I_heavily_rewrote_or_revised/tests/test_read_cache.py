@@ -0,0 +1,24 @@
+from vs_fixture import FakeVSTestCase, eng_vs_token
+
+class ReadCacheTests(FakeVSTestCase):
+
+	def setUp(self):
+		super().setUp()
+		eng_vs_token.cache_ttl = 30
+
+	def test_shape_document_hits_are_their_own_tree(self):
+		token = self.token_data['token']
+		first = eng_vs_token.get_shape_document(self.vs, token, 'VX-1', 'original')
+		for element in list(first):
+			first.remove(element)
+		second = eng_vs_token.get_shape_document(self.vs, token, 'VX-1', 'original')
+		self.assertTrue(len(second))
+		self.assertIsNot(second, eng_vs_token.get_shape_document(self.vs, token, 'VX-1', 'original'))
+
+	def test_shape_index_hits_are_their_own_index(self):
+		first = eng_vs_token.get_shape_index(self.token_data, 'VX-1')
+		storages = first.storages()
+		self.assertTrue(storages)
+		first.shapes.clear()
+		self.assertEqual(eng_vs_token.get_shape_index(self.token_data, 'VX-1').storages(), storages)
+		self.assertEqual(eng_vs_token.get_shape_indexes(self.token_data, ['VX-1'])['VX-1'].storages(), storages)
@@ -0,0 +1,93 @@
+import time
+from unittest import mock
+
+import requests
+
+from vs_fixture import FakeVSTestCase, eng_vs_token
+
+class BreakerTests(FakeVSTestCase):
+
+	def setUp(self):
+		super().setUp()
+		eng_vs_token.max_retries = 0
+		eng_vs_token.breaker_failure_threshold = 3
+		eng_vs_token.breaker_reset_seconds = 0.3
+		self.url = f'{self.vs}API/item/VX-1/metadata'
+		self.headers = {'Authorization': f'token {self.token_data["token"]}'}
+		self.breaker = eng_vs_token.get_breaker(self.url)
+
+	def get(self):
+		return eng_vs_token.vs_request('GET', self.url, headers=self.headers)
+
+	def trip(self):
+		self.server.error_rate = 1.0
+		for _ in range(eng_vs_token.breaker_failure_threshold):
+			self.assertEqual(self.get().status_code, 503)
+		self.server.error_rate = 0.0
+
+	def test_opens_after_threshold_and_fails_fast(self):
+		self.trip()
+		self.assertIsNotNone(self.breaker.opened_at)
+		sent = self.served('injected_error') + self.served('GET item/{id}/metadata')
+		with self.assertRaises(eng_vs_token.CircuitOpenError):
+			self.get()
+		self.assertEqual(self.served('injected_error') + self.served('GET item/{id}/metadata'), sent)
+
+	def test_half_open_trial_success_closes(self):
+		self.trip()
+		time.sleep(eng_vs_token.breaker_reset_seconds)
+		self.assertEqual(self.get().status_code, 200)
+		self.assertIsNone(self.breaker.opened_at)
+		self.assertEqual(self.breaker.failures, 0)
+
+	def test_half_open_trial_failure_reopens(self):
+		self.trip()
+		time.sleep(eng_vs_token.breaker_reset_seconds)
+		self.server.error_rate = 1.0
+		self.assertEqual(self.get().status_code, 503)
+		self.server.error_rate = 0.0
+		self.assertFalse(self.breaker.trial_running)
+		with self.assertRaises(eng_vs_token.CircuitOpenError):
+			self.get()
+
+	def test_half_open_trial_other_exceptions_settle_the_trial(self):
+		for error, still_open in [(requests.exceptions.ChunkedEncodingError('cut off'), True), (KeyboardInterrupt(), True)]:
+			self.trip()
+			time.sleep(eng_vs_token.breaker_reset_seconds)
+			session = eng_vs_token.get_session(self.url)
+			with mock.patch.object(session, 'request', side_effect=error):
+				with self.assertRaises(type(error)):
+					self.get()
+			self.assertFalse(self.breaker.trial_running)
+			self.assertEqual(self.breaker.opened_at is not None, still_open)
+			# the next trial gets through and closes it
+			time.sleep(eng_vs_token.breaker_reset_seconds)
+			self.assertEqual(self.get().status_code, 200)
+			self.assertIsNone(self.breaker.opened_at)
+
+class RetryTests(FakeVSTestCase):
+
+	def setUp(self):
+		super().setUp()
+		eng_vs_token.max_retries = 2
+		eng_vs_token.breaker_failure_threshold = 100
+		self.headers = {'Authorization': f'token {self.token_data["token"]}'}
+
+	def test_metadata_put_is_retried(self):
+		self.server.error_rate = 1.0
+		response = eng_vs_token.vs_request('PUT', f'{self.vs}API/item/VX-1/metadata', headers=self.headers, data='{}')
+		self.assertEqual(response.status_code, 503)
+		self.assertEqual(self.served('injected_error'), 3)
+
+	def test_job_data_put_is_not_retried(self):
+		self.server.error_rate = 1.0
+		response = eng_vs_token.vs_request('PUT', f'{self.vs}API/job/VX-1/step/0/data', headers=self.headers, data='x')
+		self.assertEqual(response.status_code, 503)
+		self.assertEqual(self.served('injected_error'), 1)
+
+	def test_idempotent_endpoints(self):
+		self.assertTrue(eng_vs_token.is_idempotent('PUT', f'{self.vs}API/item;first=1;number=100'))
+		self.assertTrue(eng_vs_token.is_idempotent('PUT', f'{self.vs}API/item/VX-9/metadata'))
+		self.assertFalse(eng_vs_token.is_idempotent('PUT', f'{self.vs}API/job/VX-9/step/0/data'))
+		self.assertFalse(eng_vs_token.is_idempotent('POST', f'{self.vs}API/storage/VX-1/file/VX-2/storage/VX-3'))
+		self.assertTrue(eng_vs_token.is_idempotent('GET', f'{self.vs}API/job/VX-9'))
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from vs_fixture import FakeVSTestCase, eng_vs_token
+
+try:
+	import eng_vs_token_async
+except ImportError:
+	eng_vs_token_async = None
+
+class SingleFlightTests(FakeVSTestCase):
+	# enough latency that every caller is in before the first response comes back
+	server_options = {'latency': 0.3}
+
+	def setUp(self):
+		super().setUp()
+		self.url = f'{self.vs}API/item/VX-7/metadata'
+		self.headers = {'Authorization': f'token {self.token_data["token"]}'}
+
+	def fan_out(self, callers=8):
+		start = threading.Barrier(callers)
+
+		def get(_):
+			start.wait()
+			return eng_vs_token.vs_request('GET', self.url, headers=self.headers)
+
+		with ThreadPoolExecutor(callers) as executor:
+			return list(executor.map(get, range(callers)))
+
+	def test_identical_gets_share_one_request(self):
+		responses = self.fan_out()
+		self.assertEqual(self.served('GET item/{id}/metadata'), 1)
+		self.assertEqual({response.status_code for response in responses}, {200})
+		self.assertEqual(len({response.content for response in responses}), 1)
+
+	def test_off_sends_every_request(self):
+		eng_vs_token.single_flight = False
+		self.fan_out()
+		self.assertEqual(self.served('GET item/{id}/metadata'), 8)
+
+	def test_different_headers_dont_share(self):
+		other = dict(self.headers, Accept='application/json')
+		with ThreadPoolExecutor(2) as executor:
+			list(executor.map(lambda headers: eng_vs_token.vs_request('GET', self.url, headers=headers), [self.headers, other]))
+		self.assertEqual(self.served('GET item/{id}/metadata'), 2)
+
+	def test_async_flights_stay_on_their_own_loop(self):
+		if eng_vs_token_async is None:
+			self.skipTest('aiohttp is not installed')
+		start = threading.Barrier(2)
+
+		async def fan_out():
+			try:
+				responses = await asyncio.gather(*[eng_vs_token_async.vs_request('GET', self.url, headers=self.headers) for _ in range(4)])
+				return [response.status_code for response in responses]
+			finally:
+				await eng_vs_token_async.close_session()
+
+		def run_loop(_):
+			start.wait()
+			return asyncio.run(fan_out())
+
+		# two loops on two threads asking for the same url at the same time
+		with ThreadPoolExecutor(2) as executor:
+			results = list(executor.map(run_loop, range(2)))
+		self.assertEqual(results, [[200] * 4, [200] * 4])
+		# one request per loop, the four callers on each loop share theirs
+		self.assertEqual(self.served('GET item/{id}/metadata'), 2)
@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from vs_fixture import FakeVSTestCase, BASIC_AUTH, eng_vs_token
+
+class TokenTests(FakeVSTestCase):
+
+	def test_private_tokens_by_default(self):
+		other = eng_vs_token.get_token_no_auto_refresh(self.vs, BASIC_AUTH, 60)
+		self.assertNotEqual(other['token'], self.token_data['token'])
+
+	def test_shared_token_reused_across_managers(self):
+		eng_vs_token.share_tokens = True
+		first = eng_vs_token.get_token_no_auto_refresh(self.vs, BASIC_AUTH, 60)
+		# a second process is a second manager reading the same file
+		second = eng_vs_token.TokenManager(self.vs, BASIC_AUTH).get(min_remaining=60)
+		self.assertEqual(first['token'], second['token'])
+
+	def test_revoked_shared_token_is_replaced(self):
+		eng_vs_token.share_tokens = True
+		token_data = eng_vs_token.get_token_no_auto_refresh(self.vs, BASIC_AUTH, 60)
+		revoked = token_data['token']
+		self.server.revoke_token(revoked)
+		value = eng_vs_token.get_system_metadata_value(token_data, 'VX-1', 'originalFilename')
+		self.assertTrue(value.startswith('ITEM_1_'))
+		# the dict callers hold is updated in place, and the file no longer hands out the revoked one
+		self.assertNotEqual(token_data['token'], revoked)
+		self.assertEqual(eng_vs_token.TokenManager(self.vs, BASIC_AUTH).get(min_remaining=60)['token'], token_data['token'])
+		self.assertEqual(self.served('401'), 1)
+
+	def test_concurrent_401s_mint_one_replacement(self):
+		eng_vs_token.share_tokens = True
+		eng_vs_token.single_flight = False
+		token_data = eng_vs_token.get_token_no_auto_refresh(self.vs, BASIC_AUTH, 60)
+		minted = self.served('GET token')
+		self.server.revoke_token(token_data['token'])
+		with ThreadPoolExecutor(8) as executor:
+			statuses = list(executor.map(
+				lambda n: eng_vs_token.vs_request('GET', f'{self.vs}API/item/VX-{n}/metadata', headers={'Authorization': f'token {token_data["token"]}'}).status_code,
+				range(1, 9)))
+		self.assertEqual(statuses, [200] * 8)
+		self.assertEqual(self.served('GET token') - minted, 1)
+
+	def test_401_on_private_token_is_returned(self):
+		self.server.revoke_token(self.token_data['token'])
+		response = eng_vs_token.vs_request('GET', f'{self.vs}API/item/VX-1/metadata', headers={'Authorization': f'token {self.token_data["token"]}'})
+		self.assertEqual(response.status_code, 401)
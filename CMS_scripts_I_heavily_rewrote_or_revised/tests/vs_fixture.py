@@ -0,0 +1,79 @@
+# shared setup for the eng_vs_token tests
+# eng_vs_token imports crt_file and logger from main, so they're put there before it's imported.
+# every test class gets its own fake_vidispine server, and every test starts with the module's
+# caches, breakers, shared tokens and settings back to how they were
+#   cd CMS_scripts_I_heavily_rewrote_or_revised && python3 -m unittest discover -s tests
+
+import os
+import sys
+import logging
+import tempfile
+import unittest
+import __main__
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if not hasattr(__main__, 'logger'):
+	__main__.logger = logging.getLogger('eng_vs_token_tests')
+	# quiet unless a test runner sets up logging itself
+	__main__.logger.addHandler(logging.NullHandler())
+if not hasattr(__main__, 'crt_file'):
+	__main__.crt_file = None
+
+import eng_vs_token
+import fake_vidispine
+
+# module level settings a test may change, put back after every test
+SETTINGS = [
+	'disk_cache_dir', 'share_tokens', 'single_flight', 'governor_limit', 'governor_bulk_limit', 'governor_poll',
+	'max_retries', 'retry_base_delay', 'retry_max_delay', 'retry_budget_minimum',
+	'breaker_failure_threshold', 'breaker_reset_seconds', 'storage_page_size', 'cache_ttl'
+]
+
+BASIC_AUTH = eng_vs_token.get_basic_auth('admin', 'admin')
+
+class FakeVSTestCase(unittest.TestCase):
+	items = 50
+	server_options = {}
+
+	@classmethod
+	def setUpClass(cls):
+		cls.server = fake_vidispine.FakeVidispine(items=cls.items, **cls.server_options).start()
+		cls.vs = cls.server.url
+
+	@classmethod
+	def tearDownClass(cls):
+		cls.server.stop()
+
+	def setUp(self):
+		self.saved_settings = {name: getattr(eng_vs_token, name) for name in SETTINGS}
+		self.temp_dir = tempfile.TemporaryDirectory()
+		eng_vs_token.disk_cache_dir = self.temp_dir.name
+		# no real waiting between retries in tests
+		eng_vs_token.retry_base_delay = 0.01
+		eng_vs_token.retry_max_delay = 0.05
+		self.reset_state()
+		self.server.revoked_tokens.clear()
+		self.server.error_rate = 0.0
+		with self.server._stats_lock:
+			self.server.stats.clear()
+		self.token_data = eng_vs_token.get_token_no_auto_refresh(self.vs, BASIC_AUTH, 60)
+
+	def tearDown(self):
+		for name, value in self.saved_settings.items():
+			setattr(eng_vs_token, name, value)
+		self.reset_state()
+		self.temp_dir.cleanup()
+
+	@staticmethod
+	def reset_state():
+		eng_vs_token.clear_cache()
+		eng_vs_token._breakers.clear()
+		eng_vs_token._policy_counts.update(requests=0, retries=0)
+		eng_vs_token._token_managers.clear()
+		eng_vs_token._storage_topology.clear()
+		eng_vs_token._waiting_counts.clear()
+
+	def served(self, key) -> int:
+		# how many requests the fake server saw for 'GET item/{id}/metadata' etc
+		with self.server._stats_lock:
+			return self.server.stats.get(key, 0)
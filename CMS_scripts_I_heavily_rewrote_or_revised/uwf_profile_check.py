@@ -381,33 +381,20 @@ def main():
         },
     }
 
-    # put the metadata in its place
+    # put the metadata in its place, all in one PUT
+    batch = eng_vs_token.MetadataBatch(token_data,item_id)
     for update in metadata_updates:
-        vs_group = metadata_updates[update]['group']
-        vs_field = metadata_updates[update]['field']
-        vs_value = metadata_updates[update]['value']
-        metadata = eng_vs_token.make_group_metadata_doc(vs_group,vs_field,vs_value)
-        u = eng_vs_token.put_item_metadata(token_data,item_id,metadata)
-
-        logger.warning(f'Metadata update: group {vs_group}, field {vs_field}, value {vs_value}')
-        logger.warning(f'Update status code: {u}')
+        batch.add(metadata_updates[update]['group'],metadata_updates[update]['field'],metadata_updates[update]['value'])
 
     if int(uwf_profile) in uwf.exceptions.keys():
-        vs_group, vs_field, vs_value = 'file_information', 'file_information_onboard_exception', 'True'
-        metadata = eng_vs_token.make_group_metadata_doc(vs_group,vs_field,vs_value)
-        u = eng_vs_token.put_item_metadata(token_data,item_id,metadata)
-
-        logger.warning(f'Metadata update: group {vs_group}, field {vs_field}, value {vs_value}')
-        logger.warning(f'Update status code: {u}')
+        vs_group, vs_value = 'file_information', 'True'
+        batch.add(vs_group,'file_information_onboard_exception',vs_value)
 
         profile = uwf.exceptions[int(uwf_profile)]
         for field in profile['exception_fields']:
-            vs_field = f'file_information_exception_{field}'    # group and value stay the same
-            metadata = eng_vs_token.make_group_metadata_doc(vs_group,vs_field,vs_value)
-            u = eng_vs_token.put_item_metadata(token_data,item_id,metadata)
+            batch.add(vs_group,f'file_information_exception_{field}',vs_value)    # group and value stay the same
 
-            logger.warning(f'Metadata update: group {vs_group}, field {vs_field}, value {vs_value}')
-            logger.warning(f'Update status code: {u}')
+    batch.flush()
 
 try:
 	main()
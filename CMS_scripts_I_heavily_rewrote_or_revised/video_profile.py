@@ -115,16 +115,28 @@ if not token_data:
 subtype = eng_vs_token.get_group_metadata_value(token_data,item_id,'file_information_subtype')
 subtype = 'mezz' if 'mezz' in subtype.lower() else 'deriv'
 
-framescan_results = eng_vs_token.get_group_metadata_value(token_data,item_id,f'{subtype}_qc_orig_category_results_framescan')
-
-height = eng_vs_token.get_system_metadata_value(token_data,item_id,'originalHeight')
-width = eng_vs_token.get_system_metadata_value(token_data,item_id,'originalWidth')
-framerate = str(round(float(eng_vs_token.get_group_metadata_value(token_data,item_id,f'original_shape_mi_framerate')),2))
+# everything else in one round trip
+values = eng_vs_token.get_metadata_values(token_data,item_id,[
+    f'{subtype}_qc_orig_category_results_framescan',
+    'originalHeight',
+    'originalWidth',
+    'original_shape_mi_framerate',
+    f'{subtype}_qc_orig_header_info_video_scan',
+    f'{subtype}_qc_orig_scan_analysis_type',
+    'original_shape_mi_video_codec',
+    'file_information_exception_framesize'
+])
+
+framescan_results = values[f'{subtype}_qc_orig_category_results_framescan']
+
+height = values['originalHeight']
+width = values['originalWidth']
+framerate = str(round(float(values['original_shape_mi_framerate']),2))
 
 logger.warning(f'height: {height}, width: {width}, framerate: {framerate}')
 
 if 'pass' in framescan_results.lower():
-    scan_type = eng_vs_token.get_group_metadata_value(token_data,item_id,f'{subtype}_qc_orig_header_info_video_scan').lower()
+    scan_type = values[f'{subtype}_qc_orig_header_info_video_scan'].lower()
     if 'interlaced' in scan_type:
         scan_split = scan_type.split(' ')
         scan_type = scan_split[0]
@@ -132,7 +144,7 @@ if 'pass' in framescan_results.lower():
     else:
         field_dominance = False
 else:
-    scan_type = eng_vs_token.get_group_metadata_value(token_data,item_id,f'{subtype}_qc_orig_scan_analysis_type').lower()
+    scan_type = values[f'{subtype}_qc_orig_scan_analysis_type'].lower()
     if 'interlaced' in scan_type:
         scan_type, field_dominance = scan_type.split(',')
         scan_type = scan_type.strip()
@@ -144,14 +156,14 @@ logger.warning(f'field dominance: {field_dominance}, scan type: {scan_type}')
 profile = determine_profile(height,width,framerate,scan_type,field_dominance,video_profiles)
 
 if profile == 23:
-    codec = eng_vs_token.get_group_metadata_value(token_data,item_id,f'original_shape_mi_video_codec')
+    codec = values['original_shape_mi_video_codec']
     if 'mxf' in codec.lower():
         profile = 23
     else:
         profile = 0
 
 if profile == 30:
-    exception = eng_vs_token.get_group_metadata_value(token_data,item_id,f'file_information_exception_framesize')
+    exception = values['file_information_exception_framesize']
     if exception == 'True':
         profile = 30
     else:
@@ -196,14 +208,9 @@ updates = {
         }
 }
 
+batch = eng_vs_token.MetadataBatch(token_data,item_id)
 for update in updates:
-    vs_group = updates[update]['group']
-    vs_field = updates[update]['field']
-    vs_value = updates[update]['value']
-    metadata = eng_vs_token.make_group_metadata_doc(vs_group,vs_field,vs_value)
-    u = eng_vs_token.put_item_metadata(token_data,item_id,metadata)
-
-    logger.warning(f'Metadata update: group {vs_group}, field {vs_field}, value {vs_value}')
-    logger.warning(f'Update status code: {u}')
+    batch.add(updates[update]['group'],updates[update]['field'],updates[update]['value'])
+batch.flush()
 
 exit(0)
\ No newline at end of file
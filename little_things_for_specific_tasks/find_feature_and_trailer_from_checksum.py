@@ -70,6 +70,17 @@ logging.basicConfig(filename=log_file,
                     level=logging.DEBUG,
                     format='%(asctime)s %(levelname)s: %(message)s')
 
+# custom support packages (eng_vs_token) live in the scripts/packages/ directory
+# eng_vs_token imports crt_file and logger from main, so both have to exist before the import
+if 'linux' in sys.platform or 'darwin' in sys.platform:
+    packages_path = script_path[:script_path.rfind('/scripts/')]+'/packages/'
+else:
+    packages_path = script_path[:script_path.rfind('\\scripts\\')]+'\\packages\\'
+sys.path.insert(0,packages_path)
+crt_file = packages_path + 'DigiCertCA.crt'
+logger = logging.getLogger(script_file_name_no_extention)
+import eng_vs_token
+
 # functions
 def xml_prep(res):
     '''prepare a VS xml for parsing with ET'''
@@ -116,32 +127,45 @@ def get_item_from_checksum(vs,vs_auth,checksum):
         return item_id[0]
     return False
 
+# fields the family scan needs on every indab hit, pulled inline with the search results
+FAMILY_FIELDS = [
+    'file_information_subtype_descriptor',
+    'file_information_is_trailer',
+    'media_management_corrupt',
+    'original_shape_mi_original_shape_mi_md5_hash',
+    'originalFilename'
+]
+
 def item_search(vs,vs_auth,data):
     '''search VS for items with metadata values matching the search doc'''
-    url = vs+'API/item'
     headers = {
         'Accept': 'application/xml',
         'Content-type': 'application/xml',
         'Authorization': vs_auth
     }
-    response = requests.put(url, headers=headers, data=data)
-    item_list_doc = xml_prep(response)
-    hits = int(item_list_doc.find('hits').text)
     number = 1000
     first = 1
+    hits = 1
     item_list = []
     while hits >= first:
         url = f'{vs}API/item;first={str(first)};number={str(number)}'
         response = requests.put(url, headers=headers, data=data)
         items = xml_prep(response)
+        # the first page tells us how many pages there are, no separate unpaged search for it
+        hits = int(items.find('hits').text)
         for item in items.findall('item'):
-            item_id = item.attrib['id']
-            item_list.append(item_id)
+            item_list.append(item.attrib['id'])
         first += number
     if not item_list:
         return False
     return item_list
 
+def family_search(vs_token_data,indab_master_id):
+    '''every item with this indab master ID as {item_id: {field: value or False}},
+    with FAMILY_FIELDS projected into the search results instead of a GET per hit per field'''
+    data = build_search_doc('indab','indab_master_id',indab_master_id)
+    return eng_vs_token.search_item_values(vs_token_data,data,FAMILY_FIELDS)
+
 def get_system_metadata_value(vs,vs_auth,item_id,field):
     '''get metadata value for system-level fields'''
     url = f'{vs}API/item/{item_id}/metadata;field={field}'
@@ -190,53 +214,58 @@ def get_shape_file(vs, vs_auth, item_id):
     shape_file = response.find('shape/containerComponent/file')
     return shape_file
 
+def in_house_and_not_corrupt(vs,vs_auth,item,values):
+    '''corrupt flag comes from the search, only qualified candidates get a shape GET'''
+    corrupt = values['media_management_corrupt']
+    if corrupt and corrupt.lower() == 'true':
+        return False
+    return get_shape_file(vs, vs_auth, item) is not None
+
 def compile_feature_candidate_list(vs,vs_auth,indab_items):
-    '''parse list of items to find HD 15.0 features'''
+    '''parse {item: values} from the family search to find HD 15.0 features'''
     candidate_list = []
-    for item in indab_items:
+    for item, values in indab_items.items():
         # subtype/trailer check
-        subtype = get_group_metadata_value(vs,vs_auth,item,'file_information_subtype_descriptor')
-        is_trailer = get_group_metadata_value(vs,vs_auth,item,'file_information_is_trailer')
+        subtype = values['file_information_subtype_descriptor']
+        is_trailer = values['file_information_is_trailer']
         if subtype and "CL_HD_MP2_15000" in subtype and is_trailer in ('false', 'False', False):
             # in house/corrupt check
-            corrupt = get_group_metadata_value(vs,vs_auth,item,'media_management_corrupt')
-            shape_presence = get_shape_file(vs, vs_auth, item)
-            if (corrupt and corrupt.lower() == 'true') or shape_presence is None:
+            if not in_house_and_not_corrupt(vs,vs_auth,item,values):
                 continue
             print(f'Item {item} is a qualified CL_HD_MP2_15000 derivative.')
             candidate_list.append(item)
     return candidate_list
 
 def compile_trailer_candidate_list(vs,vs_auth,indab_items):
-    '''parse list of items to find HD 15.0 trailers, or SD if no HD trailers exist'''
-    trailer_candidates = []
-    for item in indab_items:
+    '''parse {item: values} to find HD 15.0 trailers, or SD if no HD trailers exist'''
+    hd_trailers = []
+    sd_trailers = []
+    # one pass over the hits, the SD list is only used if there are no HD trailers
+    for item, values in indab_items.items():
         # subtype/trailer check
-        is_trailer = get_group_metadata_value(vs,vs_auth,item,'file_information_is_trailer')
-        subtype = get_group_metadata_value(vs,vs_auth,item,'file_information_subtype_descriptor')
-        if subtype and "CL_HD_MP2_15000" in subtype and is_trailer.lower() == 'true':
+        is_trailer = values['file_information_is_trailer']
+        subtype = values['file_information_subtype_descriptor']
+        if not subtype or not is_trailer or is_trailer.lower() != 'true':
+            continue
+        if "CL_HD_MP2_15000" in subtype:
+            hd_trailers.append(item)
+        elif subtype == "CL_SD_MP2_03750_DD20":
+            sd_trailers.append(item)
+    trailer_candidates = []
+    for item in hd_trailers:
+        # in house/corrupt check
+        if not in_house_and_not_corrupt(vs,vs_auth,item,indab_items[item]):
+            continue
+        print(f'Trailer {item} is a qualified HD derivative.')
+        trailer_candidates.append(item)
+    if len(trailer_candidates) == 0:
+        print('No HD trailers found; looking for SD trailers.')
+        for item in sd_trailers:
             # in house/corrupt check
-            corrupt = get_group_metadata_value(vs,vs_auth,item,'media_management_corrupt')
-            shape_presence = get_shape_file(vs, vs_auth, item)
-            if (corrupt and corrupt.lower() == 'true') or shape_presence is None:
+            if not in_house_and_not_corrupt(vs,vs_auth,item,indab_items[item]):
                 continue
-            print(f'Trailer {item} is a qualified HD derivative.')
+            print(f'Trailer {item} is a qualified SD derivative.')
             trailer_candidates.append(item)
-    if len(trailer_candidates) == 0:
-        print('No HD trailers found; looking for SD trailers.')
-        for item in indab_items:
-            # subtype/trailer check
-            is_trailer = get_group_metadata_value(vs,vs_auth,item,'file_information_is_trailer')
-            subtype = get_group_metadata_value(vs,vs_auth,item,
-                                               'file_information_subtype_descriptor')
-            if subtype and subtype == "CL_SD_MP2_03750_DD20" and is_trailer.lower() == 'true':
-                # in house/corrupt check
-                corrupt = get_group_metadata_value(vs,vs_auth,item,'media_management_corrupt')
-                shape_presence = get_shape_file(vs, vs_auth, item)
-                if (corrupt and corrupt.lower() == 'true') or shape_presence is None:
-                    continue
-                print(f'Trailer {item} is a qualified SD derivative.')
-                trailer_candidates.append(item)
     return trailer_candidates
 
 def main():
@@ -245,6 +274,7 @@ def main():
     logging.info('%s: COMMENCING: %s executed by %s', environment, script_file_name, user)
     proxy_config = ET.parse(proxy_config_file)
     vs,vs_auth = get_variables_from_config(environment, proxy_config)
+    vs_token_data = eng_vs_token.get_auto_refresh_token(vs,vs_auth,600)
     resultsfile = open('checksum_replacement_check2.csv', 'w+', encoding='utf-8')
     resultsfile.write('Old MD5,Feature ID,Feature MD5,Filename,Trailer ID,Trailer MD5,Filename\r')
 
@@ -254,6 +284,10 @@ def main():
     for checksum in checksum_list:
         checksum = checksum.strip()
         print(f'Old Checksum: {checksum}')
+        # everything below is per checksum, nothing carries over from the last one
+        # the family search results are empty when there's no master ID
+        indab_items = {}
+        feature_md5 = feature_filename = trailer_md5 = trailer_filename = 'N/A'
 
         # get item ID from checksum
         # N/A if not found
@@ -271,9 +305,8 @@ def main():
             print(f'Indab master ID: {indab_master_id}')
 
             # search for all items with Indab master ID
-            data = build_search_doc('indab','indab_master_id',indab_master_id)
-            indab_items = item_search(vs,vs_auth,data)
-            # no need to check indab_items for empty list; it'll always have at least one ID in it
+            indab_items = family_search(vs_token_data,indab_master_id)
+            # no need to check indab_items for empty dict; it'll always have at least one ID in it
 
         # if no Indab master ID, use the item ID we just found
         if not indab_master_id or indab_master_id == '0':
@@ -290,10 +323,15 @@ def main():
 
         # get feature checksum (and filename just to be sure)
         if max(feature_candidates) != 'N/A':
-            feature_md5 = get_group_metadata_value(vs,vs_auth,max(feature_candidates),
-                                                   'original_shape_mi_original_shape_mi_md5_hash')
-            feature_filename = get_system_metadata_value(vs,vs_auth,max(feature_candidates),
-                                                        'originalFilename')
+            if max(feature_candidates) in indab_items:
+                feature_values = indab_items[max(feature_candidates)]
+                feature_md5 = feature_values['original_shape_mi_original_shape_mi_md5_hash']
+                feature_filename = feature_values['originalFilename']
+            else:
+                feature_md5 = get_group_metadata_value(vs,vs_auth,max(feature_candidates),
+                                                       'original_shape_mi_original_shape_mi_md5_hash')
+                feature_filename = get_system_metadata_value(vs,vs_auth,max(feature_candidates),
+                                                            'originalFilename')
             print(f'{feature_filename}\n{feature_md5}\n')
 
         # find HD or SD trailer from search
@@ -306,10 +344,9 @@ def main():
 
         # get trailer checksum / filename
         if max(trailer_candidates) != 'N/A':
-            trailer_md5 = get_group_metadata_value(vs,vs_auth,max(trailer_candidates),
-                                                   'original_shape_mi_original_shape_mi_md5_hash')
-            trailer_filename = get_system_metadata_value(vs,vs_auth,max(trailer_candidates),
-                                                        'originalFilename')
+            trailer_values = indab_items[max(trailer_candidates)]
+            trailer_md5 = trailer_values['original_shape_mi_original_shape_mi_md5_hash']
+            trailer_filename = trailer_values['originalFilename']
             print(f'{trailer_filename}\n{trailer_md5}\n')
 
         # write results to file
@@ -63,6 +63,17 @@ logging.basicConfig(filename=log_file,
                     level=logging.DEBUG,
                     format='%(asctime)s %(levelname)s: %(message)s')
 
+# custom support packages (eng_vs_token) live in the scripts/packages/ directory
+# eng_vs_token imports crt_file and logger from main, so both have to exist before the import
+if 'linux' in sys.platform or 'darwin' in sys.platform:
+    packages_path = script_path[:script_path.rfind('/scripts/')]+'/packages/'
+else:
+    packages_path = script_path[:script_path.rfind('\\scripts\\')]+'\\packages\\'
+sys.path.insert(0,packages_path)
+crt_file = packages_path + 'DigiCertCA.crt'
+logger = logging.getLogger(script_file_name_no_extention)
+import eng_vs_token
+
 # functions
 def xml_prep(res):
     '''prepare a VS xml for parsing with ET'''
@@ -100,46 +111,20 @@ def build_search_doc(group,field,value):
     '''
     return data
 
-def item_search(vs,vs_auth,data):
-    '''search VS for items with metadata values matching the search doc'''
-    url = vs+'API/item'
-    headers = {
-        'Accept': 'application/xml',
-        'Content-type': 'application/xml',
-        'Authorization': vs_auth
-    }
-    response = requests.put(url, headers=headers, data=data)
-    item_list_doc = xml_prep(response)
-    hits = int(item_list_doc.find('hits').text)
-    number = 1000
-    first = 1
-    item_list = []
-    while hits >= first:
-        url = f'{vs}API/item;first={str(first)};number={str(number)}'
-        response = requests.put(url, headers=headers, data=data)
-        items = xml_prep(response)
-        for item in items.findall('item'):
-            item_id = item.attrib['id']
-            item_list.append(item_id)
-        first += number
-    if not item_list:
-        return False
-    return item_list
-
-def get_system_metadata_value(vs,vs_auth,item_id,field):
-    '''get metadata value for system-level fields'''
-    url = f'{vs}API/item/{item_id}/metadata;field={field}'
-    headers = {
-        'Accept': 'application/xml',
-        'Authorization': vs_auth
-    }
-    response = xml_prep(requests.get(url, headers=headers))
-    try:
-        metadata_value = response.find('item/metadata/timespan/field/value').text
-        return metadata_value
-    except AttributeError:
-        # doesn't have the field
-        return False
+# fields the family scan needs on every indab hit, pulled inline with the search results
+FAMILY_FIELDS = [
+    'file_information_subtype_descriptor',
+    'file_information_is_trailer',
+    'media_management_corrupt',
+    'original_shape_mi_original_shape_mi_md5_hash',
+    'originalFilename'
+]
+
+def family_search(vs_token_data,indab_master_id):
+    '''every item with this indab master ID as {item_id: {field: value or False}},
+    with FAMILY_FIELDS projected into the search results instead of a GET per hit per field'''
+    data = build_search_doc('indab','indab_master_id',indab_master_id)
+    return eng_vs_token.search_item_values(vs_token_data,data,FAMILY_FIELDS)
 
 def get_group_metadata_value(vs,vs_auth,item_id,field):
     '''get metadata value for grouped fields'''
@@ -175,17 +160,18 @@ def get_shape_file(vs, vs_auth, item_id):
     return shape_file
 
 def compile_candidate_list(vs,vs_auth,indab_items):
-    '''parse list of items to find HD 15.0 features'''
+    '''parse {item: values} from the family search to find HD 15.0 features'''
     candidate_list = []
-    for item in indab_items:
+    for item, values in indab_items.items():
         # subtype/trailer check
-        subtype = get_group_metadata_value(vs,vs_auth,item,'file_information_subtype_descriptor')
-        is_trailer = get_group_metadata_value(vs,vs_auth,item,'file_information_is_trailer')
+        subtype = values['file_information_subtype_descriptor']
+        is_trailer = values['file_information_is_trailer']
         if subtype and "HD Mezz" in subtype and is_trailer in ('false', 'False', False):
-            # in house/corrupt check
-            corrupt = get_group_metadata_value(vs,vs_auth,item,'media_management_corrupt')
-            shape_presence = get_shape_file(vs, vs_auth, item)
-            if (corrupt and corrupt.lower() == 'true') or shape_presence is None:
+            # in house/corrupt check, only qualified candidates get a shape GET
+            corrupt = values['media_management_corrupt']
+            if corrupt and corrupt.lower() == 'true':
+                continue
+            if get_shape_file(vs, vs_auth, item) is None:
                 continue
             print(f'Item {item} is a qualified HD Mezzanine feature.')
             candidate_list.append(item)
@@ -197,6 +183,7 @@ def main(environ,proxy_config_path,script_file):
     logging.info('%s: COMMENCING: %s executed by %s', environ, script_file, user)
     proxy_config = ET.parse(proxy_config_path)
     vs,vs_auth = get_variables_from_config(environ, proxy_config)
+    vs_token_data = eng_vs_token.get_auto_refresh_token(vs,vs_auth,600)
     resultsfile = open('mezz_check.csv', 'w+', encoding='utf-8')
     resultsfile.write('Trailer ID,Feature ID,Feature Checksum,Feature Filename\r')
     with open('item_list.txt', 'r', encoding='utf-8') as f:
@@ -210,19 +197,17 @@ def main(environ,proxy_config_path,script_file):
             print('No Indab master ID found.\n')
             continue
         print(f'Indab master ID: {indab_master_id}')
-        data = build_search_doc('indab','indab_master_id',indab_master_id)
-        indab_items = item_search(vs,vs_auth,data)
-        # no need to check for empty list; it's always going to have at least the trailer ID in it
+        indab_items = family_search(vs_token_data,indab_master_id)
+        # no need to check for empty dict; it's always going to have at least the trailer ID in it
         candidate_list = compile_candidate_list(vs,vs_auth,indab_items)
         if len(candidate_list) == 0:
             print(f'No HD features found for trailer item {item}.\n')
             continue
         print(f'{len(candidate_list)} eligible mezz feature(s) found for trailer item {item}.')
         print(f'Feature ID: {max(candidate_list)}.')
-        feature_checksum = get_group_metadata_value(vs,vs_auth,max(candidate_list),
-                                                    'original_shape_mi_original_shape_mi_md5_hash')
-        feature_filename = get_system_metadata_value(vs,vs_auth,max(candidate_list),
-                                                     'originalFilename')
+        feature_values = indab_items[max(candidate_list)]
+        feature_checksum = feature_values['original_shape_mi_original_shape_mi_md5_hash']
+        feature_filename = feature_values['originalFilename']
         print(f'{feature_filename}\n{feature_checksum}\n')
         resultsfile.write(f'{item},{max(candidate_list)},{feature_checksum},{feature_filename}\r')
     print('Done.')
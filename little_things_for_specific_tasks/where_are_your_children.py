@@ -64,6 +64,17 @@ if not os.path.exists(log_file):
 
 logging.basicConfig(filename=log_file, level=logging.DEBUG, format='%(asctime)s %(levelname)s: %(message)s')
 
+# custom support packages (eng_vs_token) live in the scripts/packages/ directory
+# eng_vs_token imports crt_file and logger from main, so both have to exist before the import
+if 'linux' in sys.platform or 'darwin' in sys.platform:
+	packages_path = script_path[:script_path.rfind('/scripts/')]+'/packages/'
+else:
+	packages_path = script_path[:script_path.rfind('\\scripts\\')]+'\\packages\\'
+sys.path.insert(0,packages_path)
+crt_file = packages_path + 'DigiCertCA.crt'
+logger = logging.getLogger(script_file_name_no_extention)
+import eng_vs_token
+
 # functions
 
 def xml_prep(res):
@@ -85,7 +96,18 @@ def get_variables_from_config(environment,proxy_config):
 			break
 	return vs,vs_auth
 
-def search_for_spock(vs,vs_auth,group,field,value):
+# fields the family scan needs on every indab hit, pulled inline with the search results
+family_fields = [
+	'file_information_subtype_descriptor',
+	'file_information_is_trailer',
+	'media_management_corrupt',
+	'original_shape_mi_original_shape_mi_md5_hash',
+	'originalFilename'
+]
+
+def search_for_spock(vs_token_data,group,field,value):
+	# {item_id: {field: value or False}} for every hit, with family_fields projected into the search
+	# results so the scan below doesn't need a GET per hit per field
 	data = f'''
     <ItemSearchDocument xmlns="http://xml.vidispine.com/schema/vidispine">
         <intervals>generic</intervals>
@@ -98,44 +120,7 @@ def search_for_spock(vs,vs_auth,group,field,value):
             </group>
     </ItemSearchDocument>
     '''
-	url = vs+'API/item'
-	headers = {
-		'Accept': 'application/xml',
-		'Content-type': 'application/xml',
-		'Authorization': vs_auth
-	}
-	response = requests.request("PUT", url, headers=headers, data=data)
-	item_list_doc = xml_prep(response)
-	hits = int(item_list_doc.find('hits').text)
-	number = 1000
-	first = 1
-	item_list = []
-	while hits >= first:
-		url = vs+'API/item;first=%s;number=%s' %(str(first),str(number))
-		response = requests.request("PUT", url, headers=headers, data=data)
-		items = xml_prep(response)
-		for item in items.findall('item'):
-			item_id = item.attrib['id']
-			item_list.append(item_id)
-		first = first + number
-	if item_list == []:
-		return False
-	return item_list
-
-def get_system_metadata_value(vs,vs_auth,item_id,field):
-	# for ungrouped fields
-	url = f'{vs}API/item/{item_id}/metadata;field={field}'
-	headers = {
-		'Accept': 'application/xml',
-		'Authorization': vs_auth
-	}
-	response = xml_prep(requests.get(url, headers=headers))
-	try:
-		metadata_value = response.find('item/metadata/timespan/field/value').text
-		return metadata_value
-	except AttributeError:
-		# doesn't have the field
-		return False
+	return eng_vs_token.search_item_values(vs_token_data,data,family_fields)
 
 def get_group_metadata_value(vs,vs_auth,item_id,field):
 	# for fields in groups
@@ -175,6 +160,7 @@ def main(environment,proxy_config_file,script_file_name):
 	logging.info(f'{environment}: COMMENCING: {script_file_name} executed by {user}')
 	proxy_config = ET.parse(proxy_config_file)
 	vs,vs_auth = get_variables_from_config(environment,proxy_config)
+	vs_token_data = eng_vs_token.get_auto_refresh_token(vs,vs_auth,600)
 	resultsfile = open("children_check.csv", "w+")
 	resultsfile.write('Item ID,Child ID,Child Checksum,Child Filename\r')
 	item_list = open('potentialParents.txt', 'r')
@@ -188,16 +174,16 @@ def main(environment,proxy_config_file,script_file_name):
 			print(f'No Indab master ID found.')
 		else:
 			print(f'Indab master ID: {indab_master_id}')
-			indab_master_list = search_for_spock(vs,vs_auth,'indab','indab_master_id',indab_master_id)
+			indab_master_list = search_for_spock(vs_token_data,'indab','indab_master_id',indab_master_id)
 			child_list = []
-			for x in indab_master_list:
-				# subtype/trailer check
-				subtype = get_group_metadata_value(vs,vs_auth,x,'file_information_subtype_descriptor')
+			for x, values in indab_master_list.items():
+				# subtype/trailer check, straight from the search results
+				subtype = values['file_information_subtype_descriptor']
 				if subtype and "CL_HD_MP2_15000" in subtype:
-					child_trailer = get_group_metadata_value(vs,vs_auth,x,'file_information_is_trailer')
+					child_trailer = values['file_information_is_trailer']
 					if child_trailer == parent_trailer:
 						# in house/corrupt check
-						corrupt = get_group_metadata_value(vs,vs_auth,x,'media_management_corrupt')
+						corrupt = values['media_management_corrupt']
 						if corrupt and corrupt.lower() == 'true':
 							print(f'Item {x} is corrupt.')
 						else:
@@ -213,8 +199,8 @@ def main(environment,proxy_config_file,script_file_name):
 				print(f'{len(child_list)} eligible HD children found for item {item}.')
 				print(f'We are going with {max(child_list)}.')
 				child = max(child_list)
-				child_checksum = get_group_metadata_value(vs,vs_auth,child,'original_shape_mi_original_shape_mi_md5_hash')
-				child_filename = get_system_metadata_value(vs,vs_auth,child,'originalFilename')
+				child_checksum = indab_master_list[child]['original_shape_mi_original_shape_mi_md5_hash']
+				child_filename = indab_master_list[child]['originalFilename']
 				print(f'{child_filename}\n{child_checksum}\n')
 				resultsfile.write(f'{item},{child},{child_checksum},{child_filename}\r')			
 	print('Done.')